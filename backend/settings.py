@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'greenhouse_management.instrumentation.RequestStatsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -81,8 +82,12 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': os.environ.get('DATABASE_ENGINE', 'django.db.backends.sqlite3'),
+        'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+        'USER': os.environ.get('DATABASE_USER', ''),
+        'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+        'HOST': os.environ.get('DATABASE_HOST', ''),
+        'PORT': os.environ.get('DATABASE_PORT', ''),
     }
 }
 
@@ -94,9 +99,50 @@ GRAPHENE = {
     "SCHEMA": "schema.schema",
     "MIDDLEWARE": [
         "graphql_jwt.middleware.JSONWebTokenMiddleware",
+        "greenhouse_management.instrumentation.ResolverTimingMiddleware",
     ],
 }
 
+# Per request SQL and resolver stats, reported in the GraphQL response 'extensions' when enabled
+GRAPHQL_STATS_EXTENSION = os.environ.get('GRAPHQL_STATS_EXTENSION', str(DEBUG)) == 'True'
+GRAPHQL_STATS_WINDOW = int(os.environ.get('GRAPHQL_STATS_WINDOW', '1000'))
+
+# Deprecated 'environments' queries without 'first' and 'after' answer with an error instead of more readings than this.
+ENVIRONMENTS_UNPAGINATED_LIMIT = int(os.environ.get('ENVIRONMENTS_UNPAGINATED_LIMIT', '10000'))
+
+# Background jobs: files written by export jobs, and how long a running job may go without a progress report
+# before another worker takes it over.
+JOBS_ROOT = Path(os.environ.get('JOBS_ROOT', BASE_DIR / 'jobs'))
+JOB_LOCK_TIMEOUT = int(os.environ.get('JOB_LOCK_TIMEOUT_SECONDS', '300'))
+# Largest request body saved to JOBS_ROOT for a background ingest, larger ones are refused.
+INGEST_BACKGROUND_MAX_SIZE = int(float(os.environ.get('INGEST_BACKGROUND_MAX_MB', '512')) * 1024 * 1024)
+
+# Raw readings older than this many days are pruned, unless a greenhouse sets its own raw_retention_days.
+# Empty keeps them forever. The run_jobs worker queues a prune job every ENVIRONMENT_PRUNE_INTERVAL hours.
+ENVIRONMENT_RETENTION_DAYS = int(os.environ['ENVIRONMENT_RETENTION_DAYS']) if os.environ.get('ENVIRONMENT_RETENTION_DAYS') else None
+ENVIRONMENT_PRUNE_INTERVAL = timedelta(hours=float(os.environ.get('ENVIRONMENT_PRUNE_INTERVAL_HOURS', '24')))
+
+# Whole months of raw readings older than this many days are moved to compressed files in ARCHIVE_ROOT,
+# read back transparently by the environment queries. Empty keeps everything in the database.
+ENVIRONMENT_ARCHIVE_AFTER_DAYS = int(os.environ['ENVIRONMENT_ARCHIVE_AFTER_DAYS']) if os.environ.get('ENVIRONMENT_ARCHIVE_AFTER_DAYS') else None
+ENVIRONMENT_ARCHIVE_INTERVAL = timedelta(hours=float(os.environ.get('ENVIRONMENT_ARCHIVE_INTERVAL_HOURS', '24')))
+ARCHIVE_ROOT = Path(os.environ.get('ARCHIVE_ROOT', BASE_DIR / 'archive'))
+# Decoded archives kept in memory by every process, each takes about 0.5 kB per reading:
+# 20 MB for a greenhouse-month of one reading per minute. 0 decodes them on every read.
+ARCHIVE_CACHE_SIZE = int(os.environ.get('ARCHIVE_CACHE_SIZE', '4'))
+
+# With INGEST_BUFFER_SIZE set, single createEnvironment readings are acknowledged once buffered in the process
+# and stored in batches of that many readings, or INGEST_BUFFER_INTERVAL_MS after the first one.
+# INGEST_BUFFER_JOURNAL is a directory shared by the processes, each appends its readings to its own file in it
+# first; the files of crashed processes are replayed by the next process started.
+# While the readings can not be stored, at most INGEST_BUFFER_LIMIT are buffered and further ones are refused,
+# 10 batches when empty and no limit with 0.
+INGEST_BUFFER_SIZE = int(os.environ.get('INGEST_BUFFER_SIZE', '0'))
+INGEST_BUFFER_INTERVAL = timedelta(milliseconds=float(os.environ.get('INGEST_BUFFER_INTERVAL_MS', '1000')))
+INGEST_BUFFER_JOURNAL = Path(os.environ['INGEST_BUFFER_JOURNAL']) if os.environ.get('INGEST_BUFFER_JOURNAL') else None
+INGEST_BUFFER_FSYNC = os.environ.get('INGEST_BUFFER_FSYNC', 'False') == 'True'
+INGEST_BUFFER_LIMIT = int(os.environ['INGEST_BUFFER_LIMIT']) if os.environ.get('INGEST_BUFFER_LIMIT') else None
+
 AUTHENTICATION_BACKENDS = [
     "graphql_jwt.backends.JSONWebTokenBackend",
     "django.contrib.auth.backends.ModelBackend",
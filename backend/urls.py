@@ -18,12 +18,19 @@ from django.contrib import admin
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
 
-from graphene_django.views import GraphQLView
-
+from greenhouse_management.instrumentation import InstrumentedGraphQLView
+from greenhouse_management.views import (
+    environment_export, environment_ingest, environment_series_view, job_file, metrics_view,
+)
 from schema import schema
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql/", csrf_exempt(GraphQLView.as_view(graphiql=True, schema= schema))),
+    path("graphql/", csrf_exempt(InstrumentedGraphQLView.as_view(graphiql=True, schema= schema))),
+    path("ingest/environments/", environment_ingest),
+    path("series/environments/", environment_series_view),
+    path("export/environments/", environment_export),
+    path("jobs/<int:id>/file/", job_file, name="job_file"),
+    path("metrics", metrics_view),
 ]
@@ -0,0 +1,109 @@
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from django.test import Client
+from graphql_jwt.shortcuts import get_token
+
+from greenhouse_management.ingest import INGEST_BATCH_SIZE, ingest_environments
+from greenhouse_management.models import CustomUser, Device, Environment, GreenHouse, Location
+
+BENCHMARK_USERS = int(os.environ.get("BENCHMARK_USERS", "10"))
+BENCHMARK_GREENHOUSES = int(os.environ.get("BENCHMARK_GREENHOUSES", "50"))
+BENCHMARK_DEVICES = int(os.environ.get("BENCHMARK_DEVICES", "5"))
+BENCHMARK_READINGS = int(os.environ.get("BENCHMARK_READINGS", "50000"))
+READING_INTERVAL = timedelta(minutes=5)
+SEED_START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def reading(green_house_id, date):
+    return {
+        "greenhouse": green_house_id,
+        "date": date,
+        "temperature": round(random.uniform(10, 30), 2),
+        "air_humidity": round(random.uniform(40, 90), 2),
+        "light_level": round(random.uniform(0, 900), 2),
+        "par": round(random.uniform(0, 900), 2),
+        "co2_level": round(random.uniform(300, 900), 2),
+        "soil_moisture_level": round(random.uniform(20, 60), 2),
+        "soil_salinity": round(random.uniform(1, 4), 2),
+        "soil_temperature": round(random.uniform(10, 25), 2),
+        "weight_of_soil_and_plants": round(random.uniform(1000, 2000), 2),
+        "stem_micro_variability": round(random.uniform(0, 1), 2),
+    }
+
+
+def seed():
+    """Users with a location each, greenhouses spread over them and readings every READING_INTERVAL."""
+    random.seed(0)
+    superuser = CustomUser.objects.create_superuser(email="admin@benchmark.local", password="benchmark")
+    users = CustomUser.objects.bulk_create(
+        CustomUser(email=f"user{number}@benchmark.local", first_name="Benchmark", last_name=str(number))
+        for number in range(BENCHMARK_USERS)
+    )
+    locations = Location.objects.bulk_create(
+        Location(name=f"Benchmark {number}", coordinates=(0, 0), owner=user) for number, user in enumerate(users)
+    )
+    green_houses = GreenHouse.objects.bulk_create(
+        GreenHouse(name=f"Benchmark {number}", location=locations[number % len(users)], owner=users[number % len(users)])
+        for number in range(BENCHMARK_GREENHOUSES)
+    )
+    GreenHouse.authorized_users.through.objects.bulk_create(
+        GreenHouse.authorized_users.through(greenhouse_id=green_house.id, customuser_id=green_house.owner_id)
+        for green_house in green_houses
+    )
+    Device.objects.bulk_create(
+        Device(name=f"Sensor {number}", greenhouse=green_house)
+        for green_house in green_houses for number in range(BENCHMARK_DEVICES)
+    )
+
+    per_green_house = BENCHMARK_READINGS // len(green_houses)
+    batch = []
+    for number in range(per_green_house):
+        for green_house in green_houses:
+            batch.append(reading(green_house.id, SEED_START + number * READING_INTERVAL))
+            if len(batch) == INGEST_BATCH_SIZE:
+                ingest_environments(batch)
+                batch = []
+    ingest_environments(batch)
+
+    return SimpleNamespace(
+        superuser=superuser,
+        user=users[0],
+        green_house=green_houses[0],
+        start=SEED_START,
+        end=SEED_START + per_green_house * READING_INTERVAL,
+    )
+
+
+@pytest.fixture(scope="session")
+def fleet(django_db_setup, django_db_blocker):
+    """Seeded once per run, outside of the per test transactions."""
+    with django_db_blocker.unblock():
+        fleet = seed()
+        fleet.readings = Environment.objects.count()
+    return fleet
+
+
+class GraphQLClient:
+    def __init__(self, user):
+        self.client = Client(HTTP_AUTHORIZATION=f"JWT {get_token(user)}")
+
+    def execute(self, query, variables=None):
+        response = self.client.post("/graphql/", {"query": query, "variables": variables or {}},
+                                    content_type="application/json")
+        result = response.json()
+        assert "errors" not in result, result["errors"]
+        return result["data"]
+
+
+@pytest.fixture
+def superuser_client(fleet):
+    return GraphQLClient(fleet.superuser)
+
+
+@pytest.fixture
+def user_client(fleet):
+    return GraphQLClient(fleet.user)
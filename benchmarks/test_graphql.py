@@ -0,0 +1,120 @@
+from itertools import count
+
+import pytest
+from graphene.utils.str_converters import to_camel_case
+
+from benchmarks.conftest import READING_INTERVAL, reading
+
+pytestmark = pytest.mark.django_db
+
+greenhouses = '''query {
+                    greenhouses {
+                        id, name,
+                        owner { email },
+                        location { name },
+                        deviceSet { name, functionality },
+                        latestEnvironment { date, temperature }
+                    }
+                }'''
+
+devices = '''query {
+                devices {
+                    id, name,
+                    greenhouse { name }
+                }
+            }'''
+
+environments = '''query($greenhouse: Int!, $from: DateTime!, $to: DateTime!){
+                    environments(greenhouse: $greenhouse, from: $from, to: $to){
+                        date, temperature, airHumidity, par, co2Level
+                    }
+                }'''
+
+environment_aggregates = '''query($greenhouse: Int!, $from: DateTime!, $to: DateTime!, $bucket: BucketEnum!){
+                                environmentAggregates(greenhouse: $greenhouse, from: $from, to: $to, bucket: $bucket){
+                                    bucket, count,
+                                    metrics { metric, min, max, avg }
+                                }
+                            }'''
+
+environment_series = '''query($greenhouse: Int!, $from: DateTime!, $to: DateTime!){
+                            environmentSeries(greenhouse: $greenhouse, from: $from, to: $to,
+                                              metrics: [TEMPERATURE, AIR_HUMIDITY, PAR, CO2_LEVEL]){
+                                timestamps,
+                                metrics { metric, values }
+                            }
+                        }'''
+
+create_environments = '''mutation($input: [EnvironmentInput!]!){
+                            createEnvironments(input: $input){
+                                created
+                            }
+                        }'''
+
+
+def readings_after(fleet, size):
+    """Fresh readings of the benchmarked greenhouse, later than everything stored so far."""
+    numbers = count()
+
+    def next_readings():
+        return [
+            {to_camel_case(key): value.isoformat() if key == "date" else value
+             for key, value in reading(fleet.green_house.id, fleet.end + next(numbers) * READING_INTERVAL).items()}
+            for _ in range(size)
+        ]
+    return next_readings
+
+
+def test_greenhouses_superuser(benchmark, superuser_client):
+    result = benchmark(superuser_client.execute, greenhouses)
+    assert result["greenhouses"]
+
+
+def test_greenhouses_user(benchmark, user_client):
+    result = benchmark(user_client.execute, greenhouses)
+    assert result["greenhouses"]
+
+
+def test_devices(benchmark, superuser_client):
+    result = benchmark(superuser_client.execute, devices)
+    assert result["devices"]
+
+
+def test_environments_day(benchmark, fleet, user_client):
+    variables = {"greenhouse": fleet.green_house.id, "from": fleet.start.isoformat(),
+                 "to": (fleet.start + 288 * READING_INTERVAL).isoformat()}
+    result = benchmark(user_client.execute, environments, variables)
+    assert result["environments"]
+
+
+@pytest.mark.parametrize("bucket", ["HOUR", "DAY", "MINUTE"])
+def test_environment_aggregates(benchmark, fleet, user_client, bucket):
+    variables = {"greenhouse": fleet.green_house.id, "from": fleet.start.isoformat(), "to": fleet.end.isoformat(),
+                 "bucket": bucket}
+    result = benchmark(user_client.execute, environment_aggregates, variables)
+    assert result["environmentAggregates"]
+
+
+def test_environment_series(benchmark, fleet, user_client):
+    variables = {"greenhouse": fleet.green_house.id, "from": fleet.start.isoformat(), "to": fleet.end.isoformat()}
+    result = benchmark(user_client.execute, environment_series, variables)
+    assert result["environmentSeries"]["timestamps"]
+
+
+@pytest.mark.parametrize("format", ["json", "binary"])
+def test_environment_series_http(benchmark, fleet, user_client, format):
+    params = {"greenhouse": fleet.green_house.id, "from": fleet.start.isoformat(), "to": fleet.end.isoformat(),
+              "metrics": "temperature,air_humidity,par,co2_level", "format": format}
+    response = benchmark(user_client.client.get, "/series/environments/", params)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("size", [1, 100])
+def test_create_environments(benchmark, fleet, user_client, size):
+    next_readings = readings_after(fleet, size)
+    result = benchmark.pedantic(
+        lambda input: user_client.execute(create_environments, {"input": input}),
+        setup=lambda: ((next_readings(),), {}),
+        rounds=50,
+    )
+    assert result["createEnvironments"]["created"] == size
@@ -83,6 +83,27 @@ class EnvironmentAdmin(admin.ModelAdmin):
         ordering = ('date', )
 
 
+@admin.register(EnvironmentArchive)
+class EnvironmentArchiveAdmin(admin.ModelAdmin):
+    list_display = ('green_house', 'month', 'count', 'size', 'updated_at')
+    list_filter = ('green_house',)
+    readonly_fields = ('green_house', 'month', 'count', 'first_date', 'last_date', 'file', 'size', 'updated_at')
+
+    class Meta:
+        ordering = ('month', )
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'progress', 'attempts', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('progress', 'result', 'error', 'attempts', 'started_at', 'finished_at', 'worker',
+                       'heartbeat_at')
+
+    class Meta:
+        ordering = ('-created_at',)
+
+
 admin.site.site_title = "GreenHouse site admin"
 admin.site.site_header = "GreenHouse administration"
 admin.site.index_title = "Site administration"
@@ -0,0 +1,158 @@
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+from django.db.models import Avg, Count, F, Max, Min, Sum
+from django.db.models.functions import Trunc
+
+from greenhouse_management.archive import archived_columns, archives_in_range, from_milliseconds
+from greenhouse_management.models import Environment, EnvironmentRollup
+from greenhouse_management.rollups import rollup_resolution
+
+BUCKETS = ("minute", "hour", "day")
+
+
+def aggregate_environments(green_house, start=None, end=None, bucket="hour", metrics=Environment.METRICS):
+    """
+    Min, max and average of the given metrics of a greenhouse per UTC time bucket, computed by the database.
+
+    Readings with start <= date < end are grouped by their date truncated to 'bucket' (minute, hour or day).
+    The coarsest rollup table that matches the bucket and the range bounds is used instead of the raw readings.
+    Returns a list of dicts with 'bucket', 'count' and 'metrics', ordered by bucket.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unsupported bucket '{bucket}'.")
+
+    resolution = rollup_resolution(start, end, bucket)
+    if resolution:
+        return _aggregate_rollups(green_house, start, end, bucket, metrics, resolution)
+
+    aggregates = {"count": Count("id")}
+    for metric in metrics:
+        aggregates[f"{metric}__min"] = Min(metric)
+        aggregates[f"{metric}__max"] = Max(metric)
+        aggregates[f"{metric}__avg"] = Avg(metric)
+
+    rows = (
+        Environment.objects.in_range(green_house, start, end)
+        .annotate(bucket=Trunc("date", bucket, tzinfo=dt_timezone.utc))
+        .order_by()
+        .values("bucket")
+        .annotate(**aggregates)
+        .order_by("bucket")
+    )
+
+    buckets = [
+        {
+            "bucket": row["bucket"],
+            "count": row["count"],
+            "metrics": [
+                {
+                    "metric": metric,
+                    "min": row[f"{metric}__min"],
+                    "max": row[f"{metric}__max"],
+                    "avg": row[f"{metric}__avg"],
+                }
+                for metric in metrics
+            ],
+        }
+        for row in rows
+    ]
+    archives = list(archives_in_range([green_house], start, end))
+    if archives:
+        buckets = _merge_buckets(buckets, _aggregate_archives(archives, start, end, bucket, metrics))
+    return buckets
+
+
+def _aggregate_archives(archives, start, end, bucket, metrics):
+    """Buckets like the ones of the database, of the archived readings."""
+    size = {"minute": 60000, "hour": 3600000, "day": 86400000}[bucket]
+    places = [Environment._meta.get_field(metric).decimal_places for metric in metrics]
+    sums = {}
+    for archive in archives:
+        columns = archived_columns(archive, start, end, ["timestamp", *metrics])
+        for timestamp, *values in zip(*columns.values()):
+            entry = sums.setdefault(timestamp - timestamp % size, [0, [[value, value, 0] for value in values]])
+            entry[0] += 1
+            for aggregate, value in zip(entry[1], values):
+                aggregate[0] = min(aggregate[0], value)
+                aggregate[1] = max(aggregate[1], value)
+                aggregate[2] += value
+    return [
+        {
+            "bucket": from_milliseconds(period),
+            "count": count,
+            "metrics": [
+                {
+                    "metric": metric,
+                    "min": Decimal(low).scaleb(-place),
+                    "max": Decimal(high).scaleb(-place),
+                    "avg": (Decimal(total) / count).scaleb(-place),
+                }
+                for metric, place, (low, high, total) in zip(metrics, places, aggregates)
+            ],
+        }
+        for period, (count, aggregates) in sorted(sums.items())
+    ]
+
+
+def _merge_buckets(*bucket_lists):
+    """Combine bucket lists of the same metrics, buckets present in several lists are merged by their counts."""
+    merged = {}
+    for buckets in bucket_lists:
+        for bucket in buckets:
+            other = merged.setdefault(bucket["bucket"], bucket)
+            if other is bucket:
+                continue
+            count = other["count"] + bucket["count"]
+            merged[bucket["bucket"]] = {
+                "bucket": bucket["bucket"],
+                "count": count,
+                "metrics": [
+                    {
+                        "metric": first["metric"],
+                        "min": min(first["min"], second["min"]),
+                        "max": max(first["max"], second["max"]),
+                        "avg": (first["avg"] * other["count"] + second["avg"] * bucket["count"]) / count,
+                    }
+                    for first, second in zip(other["metrics"], bucket["metrics"])
+                ],
+            }
+    return [merged[period] for period in sorted(merged)]
+
+
+def _aggregate_rollups(green_house, start, end, bucket, metrics, resolution):
+    rollups = EnvironmentRollup.objects.filter(green_house=green_house, resolution=resolution, metric__in=metrics)
+    if start is not None:
+        rollups = rollups.filter(bucket__gte=start)
+    if end is not None:
+        rollups = rollups.filter(bucket__lt=end)
+
+    # Rollups of the requested resolution already are the buckets, coarser buckets are grouped by the database.
+    period = F("bucket") if resolution == bucket else Trunc("bucket", bucket, tzinfo=dt_timezone.utc)
+    rows = (
+        rollups.annotate(period=period)
+        .values("period", "metric")
+        .annotate(readings=Sum("count"), low=Min("minimum"), high=Max("maximum"), amount=Sum("total"))
+    )
+
+    buckets = {}
+    for row in rows:
+        buckets.setdefault(row["period"], {})[row["metric"]] = row
+
+    return [
+        {
+            "bucket": period,
+            "count": next(iter(by_metric.values()))["readings"],
+            "metrics": [
+                {
+                    "metric": metric,
+                    "min": by_metric[metric]["low"],
+                    "max": by_metric[metric]["high"],
+                    "avg": by_metric[metric]["amount"] / by_metric[metric]["readings"],
+                }
+                for metric in metrics
+                if metric in by_metric
+            ],
+        }
+        for period, by_metric in sorted(buckets.items())
+    ]
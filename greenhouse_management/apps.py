@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GreenhouseManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'greenhouse_management'
+
+    def ready(self):
+        from greenhouse_management import signals  # noqa: F401
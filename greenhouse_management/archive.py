@@ -0,0 +1,203 @@
+import os
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from functools import lru_cache
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import IntegerField
+from django.db.models.functions import Cast, Trunc
+from django.utils import timezone
+
+from greenhouse_management.codec import decode_columns, encode_columns
+from greenhouse_management.functions import EpochMilliseconds
+from greenhouse_management.models import Environment, EnvironmentArchive
+from greenhouse_management.retention import RETENTION_CHUNK_SIZE, month_start
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+# Columns of an archive file, metric values are the stored fixed point integers.
+ARCHIVE_COLUMNS = ("id", "timestamp", *Environment.METRICS)
+
+
+def to_milliseconds(date):
+    """Milliseconds since the epoch of 'date', rounded up: the first archived timestamp not before 'date'."""
+    return -(-((date - EPOCH) // timedelta(microseconds=1)) // 1000)
+
+
+def from_milliseconds(value):
+    return EPOCH + timedelta(milliseconds=value)
+
+
+def archive_file(green_house_id, month):
+    return f"{green_house_id}/{month:%Y-%m}.ghc"
+
+
+# Keyed by the modification time of the archive, rewritten archives are read again.
+@lru_cache(maxsize=settings.ARCHIVE_CACHE_SIZE)
+def _read(path, updated_at):
+    with open(path, "rb") as archive:
+        return decode_columns(archive.read())
+
+
+def read_archive(archive):
+    """Columns of an archive as lists of integers, ordered by timestamp and id. Must not be modified."""
+    return _read(settings.ARCHIVE_ROOT / archive.file, archive.updated_at)
+
+
+def _write(file, data):
+    path = settings.ARCHIVE_ROOT / file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Written aside and renamed, readers never see a partial file.
+    temporary = path.with_suffix(".tmp")
+    with open(temporary, "wb") as archive:
+        archive.write(data)
+    os.replace(temporary, path)
+    return len(data)
+
+
+def archive_month(green_house_id, month):
+    """
+    Move the readings of a greenhouse in the UTC month starting at 'month' to its archive file,
+    merged with the readings archived before. Returns the number of readings moved.
+    """
+    rows = list(
+        Environment.objects.in_range(green_house_id, month, month_start(month, 1))
+        .order_by("date", "id")
+        .values_list(
+            "id", EpochMilliseconds("date"), *[Cast(metric, IntegerField()) for metric in Environment.METRICS]
+        )
+    )
+    if not rows:
+        return 0
+    ids = [row[0] for row in rows]
+
+    archive = EnvironmentArchive.objects.filter(green_house_id=green_house_id, month=month).first()
+    if archive is not None:
+        archived = read_archive(archive)
+        # By id, readings left in the table by an interrupted run are not archived twice.
+        by_id = {row[0]: row for row in zip(*(archived[column] for column in ARCHIVE_COLUMNS))}
+        by_id.update((row[0], row) for row in rows)
+        rows = sorted(by_id.values(), key=lambda row: (row[1], row[0]))
+
+    # A crash between writing the file and deleting the readings leaves them in both places until the next run.
+    file = archive_file(green_house_id, month)
+    size = _write(file, encode_columns(dict(zip(ARCHIVE_COLUMNS, map(list, zip(*rows))))))
+    with transaction.atomic():
+        EnvironmentArchive.objects.update_or_create(
+            green_house_id=green_house_id, month=month,
+            defaults={
+                "count": len(rows), "first_date": from_milliseconds(rows[0][1]),
+                "last_date": from_milliseconds(rows[-1][1]), "file": file, "size": size,
+            },
+        )
+        for start in range(0, len(ids), RETENTION_CHUNK_SIZE):
+            Environment.objects.filter(id__in=ids[start:start + RETENTION_CHUNK_SIZE]).delete()
+    return len(ids)
+
+
+def archive_environments(now=None, on_progress=None):
+    """
+    Move the raw readings of whole UTC months older than ENVIRONMENT_ARCHIVE_AFTER_DAYS to compressed
+    per greenhouse and month archive files. Rollups stay in the database.
+    'on_progress' is called with the share of months done.
+    Returns the number of archived 'months' and 'readings'.
+    """
+    if settings.ENVIRONMENT_ARCHIVE_AFTER_DAYS is None:
+        return {"months": 0, "readings": 0}
+    cutoff = month_start((now or timezone.now()) - timedelta(days=settings.ENVIRONMENT_ARCHIVE_AFTER_DAYS))
+    months = list(
+        Environment.objects.filter(date__lt=cutoff)
+        .annotate(month=Trunc("date", "month", tzinfo=dt_timezone.utc))
+        .values_list("green_house_id", "month")
+        .order_by("month", "green_house_id")
+        .distinct()
+    )
+    readings = 0
+    for number, (green_house_id, month) in enumerate(months, start=1):
+        readings += archive_month(green_house_id, month)
+        if on_progress:
+            on_progress(number / len(months))
+    return {"months": len(months), "readings": readings}
+
+
+def archives_in_range(green_houses=None, start=None, end=None):
+    """Archives with readings in [start, end) of the given greenhouses (all by default), ordered by month."""
+    archives = EnvironmentArchive.objects.all()
+    if green_houses is not None:
+        archives = archives.filter(green_house__in=green_houses)
+    if start is not None:
+        archives = archives.filter(last_date__gte=start)
+    if end is not None:
+        archives = archives.filter(first_date__lt=end)
+    return archives.order_by("month", "green_house_id")
+
+
+def archived_columns(archive, start=None, end=None, columns=ARCHIVE_COLUMNS):
+    """The given columns of the readings of an archive with start <= date < end."""
+    data = read_archive(archive)
+    timestamps = data["timestamp"]
+    low = bisect_left(timestamps, to_milliseconds(start)) if start is not None else 0
+    high = bisect_left(timestamps, to_milliseconds(end)) if end is not None else len(timestamps)
+    return {column: data[column][low:high] for column in columns}
+
+
+def archived_rows(green_houses=None, start=None, end=None):
+    """
+    Archived readings with start <= date < end as (greenhouse id, date, id, *metric integers) rows,
+    ordered by greenhouse, date and id. Archives are read one at a time.
+    """
+    for archive in archives_in_range(green_houses, start, end).order_by("green_house_id", "month"):
+        for id, timestamp, *values in zip(*archived_columns(archive, start, end).values()):
+            yield archive.green_house_id, from_milliseconds(timestamp), id, *values
+
+
+def archived_count(green_houses=None, start=None, end=None):
+    """Number of archived readings with start <= date < end, archives wholly in the range are not read."""
+    count = 0
+    for archive in archives_in_range(green_houses, start, end):
+        if (start is None or archive.first_date >= start) and (end is None or archive.last_date < end):
+            count += archive.count
+        else:
+            count += len(archived_columns(archive, start, end, ["timestamp"])["timestamp"])
+    return count
+
+
+def _environment(green_house, id, timestamp, *values):
+    environment = Environment(
+        id=id, green_house=green_house, date=from_milliseconds(timestamp),
+        **{
+            metric: Decimal(value).scaleb(-Environment._meta.get_field(metric).decimal_places)
+            for metric, value in zip(Environment.METRICS, values)
+        },
+    )
+    environment._state.adding = False
+    return environment
+
+
+def archived_environments(green_houses=None, start=None, end=None, after=None, limit=None):
+    """
+    Archived readings with start <= date < end as unsaved Environment instances, ordered by date and id,
+    with their greenhouse attached.
+
+    'after' is a (date, id) pair to continue from, at most 'limit' readings are returned:
+    archives are read month by month until enough readings were found.
+    """
+    if after is not None and (start is None or after[0] > start):
+        start = after[0]
+    environments = []
+    archives = archives_in_range(green_houses, start, end).select_related("green_house")
+    for month, archives in groupby(archives, key=lambda archive: archive.month):
+        if limit is not None and len(environments) >= limit:
+            break
+        for archive in archives:
+            columns = archived_columns(archive, start, end)
+            environments.extend(
+                environment for environment in (
+                    _environment(archive.green_house, *row) for row in zip(*columns.values())
+                )
+                if after is None or (environment.date, environment.id) > after
+            )
+        environments.sort(key=lambda environment: (environment.date, environment.id))
+    return environments[:limit]
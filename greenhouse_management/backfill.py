@@ -0,0 +1,159 @@
+import csv
+import gzip
+import json
+import os
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from zoneinfo import ZoneInfo
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from greenhouse_management.ingest import INVALID_UTF8, ingest_stream, is_utf8
+from greenhouse_management.models import Environment, GreenHouse
+
+BACKFILL_CHUNK_SIZE = 5000
+
+
+def open_csv(path):
+    """
+    A text stream of a CSV file, gzip compressed files are recognized by their '.gz' suffix.
+    Undecodable bytes are kept as surrogates, to fail only the rows they are in.
+    """
+    if str(path).endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="surrogateescape", newline="")
+    return open(path, encoding="utf-8", errors="surrogateescape", newline="")
+
+
+def csv_chunks(stream, chunk_size=BACKFILL_CHUNK_SIZE, skip=0):
+    """
+    Yield (first row number, rows) for chunks of up to 'chunk_size' rows of a CSV stream,
+    after the header line and the first 'skip' rows. Rows are numbered from 1 and are lists of strings.
+    """
+    reader = csv.reader(stream)
+    next(reader, None)
+    number = 1
+    for _ in islice(reader, skip):
+        number += 1
+    while rows := list(islice(reader, chunk_size)):
+        yield number, rows
+        number += len(rows)
+
+
+def csv_header(path):
+    with open_csv(path) as stream:
+        return next(csv.reader(stream), [])
+
+
+class GreenHouseResolver:
+    """
+    Greenhouse ids for the values of a 'greenhouse' column, ids or names. Every distinct value is looked up once,
+    the unknown values of a chunk with a single query. Names shared by several greenhouses are not resolved.
+    """
+
+    def __init__(self):
+        self._ids = {}
+
+    def resolve(self, values):
+        unknown = set(values) - self._ids.keys()
+        # Values with undecodable bytes can not be sent to the database.
+        self._ids.update((value, None) for value in unknown if not is_utf8(value))
+        unknown = {value for value in unknown if value not in self._ids}
+        if unknown:
+            # ASCII digits only, int() does not accept every character str.isdigit() does, e.g. '²'.
+            ids = {value: int(value) for value in unknown if value.isascii() and value.isdigit()}
+            names = unknown - ids.keys()
+            found_ids, found_names = set(), {}
+            greenhouses = GreenHouse.objects.filter(Q(pk__in=ids.values()) | Q(name__in=names))
+            for id, name in greenhouses.values_list("id", "name"):
+                found_ids.add(id)
+                if name in names:
+                    found_names[name] = None if name in found_names else id
+            self._ids.update((value, id if id in found_ids else None) for value, id in ids.items())
+            self._ids.update((name, found_names.get(name)) for name in names)
+        return [self._ids[value] for value in values]
+
+
+def _date(value, zone):
+    try:
+        date = parse_datetime(value) if value else None
+    except ValueError:
+        # Well-formed but out of range, e.g. month 13.
+        return value
+    if date is not None and timezone.is_naive(date):
+        date = timezone.make_aware(date, zone)
+    return date
+
+
+def _decimal(value):
+    try:
+        return Decimal(value) if value else None
+    except InvalidOperation:
+        return value
+
+
+def convert_chunk(header, rows, green_house_ids, time_zone="UTC"):
+    """
+    Readings of CSV rows of the given header, converted column by column: the rows are transposed once
+    and every column is parsed in one pass. Unparseable values are left for ingest validation to report.
+    """
+    width = len(header)
+    rows = [row if len(row) == width else (row + [""] * width)[:width] for row in rows]
+    columns = dict(zip(header, map(list, zip(*rows)))) if rows else {}
+    zone = ZoneInfo(time_zone)
+    count = len(rows)
+    parsed = {
+        "greenhouse": green_house_ids,
+        "date": [_date(value, zone) for value in columns.get("date", [None] * count)],
+        **{metric: list(map(_decimal, columns.get(metric, [None] * count))) for metric in Environment.METRICS},
+    }
+    return [dict(zip(parsed, values)) for values in zip(*parsed.values())]
+
+
+def import_chunk(first_row, header, rows, green_house_ids, time_zone="UTC"):
+    """
+    Convert and store a chunk of CSV rows, returns the ingest_stream() summary with file row numbers.
+    Rows with bytes that are not UTF-8 are reported as errors.
+    """
+    readings = convert_chunk(header, rows, green_house_ids, time_zone)
+    return ingest_stream(
+        (number, reading, None) if all(map(is_utf8, row)) else (number, None, INVALID_UTF8)
+        for number, reading, row in zip(range(first_row, first_row + len(rows)), readings, rows)
+    )
+
+
+class Checkpoint:
+    """
+    Number of leading rows of a CSV file whose chunks are all committed, kept in a JSON file next to it,
+    so an interrupted import resumes after them. Chunks committed out of order by parallel workers are
+    remembered until the chunks before them are committed too; their rows are stored again on resume,
+    as duplicates that ingest does not store twice.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = {"file": os.path.abspath(source), "size": os.path.getsize(source)}
+        self.rows = 0
+        self._committed = {}
+        if os.path.exists(path):
+            with open(path) as checkpoint:
+                state = json.load(checkpoint)
+            if state.get("source") == self.source:
+                self.rows = state["rows"]
+
+    def commit(self, first_row, count):
+        """Record the chunk of 'count' rows starting at row number 'first_row' as committed."""
+        self._committed[first_row - 1] = count
+        rows = self.rows
+        while self.rows in self._committed:
+            self.rows += self._committed.pop(self.rows)
+        if self.rows != rows:
+            temporary = f"{self.path}.tmp"
+            with open(temporary, "w") as checkpoint:
+                json.dump({"source": self.source, "rows": self.rows}, checkpoint)
+            os.replace(temporary, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,234 @@
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.db import connections
+
+from greenhouse_management import metrics
+from greenhouse_management.ingest import ingest_stream, ndjson_readings, reading_greenhouses, validate_reading
+
+logger = logging.getLogger(__name__)
+
+BUFFER_FULL = "Too many readings are waiting to be stored, retry later."
+
+
+class WriteBehindBuffer:
+    """
+    Readings of single createEnvironment mutations, validated and acknowledged before they are stored.
+
+    They are stored with one ingest_environments() batch per INGEST_BATCH_SIZE readings as soon as 'size' readings
+    are buffered, or 'interval' seconds after the first one, so thousands of tiny transactions become a few
+    large ones. Rollups and current environments are updated when the readings are stored.
+    When storing them fails, e.g. while the database is down, the timer retries and further readings are
+    buffered without storing them in the request; beyond 'limit' buffered readings (10 times 'size' by default,
+    0 for no limit) new ones are refused.
+
+    With a 'journal' directory every reading is appended to a journal file of the process in it before it is
+    acknowledged (and synced to disk with 'fsync'). The file is locked while the process runs; journals left
+    unlocked by crashed processes are replayed once by the next buffer started on the directory, which takes
+    their readings over into its own journal before removing them. Ingest is idempotent on greenhouse and date,
+    readings stored before the crash are not stored twice.
+    """
+
+    def __init__(self, size, interval, journal=None, fsync=False, limit=None):
+        self.size = size
+        self.interval = interval
+        self.limit = 10 * size if limit is None else limit
+        self.journal = None
+        self.fsync = fsync
+        self.pid = os.getpid()
+        self._readings = []
+        self._timer = None
+        self._file = None
+        self._failing = False
+        # '_lock' guards the buffered readings and the journal, '_flushing' keeps the batches in order.
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()
+        if journal is not None:
+            journal.mkdir(parents=True, exist_ok=True)
+            self.journal = journal / f"{self.pid}.ndjson"
+            orphans = []
+            for path in sorted(journal.glob("*.ndjson")):
+                orphan = _lock_orphan(path)
+                if orphan is not None:
+                    orphans.append((path, orphan))
+                    self._readings.extend(reading for number, reading, error in ndjson_readings(orphan) if not error)
+            self._rewrite_journal()
+            for path, orphan in orphans:
+                if path != self.journal:
+                    os.remove(path)
+                orphan.close()
+            if self._readings:
+                self._schedule()
+        metrics.buffered_rows.inc(len(self._readings))
+
+    def __len__(self):
+        return len(self._readings)
+
+    def append(self, reading):
+        """
+        Validate a reading and buffer it, returns an (environment, error) pair as ingest_environments() does.
+        The environment is not saved yet and has no id.
+        """
+        environment, error = validate_reading(reading, reading_greenhouses([reading]))
+        if error:
+            metrics.observe_ingest([], 1)
+            return None, error
+
+        reading = {"greenhouse": environment.green_house_id, "date": environment.date,
+                   **{metric: getattr(environment, metric) for metric in environment.METRICS}}
+        with self._lock:
+            if self.limit and len(self._readings) >= self.limit:
+                metrics.observe_ingest([], 1)
+                return None, BUFFER_FULL
+            if self._file is not None:
+                self._file.write(json.dumps(reading, cls=DjangoJSONEncoder) + "\n")
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            self._readings.append(reading)
+            metrics.buffered_rows.inc()
+            # After a failed flush the timer retries, requests do not wait for the database.
+            full = len(self._readings) >= self.size and not self._failing
+            if not full:
+                self._schedule()
+        if full:
+            try:
+                self.flush()
+            except Exception:
+                # The reading is journaled and kept for the timer's retry, it is acknowledged like the others.
+                logger.exception("Buffered readings could not be stored, retrying in %s s.", self.interval)
+        return environment, None
+
+    def _schedule(self):
+        if self._timer is None:
+            self._timer = threading.Timer(self.interval, self._flush_in_background)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread ends here, its database connection would be left open.
+            connections.close_all()
+
+    def flush(self):
+        """
+        Store the buffered readings, returns the ingest_stream() summary or None when there were none.
+        Readings refused at this point were acknowledged already, they are logged as they can not be reported.
+        """
+        with self._flushing:
+            with self._lock:
+                readings, self._readings = self._readings, []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not readings:
+                return None
+
+            try:
+                summary = ingest_stream((number, reading, None) for number, reading in enumerate(readings, start=1))
+            except Exception:
+                # Kept for the next flush, batches stored before the failure are answered as duplicates then.
+                with self._lock:
+                    self._readings[:0] = readings
+                    self._failing = True
+                    self._schedule()
+                raise
+            self._failing = False
+            metrics.buffered_rows.dec(len(readings))
+            if summary["failed"]:
+                logger.warning("%s buffered readings could not be stored: %s", summary["failed"], summary["errors"])
+
+            with self._lock:
+                if self._file is not None:
+                    self._rewrite_journal()
+            return summary
+
+    def _rewrite_journal(self):
+        """Keep only the buffered readings in the journal, written aside, locked and renamed."""
+        temporary = self.journal.with_suffix(".tmp")
+        journal = open(temporary, "w", encoding="utf-8")
+        fcntl.flock(journal, fcntl.LOCK_EX)
+        journal.writelines(json.dumps(reading, cls=DjangoJSONEncoder) + "\n" for reading in self._readings)
+        journal.flush()
+        if self.fsync:
+            os.fsync(journal.fileno())
+        os.replace(temporary, self.journal)
+        if self._file is not None:
+            self._file.close()
+        self._file = journal
+
+    def close(self):
+        """Store the buffered readings and release the journal."""
+        self.flush()
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _lock_orphan(path):
+    """The journal file at 'path' opened and locked, None when a running process holds it or it was replayed."""
+    try:
+        orphan = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(orphan, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # Replaced or removed by its owner or another replaying process since it was opened.
+        if os.fstat(orphan.fileno()).st_ino == os.stat(path).st_ino:
+            return orphan
+    except OSError:
+        pass
+    orphan.close()
+    return None
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """The write-behind buffer of this process, None when INGEST_BUFFER_SIZE is not set."""
+    global _buffer
+    if not settings.INGEST_BUFFER_SIZE:
+        return None
+    with _buffer_lock:
+        # A buffer inherited from a parent process belongs to the parent, with its journal.
+        if _buffer is None or _buffer.pid != os.getpid():
+            _buffer = WriteBehindBuffer(
+                settings.INGEST_BUFFER_SIZE, settings.INGEST_BUFFER_INTERVAL.total_seconds(),
+                settings.INGEST_BUFFER_JOURNAL, settings.INGEST_BUFFER_FSYNC, settings.INGEST_BUFFER_LIMIT,
+            )
+        return _buffer
+
+
+def close_buffer():
+    """Store the readings buffered by this process, e.g. when it exits."""
+    global _buffer
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+    if buffer is not None:
+        buffer.close()
+
+
+atexit.register(close_buffer)
+
+
+def _reset_buffer(setting, **kwargs):
+    if setting.startswith("INGEST_BUFFER_"):
+        close_buffer()
+
+
+setting_changed.connect(_reset_buffer)
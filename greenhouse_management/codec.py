@@ -0,0 +1,189 @@
+import struct
+import sys
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+COLUMNS_MAGIC = b"GHC1"
+_HEADER = struct.Struct("<4sIB")
+_ITEM_SIZE = 8
+
+
+class CodecError(ValueError):
+    pass
+
+
+def _shuffle(data):
+    """Group the n-th bytes of all int64 values together: small deltas leave long runs of zero bytes for zlib."""
+    return b"".join(data[byte::_ITEM_SIZE] for byte in range(_ITEM_SIZE))
+
+
+def _unshuffle(data):
+    count = len(data) // _ITEM_SIZE
+    values = bytearray(len(data))
+    for byte in range(_ITEM_SIZE):
+        values[byte::_ITEM_SIZE] = data[byte * count:(byte + 1) * count]
+    return bytes(values)
+
+
+def encode_columns(columns, level=6):
+    """
+    Compress named columns of integers of the same length, e.g. timestamps and fixed point metric values.
+
+    Every column is delta encoded as little-endian int64, the bytes of the deltas are shuffled by significance
+    and the whole body is zlib compressed. Slowly changing sensor readings shrink to a few bits per value.
+    """
+    names = list(columns)
+    count = len(columns[names[0]]) if names else 0
+    header = [_HEADER.pack(COLUMNS_MAGIC, count, len(names))]
+    body = []
+    for name in names:
+        values = columns[name]
+        if len(values) != count:
+            raise CodecError(f"Column '{name}' has {len(values)} values instead of {count}.")
+        encoded = name.encode()
+        header.append(bytes([len(encoded)]) + encoded)
+        deltas = array("q", (value - previous for value, previous in zip(values, [0, *values])))
+        if sys.byteorder == "big":
+            deltas.byteswap()
+        body.append(_shuffle(deltas.tobytes()))
+    return b"".join(header) + zlib.compress(b"".join(body), level)
+
+
+def decode_columns(data):
+    """Inverse of encode_columns(), a dict of column name to list of integers."""
+    try:
+        magic, count, column_count = _HEADER.unpack_from(data)
+    except struct.error:
+        raise CodecError("Truncated header.")
+    if magic != COLUMNS_MAGIC:
+        raise CodecError("Not an encoded column block.")
+
+    offset = _HEADER.size
+    names = []
+    for _ in range(column_count):
+        length = data[offset]
+        names.append(bytes(data[offset + 1:offset + 1 + length]).decode())
+        offset += 1 + length
+    try:
+        body = zlib.decompress(data[offset:])
+    except zlib.error as error:
+        raise CodecError(f"Corrupt column block: {error}")
+    size = count * _ITEM_SIZE
+    if len(body) != size * column_count:
+        raise CodecError("Column block does not match its header.")
+
+    columns = {}
+    for number, name in enumerate(names):
+        deltas = array("q", _unshuffle(body[number * size:(number + 1) * size]))
+        if sys.byteorder == "big":
+            deltas.byteswap()
+        columns[name] = list(accumulate(deltas))
+    return columns
+
+
+READINGS_MAGIC = b"GHR1"
+_READINGS_HEADER = struct.Struct("<4sIqIB")
+# Largest body of a readings block, which is buffered whole: about 500 000 readings of ten metrics.
+MAX_BLOCK_SIZE = 16 * 1024 * 1024
+# Signed little-endian integers by width in bytes.
+_TYPECODES = {1: "b", 2: "h", 4: "i"}
+# Milliseconds since the Unix epoch that are representable as datetimes.
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_TIMESTAMP_RANGE = range(
+    (datetime.min.replace(tzinfo=timezone.utc) - _EPOCH) // timedelta(milliseconds=1),
+    (datetime.max.replace(tzinfo=timezone.utc) - _EPOCH) // timedelta(milliseconds=1),
+)
+
+
+def _width(values):
+    low, high = min(values, default=0), max(values, default=0)
+    for width in _TYPECODES:
+        bound = 1 << (8 * width - 1)
+        if -bound <= low and high < bound:
+            return width
+    raise CodecError("Values do not fit in 32 bits.")
+
+
+def encode_readings(green_house_id, timestamps, columns):
+    """
+    Pack readings of a greenhouse for uplink from gateways: millisecond timestamps and columns of
+    fixed point integers (e.g. centi-degrees), one value per timestamp in each column.
+
+    A block is a header (magic, greenhouse id, first timestamp, reading count, column count), a byte per column
+    with its width, then the columns one after the other: the deltas of the timestamps from the previous one,
+    followed by the given columns. Every column is stored as the narrowest of int8, int16 or int32 that fits
+    all of its values, so a reading with ten metrics takes about 30 bytes. Blocks can be concatenated,
+    a block body holds at most MAX_BLOCK_SIZE bytes.
+    """
+    base = timestamps[0] if timestamps else 0
+    columns = [[timestamp - previous for timestamp, previous in zip(timestamps, [base, *timestamps])], *columns]
+    for column in columns:
+        if len(column) != len(timestamps):
+            raise CodecError(f"Column has {len(column)} values instead of {len(timestamps)}.")
+    widths = [_width(column) for column in columns]
+    if len(timestamps) * sum(widths) > MAX_BLOCK_SIZE:
+        raise CodecError(f"Block is larger than {MAX_BLOCK_SIZE} bytes, split the readings.")
+
+    body = []
+    for width, column in zip(widths, columns):
+        values = array(_TYPECODES[width], column)
+        if sys.byteorder == "big":
+            values.byteswap()
+        body.append(values.tobytes())
+    try:
+        header = _READINGS_HEADER.pack(READINGS_MAGIC, green_house_id, base, len(timestamps), len(columns))
+    except struct.error as error:
+        raise CodecError(f"Invalid header: {error}")
+    return header + bytes(widths) + b"".join(body)
+
+
+def _read_exactly(stream, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def read_readings(stream):
+    """
+    Yield (green_house_id, timestamps, columns) for every block of encode_readings() in a binary stream,
+    without the timestamp deltas in 'columns'. Each block is read and unpacked with one array per column.
+    Headers announcing a body larger than MAX_BLOCK_SIZE are refused before it is read.
+    """
+    while True:
+        header = _read_exactly(stream, _READINGS_HEADER.size)
+        if not header:
+            return
+        if len(header) < _READINGS_HEADER.size:
+            raise CodecError("Truncated header.")
+        magic, green_house_id, base, count, column_count = _READINGS_HEADER.unpack(header)
+        if magic != READINGS_MAGIC:
+            raise CodecError("Not an encoded readings block.")
+
+        widths = _read_exactly(stream, column_count)
+        if len(widths) < column_count or not column_count or any(width not in _TYPECODES for width in widths):
+            raise CodecError("Invalid column widths.")
+        size = count * sum(widths)
+        if size > MAX_BLOCK_SIZE:
+            raise CodecError(f"Block is larger than {MAX_BLOCK_SIZE} bytes.")
+        body = _read_exactly(stream, size)
+        if len(body) < size:
+            raise CodecError("Truncated readings block.")
+
+        columns = []
+        offset = 0
+        for width in widths:
+            values = array(_TYPECODES[width], body[offset:offset + count * width])
+            if sys.byteorder == "big":
+                values.byteswap()
+            columns.append(values)
+            offset += count * width
+        timestamps = list(accumulate(columns[0], initial=base))[1:]
+        if timestamps and (min(timestamps) not in _TIMESTAMP_RANGE or max(timestamps) not in _TIMESTAMP_RANGE):
+            raise CodecError("Timestamps out of range.")
+        yield green_house_id, timestamps, [values.tolist() for values in columns[1:]]
@@ -0,0 +1,87 @@
+from datetime import timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from greenhouse_management.archive import archived_environments
+from greenhouse_management.models import CurrentEnvironment, Environment, EnvironmentArchive
+from greenhouse_management.retention import retention_cutoffs
+
+UPDATE_ATTEMPTS = 3
+FIELDS = ("environment_id", "date", *Environment.METRICS)
+
+
+def _date(environment):
+    date = Environment._meta.get_field("date").to_python(environment.date)
+    return timezone.make_aware(date, dt_timezone.utc) if timezone.is_naive(date) else date
+
+
+def _copy(environment, current):
+    current.environment_id = environment.id
+    current.date = _date(environment)
+    for metric in Environment.METRICS:
+        setattr(current, metric, Environment._meta.get_field(metric).to_python(getattr(environment, metric)))
+    return current
+
+
+def update_current_environments(environments):
+    """Make the newest of the stored readings the current environment of its greenhouse, unless it is older."""
+    latest = {}
+    for environment in environments:
+        known = latest.get(environment.green_house_id)
+        if known is None or (_date(environment), environment.id) > (_date(known), known.id):
+            latest[environment.green_house_id] = environment
+
+    if not latest:
+        return
+
+    # A concurrent ingest may create the same row first, the loser retries and compares against it.
+    for attempt in range(UPDATE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                _upsert(latest)
+            return
+        except IntegrityError:
+            if attempt == UPDATE_ATTEMPTS - 1:
+                raise
+
+
+def _upsert(latest):
+    # Locked and created in greenhouse order, so concurrent ingests wait for each other instead of deadlocking.
+    existing = CurrentEnvironment.objects.select_for_update().order_by("pk").in_bulk(latest.keys())
+
+    created = []
+    updated = []
+    for green_house_id, environment in sorted(latest.items()):
+        current = existing.get(green_house_id)
+        if current is None:
+            created.append(_copy(environment, CurrentEnvironment(green_house_id=green_house_id)))
+        elif (_date(environment), environment.id) >= (current.date, current.environment_id):
+            updated.append(_copy(environment, current))
+
+    CurrentEnvironment.objects.bulk_update(updated, FIELDS)
+    CurrentEnvironment.objects.bulk_create(created)
+
+
+def refresh_current_environment(green_house_id):
+    """
+    Recompute the current environment of a greenhouse from its readings in the table and in the archive,
+    e.g. after one was deleted. Without any reading left, a current environment older than the retention
+    of the greenhouse is kept: its reading was pruned, not deleted.
+    """
+    candidates = [Environment.objects.filter(green_house_id=green_house_id).order_by("-date", "-id").first()]
+    archive = EnvironmentArchive.objects.filter(green_house_id=green_house_id).order_by("-last_date").first()
+    if archive is not None:
+        candidates.extend(archived_environments([green_house_id], archive.last_date)[-1:])
+    environment = max(filter(None, candidates), key=lambda environment: (_date(environment), environment.id),
+                      default=None)
+
+    with transaction.atomic():
+        current = CurrentEnvironment.objects.filter(green_house_id=green_house_id)
+        if environment is None:
+            cutoff = retention_cutoffs().get(green_house_id)
+            if cutoff is not None:
+                current = current.filter(date__gte=cutoff)
+        current.delete()
+        if environment:
+            _copy(environment, CurrentEnvironment(green_house_id=green_house_id)).save(force_insert=True)
@@ -0,0 +1,80 @@
+from decimal import Decimal, InvalidOperation
+
+from django import forms
+from django.core import validators
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+
+class FixedPointField(models.Field):
+    """
+    Decimal value stored as an integer number of 10 ** -decimal_places units, e.g. 12.34 as 1234.
+
+    The field reads and writes decimal.Decimal like a DecimalField with the same max_digits and decimal_places,
+    while the column is a plain integer: smaller rows, no numeric/text parsing in the database driver,
+    and cheap Min, Max, Sum and Avg. Aggregates over the field come back as Decimal in the original units.
+    """
+
+    description = _("Fixed point decimal number")
+    default_error_messages = {
+        "invalid": _("“%(value)s” value must be a decimal number."),
+    }
+
+    def __init__(self, verbose_name=None, name=None, max_digits=None, decimal_places=None, **kwargs):
+        self.max_digits, self.decimal_places = max_digits, decimal_places
+        super().__init__(verbose_name, name, **kwargs)
+
+    @cached_property
+    def multiplier(self):
+        return 10 ** self.decimal_places
+
+    @cached_property
+    def validators(self):
+        return [*super().validators, validators.DecimalValidator(self.max_digits, self.decimal_places)]
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["max_digits"] = self.max_digits
+        kwargs["decimal_places"] = self.decimal_places
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return "IntegerField" if self.max_digits <= 9 else "BigIntegerField"
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal):
+            return value
+        if isinstance(value, float):
+            value = repr(value)
+        try:
+            return Decimal(value)
+        except (InvalidOperation, TypeError, ValueError):
+            raise ValidationError(self.error_messages["invalid"], code="invalid", params={"value": value})
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return None
+        if isinstance(value, float):
+            return round(value * self.multiplier)
+        if isinstance(value, int):
+            return value * self.multiplier
+        return int(self.to_python(value).scaleb(self.decimal_places).to_integral_value())
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        if isinstance(value, int):
+            return Decimal(value).scaleb(-self.decimal_places)
+        # Avg and other non-integer results of aggregates over the column.
+        return self.to_python(value).scaleb(-self.decimal_places)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{
+            "max_digits": self.max_digits,
+            "decimal_places": self.decimal_places,
+            "form_class": forms.DecimalField,
+            **kwargs,
+        })
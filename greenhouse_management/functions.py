@@ -0,0 +1,16 @@
+from django.db.models import BigIntegerField, Func
+
+
+class EpochMilliseconds(Func):
+    """Milliseconds since the epoch of a datetime, computed by the database instead of building datetime objects."""
+
+    template = "CAST(EXTRACT(EPOCH FROM %(expressions)s) * 1000 AS BIGINT)"
+    output_field = BigIntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="CAST(ROUND((julianday(%(expressions)s) - 2440587.5) "
+                                                          "* 86400000) AS INTEGER)", **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="CAST(UNIX_TIMESTAMP(%(expressions)s) * 1000 AS SIGNED)",
+                           **extra_context)
@@ -2,6 +2,7 @@ import graphene
 from graphene_django import DjangoObjectType
 from graphql_jwt.decorators import login_required
 from greenhouse_management.exceptions import PermissionDenied
+from greenhouse_management.graphql.optimizer import optimize_queryset
 from greenhouse_management.graphql.GreenHouse import GreenHouseType
 from greenhouse_management.models import *
 
@@ -140,6 +141,8 @@ class DeviceQuery(graphene.ObjectType):
         request_user = info.context.user
 
         if request_user.is_superuser:
-            return Device.objects.all()
+            devices = Device.objects.all()
         else:
-            return Device.objects.filter(greenhouse__owner=request_user)
\ No newline at end of file
+            devices = Device.objects.filter(greenhouse__owner=request_user)
+
+        return optimize_queryset(devices, info)
\ No newline at end of file
@@ -1,15 +1,97 @@
+import base64
 import graphene
 from graphene_django import DjangoObjectType
 from graphql_jwt.decorators import login_required
+from greenhouse_management.aggregation import aggregate_environments
+from greenhouse_management.archive import archived_environments
+from greenhouse_management.buffer import get_buffer
+from greenhouse_management.current_environment import refresh_current_environment
 from greenhouse_management.exceptions import PermissionDenied
+from greenhouse_management.graphql import converters  # noqa: F401
+from greenhouse_management.graphql.optimizer import optimize_queryset
+from greenhouse_management.ingest import ingest_environments
 from greenhouse_management.models import *
+from greenhouse_management.rollups import rebuild_day_rollups
+from greenhouse_management.series import environment_series
+from django.conf import settings
 from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+ENVIRONMENTS_PAGE_SIZE = 1000
+
+
+def encode_cursor(environment):
+    value = f"{environment.date.isoformat()}|{environment.id}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        date, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        date, id = parse_datetime(date), int(id)
+    except (ValueError, UnicodeDecodeError):
+        date = None
+    if date is None:
+        raise Exception("Invalid cursor.")
+    return date, id
 
 
 class EnvironmentType(DjangoObjectType):
     class Meta:
         model = Environment
         fields = '__all__'
+    cursor = graphene.String()
+
+    def resolve_cursor(self, info):
+        return encode_cursor(self)
+
+
+class CurrentEnvironmentType(DjangoObjectType):
+    class Meta:
+        model = CurrentEnvironment
+        fields = '__all__'
+
+
+class BucketEnum(graphene.Enum):
+    MINUTE = "minute"
+    HOUR = "hour"
+    DAY = "day"
+
+
+class MetricEnum(graphene.Enum):
+    TEMPERATURE = "temperature"
+    AIR_HUMIDITY = "air_humidity"
+    LIGHT_LEVEL = "light_level"
+    PAR = "par"
+    CO2_LEVEL = "co2_level"
+    SOIL_MOISTURE_LEVEL = "soil_moisture_level"
+    SOIL_SALINITY = "soil_salinity"
+    SOIL_TEMPERATURE = "soil_temperature"
+    WEIGHT_OF_SOIL_AND_PLANTS = "weight_of_soil_and_plants"
+    STEM_MICRO_VARIABILITY = "stem_micro_variability"
+
+
+class MetricAggregateType(graphene.ObjectType):
+    metric = graphene.Field(MetricEnum)
+    min = graphene.Float()
+    max = graphene.Float()
+    avg = graphene.Float()
+
+
+class EnvironmentAggregateType(graphene.ObjectType):
+    bucket = graphene.DateTime()
+    count = graphene.Int()
+    metrics = graphene.List(MetricAggregateType)
+
+
+class MetricSeriesType(graphene.ObjectType):
+    metric = graphene.Field(MetricEnum)
+    values = graphene.List(graphene.Float)
+
+
+class EnvironmentSeriesType(graphene.ObjectType):
+    timestamps = graphene.List(graphene.Float, description="Milliseconds since the epoch")
+    metrics = graphene.List(MetricSeriesType)
 
 
 class EnvironmentInput(graphene.InputObjectType):
@@ -28,25 +110,64 @@ class EnvironmentInput(graphene.InputObjectType):
 
 
 class CreateEnvironment(graphene.Mutation):
-    """To create environment provide all parameters."""
+    """To create environment provide all parameters. Retrying returns the reading stored the first time.
+        With the write-behind buffer enabled the reading is only validated and 'buffered',
+        it is stored with the next batch and no 'environment' is returned."""
 
     class Arguments:
         input = EnvironmentInput(required=True)
 
     environment = graphene.Field(EnvironmentType)
+    buffered = graphene.Boolean()
 
     @classmethod
     #@login_required
     def mutate(cls, root, info, input):
-        try:
-            input["green_house"] = GreenHouse.objects.get(id=input.greenhouse)
-            del input["greenhouse"]
-        except GreenHouse.DoesNotExist:
-            raise Exception("Greenhouse with this credentials does not exist.")
+        buffer = get_buffer()
+        if buffer is not None:
+            environment, error = buffer.append(input)
+        else:
+            [(environment, error)] = ingest_environments([input])
+        if error:
+            raise Exception(error)
+
+        if buffer is not None:
+            # Not stored yet, without an id it can not be resolved as an EnvironmentType.
+            return CreateEnvironment(environment=None, buffered=True)
+        return CreateEnvironment(environment=environment, buffered=False)
+
+
+class EnvironmentIngestStatus(graphene.ObjectType):
+    index = graphene.Int()
+    success = graphene.Boolean()
+    duplicate = graphene.Boolean(description="The reading was stored before, e.g. by a retried request.")
+    error = graphene.String()
+    environment = graphene.Field(EnvironmentType)
+
+
+class CreateEnvironments(graphene.Mutation):
+    """To create many environments at once provide a list of readings, each with all parameters.
+        Valid readings are stored in a single transaction, 'statuses' reports the outcome of every reading.
+        Readings of a greenhouse and date stored before are not stored again and count as 'duplicates'."""
+
+    class Arguments:
+        input = graphene.List(graphene.NonNull(EnvironmentInput), required=True)
+
+    created = graphene.Int()
+    duplicates = graphene.Int()
+    statuses = graphene.List(EnvironmentIngestStatus)
 
-        environment = Environment.objects.create(**input)
-        environment.save()
-        return CreateEnvironment(environment=environment)
+    @classmethod
+    #@login_required
+    def mutate(cls, root, info, input):
+        statuses = [
+            EnvironmentIngestStatus(index=index, success=error is None, error=error, environment=environment,
+                                    duplicate=environment.duplicate if environment else None)
+            for index, (environment, error) in enumerate(ingest_environments(input))
+        ]
+        duplicates = sum(bool(status.duplicate) for status in statuses)
+        return CreateEnvironments(created=sum(status.success for status in statuses) - duplicates,
+                                  duplicates=duplicates, statuses=statuses)
 
 
 class DeleteEnvironment(graphene.Mutation):
@@ -63,6 +184,8 @@ class DeleteEnvironment(graphene.Mutation):
         environment = Environment.objects.get(pk=id)
         if info.context.user.is_superuser or info.context.user == environment.green_house.owner:
             environment.delete()
+            rebuild_day_rollups(environment.date, green_houses=[environment.green_house_id])
+            refresh_current_environment(environment.green_house_id)
         else:
             raise PermissionDenied
         return None
@@ -70,12 +193,43 @@ class DeleteEnvironment(graphene.Mutation):
 
 class EnvironmentMutation(graphene.ObjectType):
     create_environment = CreateEnvironment.Field()
+    create_environments = CreateEnvironments.Field()
     delete_environment = DeleteEnvironment.Field()
 
 
 class EnvironmentQuery(graphene.ObjectType):
     environment = graphene.Field(EnvironmentType, id=graphene.Int(required=True))
-    environments = graphene.List(EnvironmentType)
+    environments = graphene.List(
+        EnvironmentType,
+        greenhouse=graphene.Int(),
+        from_=graphene.DateTime(name="from"),
+        to=graphene.DateTime(),
+        first=graphene.Int(),
+        after=graphene.String(),
+        description="Readings ordered by date with from <= date < to. Pass the 'cursor' of the last "
+                    f"reading as 'after' to get the next page of at most 'first' ({ENVIRONMENTS_PAGE_SIZE}) readings. "
+                    "Deprecated: without 'first' and 'after' all readings are returned, an error when there are more "
+                    "than ENVIRONMENTS_UNPAGINATED_LIMIT.",
+    )
+    current_environment = graphene.Field(CurrentEnvironmentType, greenhouse=graphene.Int(required=True))
+    environment_aggregates = graphene.List(
+        EnvironmentAggregateType,
+        greenhouse=graphene.Int(required=True),
+        from_=graphene.DateTime(name="from"),
+        to=graphene.DateTime(),
+        bucket=BucketEnum(default_value=BucketEnum.HOUR),
+        metrics=graphene.List(graphene.NonNull(MetricEnum)),
+        description="Min, max and average of the metrics (all by default) per bucket of readings with from <= date < to.",
+    )
+    environment_series = graphene.Field(
+        EnvironmentSeriesType,
+        greenhouse=graphene.Int(required=True),
+        from_=graphene.DateTime(name="from"),
+        to=graphene.DateTime(),
+        metrics=graphene.List(graphene.NonNull(MetricEnum)),
+        description="Readings with from <= date < to as parallel arrays of timestamps and metric values (all by "
+                    "default), for charts. GET /series/environments/ returns the same as JSON or binary.",
+    )
 
     @login_required
     def resolve_environment(root, info, id):
@@ -93,11 +247,94 @@ class EnvironmentQuery(graphene.ObjectType):
             raise PermissionDenied
 
     @login_required
-    def resolve_environments(root, info):
+    def resolve_environments(root, info, greenhouse=None, from_=None, to=None, first=None, after=None):
         request_user = info.context.user
 
+        # Pages are capped. Unpaginated queries return every reading as they did before pagination,
+        # up to a limit: one more reading is fetched to tell whether there are more.
+        if first is not None and first < 0:
+            raise Exception("'first' must not be negative.")
+        paginated = first is not None or after is not None
+        if paginated and (first is None or first > ENVIRONMENTS_PAGE_SIZE):
+            first = ENVIRONMENTS_PAGE_SIZE
+        elif not paginated:
+            first = settings.ENVIRONMENTS_UNPAGINATED_LIMIT + 1
+
         if request_user.is_superuser:
-            return Environment.objects.all()
+            green_houses = GreenHouse.objects.all()
+            environments = Environment.objects.all()
+        else:
+            green_houses = GreenHouse.objects.filter(Q(owner=request_user) | Q(authorized_users=request_user))
+            environments = Environment.objects.filter(green_house__in=green_houses)
+
+        environments = environments.in_range(greenhouse, from_, to)
+        if greenhouse is not None:
+            green_houses = green_houses.filter(pk=greenhouse)
+
+        cursor = decode_cursor(after) if after else None
+        if cursor:
+            date, id = cursor
+            environments = environments.filter(Q(date__gt=date) | Q(date=date, id__gt=id))
+        environments = optimize_queryset(environments, info).order_by("date", "id")[:first]
+
+        # Readings moved to the cold archive are merged in, the page stays ordered by date and id.
+        archived = archived_environments(green_houses, from_, to, after=cursor, limit=first)
+        if archived:
+            environments = sorted([*archived, *environments], key=lambda environment: (environment.date, environment.id))
+        environments = environments[:first]
+        if not paginated and len(environments) == first:
+            raise Exception(f"More than {settings.ENVIRONMENTS_UNPAGINATED_LIMIT} readings, "
+                            "paginate with 'first' and 'after'.")
+        return environments
+
+    @login_required
+    def resolve_current_environment(root, info, greenhouse):
+        request_user = info.context.user
+
+        try:
+            current = CurrentEnvironment.objects.select_related("green_house").get(pk=greenhouse)
+        except CurrentEnvironment.DoesNotExist:
+            return None
+
+        green_house = current.green_house
+        if request_user.is_superuser or request_user == green_house.owner \
+                or green_house.authorized_users.filter(id=request_user.id).exists():
+            return current
         else:
-            return Environment.objects.filter(Q(green_house__owner=request_user) |
-                                              Q(green_house__authorized_users=request_user))
+            raise PermissionDenied
+
+    @login_required
+    def resolve_environment_aggregates(root, info, greenhouse, bucket, from_=None, to=None, metrics=None):
+        request_user = info.context.user
+
+        try:
+            green_house = GreenHouse.objects.get(pk=greenhouse)
+        except GreenHouse.DoesNotExist:
+            raise Exception("Greenhouse with this credentials does not exist.")
+
+        if not (request_user.is_superuser or request_user == green_house.owner
+                or green_house.authorized_users.filter(id=request_user.id).exists()):
+            raise PermissionDenied
+
+        metrics = [metric.value for metric in metrics] if metrics else Environment.METRICS
+        return aggregate_environments(green_house, from_, to, bucket.value, metrics)
+
+    @login_required
+    def resolve_environment_series(root, info, greenhouse, from_=None, to=None, metrics=None):
+        request_user = info.context.user
+
+        try:
+            green_house = GreenHouse.objects.get(pk=greenhouse)
+        except GreenHouse.DoesNotExist:
+            raise Exception("Greenhouse with this credentials does not exist.")
+
+        if not (request_user.is_superuser or request_user == green_house.owner
+                or green_house.authorized_users.filter(id=request_user.id).exists()):
+            raise PermissionDenied
+
+        metrics = [metric.value for metric in metrics] if metrics else Environment.METRICS
+        series = environment_series(green_house, from_, to, metrics)
+        return {
+            "timestamps": series["timestamps"],
+            "metrics": [{"metric": metric, "values": values} for metric, values in series["metrics"].items()],
+        }
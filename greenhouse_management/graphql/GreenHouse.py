@@ -3,17 +3,39 @@ from graphene_django import DjangoObjectType
 from graphql_jwt.decorators import login_required
 from graphene_django import DjangoObjectType
 from greenhouse_management.exceptions import PermissionDenied
+from greenhouse_management.graphql.loaders import get_loaders, load_relation
+from greenhouse_management.graphql.optimizer import optimize_queryset
 from greenhouse_management.graphql.Location import LocationType
 from greenhouse_management.graphql.User import UserType
 from greenhouse_management.models import *
 from django.db.models import Q
 
+NEGATIVE_RETENTION = "Raw retention days can not be negative."
+
 
 class GreenHouseType(DjangoObjectType):
     class Meta:
         model = GreenHouse
         fields = '__all__'
 
+    def resolve_owner(self, info):
+        return load_relation(info, self, "owner", self.owner_id)
+
+    def resolve_location(self, info):
+        return load_relation(info, self, "location", self.location_id)
+
+    def resolve_authorized_users(self, info):
+        return load_relation(info, self, "authorized_users", self.id)
+
+    def resolve_device_set(self, info):
+        return load_relation(info, self, "device_set", self.id)
+
+    def resolve_environment_set(self, info):
+        return load_relation(info, self, "environment_set", self.id)
+
+    def resolve_latest_environment(self, info):
+        return load_relation(info, self, "latest_environment", self.id)
+
 
 class CropTypeEnum(graphene.Enum):
     TOMATOES = "TT"
@@ -25,6 +47,9 @@ class GreenHouseInput(graphene.InputObjectType):
     crop_type = graphene.String()
     location = graphene.ID()
     authorized_users = graphene.List(graphene.ID)
+    raw_retention_days = graphene.Int(
+        description="Days raw readings are kept, 0 keeps none. Null uses ENVIRONMENT_RETENTION_DAYS."
+    )
 
 
 class CreateGreenHouse(graphene.Mutation):
@@ -47,12 +72,14 @@ class CreateGreenHouse(graphene.Mutation):
                 location = Location.objects.get(id=input.location, owner=request_user)
         except Location.DoesNotExist:
             raise Exception("Location with this credentials does not exist.")
-        
+        if input.raw_retention_days is not None and input.raw_retention_days < 0:
+            raise Exception(NEGATIVE_RETENTION)
 
         greenhouse = GreenHouse.objects.create(
             name=input.name,
             location=location,
-            owner=request_user
+            owner=request_user,
+            raw_retention_days=input.raw_retention_days
         )
 
         if input.crop_type in [e.value for e in CropTypeEnum]:
@@ -74,7 +101,7 @@ class CreateGreenHouse(graphene.Mutation):
     
 
 class UpdateGreenHouse(graphene.Mutation):
-    """To update greenhouse change 'name', 'crop_type', 'location, 'authorized_users' and 'owner'."""
+    """To update greenhouse change 'name', 'crop_type', 'location, 'authorized_users', 'owner' and 'raw_retention_days' (null for the default)."""
     class Arguments:
         input = GreenHouseInput(required=True)
         id = graphene.Int(required=True)
@@ -90,6 +117,11 @@ class UpdateGreenHouse(graphene.Mutation):
             greenhouse.name = input.name if input.name not in ['', None] else greenhouse.name
             greenhouse.crop_type = input.crop_type if input.crop_type not in ['', None, not CropTypeEnum] else greenhouse.crop_type
             greenhouse.owner = greenhouse.owner
+            # An explicit null goes back to the default, an omitted value keeps the current one.
+            if "raw_retention_days" in input:
+                if input.raw_retention_days is not None and input.raw_retention_days < 0:
+                    raise Exception(NEGATIVE_RETENTION)
+                greenhouse.raw_retention_days = input.raw_retention_days
 
             if input.location:
                 try:
@@ -112,9 +144,7 @@ class UpdateGreenHouse(graphene.Mutation):
                         greenhouse.authorized_users.add(user)
                     except CustomUser.DoesNotExist:
                         raise Exception("User with this credentials does not exist.")
-            else:
-                greenhouse.authorized_users = greenhouse.authorized_users
-                
+
             greenhouse.save()
         else:
             raise PermissionDenied
@@ -167,6 +197,10 @@ class GreenHouseQuery(graphene.ObjectType):
         request_user = info.context.user
 
         if request_user.is_superuser:
-            return GreenHouse.objects.all()
+            greenhouses = GreenHouse.objects.all()
         else:
-            return GreenHouse.objects.filter(Q(authorized_users=request_user))
+            greenhouses = GreenHouse.objects.filter(Q(authorized_users=request_user))
+
+        greenhouses = list(optimize_queryset(greenhouses, info))
+        get_loaders(info).prime_greenhouses(greenhouses)
+        return greenhouses
@@ -0,0 +1,102 @@
+import os
+import graphene
+from django.urls import reverse
+from graphene_django import DjangoObjectType
+from graphql_jwt.decorators import login_required
+from greenhouse_management import jobs
+from greenhouse_management.exceptions import PermissionDenied
+from greenhouse_management.models import *
+
+
+class JobType(DjangoObjectType):
+    class Meta:
+        model = Job
+        fields = ('id', 'kind', 'params', 'status', 'progress', 'result', 'error', 'attempts', 'max_attempts',
+                  'created_by', 'created_at', 'started_at', 'finished_at')
+    file_url = graphene.String(description="Download of the file written by a succeeded export job.")
+
+    def resolve_params(self, info):
+        # Import jobs read a file on the server, only its name is shown.
+        if "path" in self.params:
+            return {**self.params, "path": os.path.basename(self.params["path"])}
+        return self.params
+
+    def resolve_file_url(self, info):
+        if self.kind == Job.Kinds.EXPORT and self.status == Job.Statuses.SUCCEEDED:
+            return reverse('job_file', args=[self.pk])
+        return None
+
+
+def _isoformat(date):
+    return date.isoformat() if date else None
+
+
+class CreateExportJob(graphene.Mutation):
+    """To export readings in the background provide optional 'greenhouse', 'from', 'to' and 'gzip'."""
+
+    class Arguments:
+        greenhouse = graphene.Int()
+        from_ = graphene.DateTime(name="from")
+        to = graphene.DateTime()
+        gzip = graphene.Boolean()
+
+    job = graphene.Field(JobType)
+
+    @classmethod
+    @login_required
+    def mutate(cls, root, info, greenhouse=None, from_=None, to=None, gzip=False):
+        request_user = info.context.user
+        if greenhouse is not None:
+            try:
+                green_house = GreenHouse.objects.get(pk=greenhouse)
+            except GreenHouse.DoesNotExist:
+                raise Exception("Greenhouse with this credentials does not exist.")
+            if not (request_user.is_superuser or request_user == green_house.owner
+                    or green_house.authorized_users.filter(id=request_user.id).exists()):
+                raise PermissionDenied
+
+        job = jobs.enqueue(Job.Kinds.EXPORT, {
+            "greenhouse": greenhouse, "from": _isoformat(from_), "to": _isoformat(to), "gzip": bool(gzip),
+        }, user=request_user)
+        return CreateExportJob(job=job)
+
+
+class CreateRollupRebuildJob(graphene.Mutation):
+    """To rebuild rollups in the background provide optional 'from', 'to' and 'greenhouses'."""
+
+    class Arguments:
+        from_ = graphene.DateTime(name="from")
+        to = graphene.DateTime()
+        greenhouses = graphene.List(graphene.NonNull(graphene.Int))
+
+    job = graphene.Field(JobType)
+
+    @classmethod
+    @login_required
+    def mutate(cls, root, info, from_=None, to=None, greenhouses=None):
+        if not info.context.user.is_superuser:
+            raise PermissionDenied
+
+        job = jobs.enqueue(Job.Kinds.REBUILD_ROLLUPS, {
+            "from": _isoformat(from_), "to": _isoformat(to), "greenhouses": greenhouses,
+        }, user=info.context.user)
+        return CreateRollupRebuildJob(job=job)
+
+
+class JobMutation(graphene.ObjectType):
+    create_export_job = CreateExportJob.Field()
+    create_rollup_rebuild_job = CreateRollupRebuildJob.Field()
+
+
+class JobQuery(graphene.ObjectType):
+    job = graphene.Field(JobType, id=graphene.Int(required=True))
+
+    @login_required
+    def resolve_job(root, info, id):
+        try:
+            job = Job.objects.get(pk=id)
+        except Job.DoesNotExist:
+            raise Exception("Job with this credentials does not exist.")
+        if not (info.context.user.is_superuser or info.context.user == job.created_by):
+            raise PermissionDenied
+        return job
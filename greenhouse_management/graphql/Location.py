@@ -2,6 +2,7 @@ import graphene
 from graphene_django import DjangoObjectType
 from graphql_jwt.decorators import login_required
 from greenhouse_management.exceptions import PermissionDenied
+from greenhouse_management.graphql.optimizer import optimize_queryset
 from greenhouse_management.models import *
 
 
@@ -108,6 +109,8 @@ class LocationQuery(graphene.ObjectType):
         request_user = info.context.user
 
         if request_user.is_superuser:
-            return Location.objects.all()
+            locations = Location.objects.all()
         else:
-            return Location.objects.filter(owner=request_user)
+            locations = Location.objects.filter(owner=request_user)
+
+        return optimize_queryset(locations, info)
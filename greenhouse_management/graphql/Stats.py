@@ -0,0 +1,28 @@
+import graphene
+from graphql_jwt.decorators import login_required
+from greenhouse_management.exceptions import PermissionDenied
+from greenhouse_management.instrumentation import operation_stats
+
+
+class OperationStatsType(graphene.ObjectType):
+    operation = graphene.String()
+    count = graphene.Int()
+    avg_sql_count = graphene.Float()
+    max_sql_count = graphene.Int()
+    avg_sql_time = graphene.Float(description="Milliseconds")
+    avg_resolver_time = graphene.Float(description="Milliseconds")
+    avg_response_size = graphene.Float(description="Bytes")
+    p95_duration = graphene.Float(description="Milliseconds")
+
+
+class StatsQuery(graphene.ObjectType):
+    operation_stats = graphene.List(
+        OperationStatsType,
+        description="Costs of the latest requests handled by this process, per operation.",
+    )
+
+    @login_required
+    def resolve_operation_stats(root, info):
+        if not info.context.user.is_superuser:
+            raise PermissionDenied
+        return operation_stats.summary()
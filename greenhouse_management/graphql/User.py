@@ -3,6 +3,7 @@ from graphene_django import DjangoObjectType
 from graphql_jwt.decorators import login_required
 import graphql_jwt
 from greenhouse_management.exceptions import PermissionDenied
+from greenhouse_management.graphql.optimizer import optimize_queryset
 from greenhouse_management.models import *
 
 
@@ -199,9 +200,11 @@ class UserQuery(graphene.ObjectType):
         request_user = info.context.user
 
         if request_user.is_superuser:
-            return CustomUser.objects.all()
+            users = CustomUser.objects.all()
         else:
-            return CustomUser.objects.filter(is_active=True)
+            users = CustomUser.objects.filter(is_active=True)
+
+        return optimize_queryset(users, info)
 
     @login_required
     def resolve_authenticated_user(root, info):
@@ -0,0 +1,6 @@
+from graphene_django.converter import convert_django_field, convert_field_to_decimal
+
+from greenhouse_management.fields import FixedPointField
+
+# Fixed point metrics are exposed like the DecimalFields they replaced.
+convert_django_field.register(FixedPointField)(convert_field_to_decimal)
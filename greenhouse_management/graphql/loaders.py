@@ -0,0 +1,107 @@
+from collections import defaultdict
+
+from greenhouse_management.models import CurrentEnvironment, CustomUser, Device, Environment, GreenHouse, Location
+
+
+class Loader:
+    """
+    Request scoped cache that fetches the values of many keys with one call of 'batch_load'.
+
+    Keys announced with prime() are fetched together with the first key that is actually loaded,
+    so when a list resolver primes the keys of all its items, the relation costs one query for the whole list.
+    """
+
+    def __init__(self, batch_load, default=None):
+        self.batch_load = batch_load
+        self.default = default
+        self.cache = {}
+        self.pending = set()
+
+    def prime(self, keys):
+        self.pending.update(key for key in keys if key not in self.cache)
+
+    def load(self, key):
+        if key not in self.cache:
+            self.pending.add(key)
+            keys, self.pending = self.pending, set()
+            values = self.batch_load(keys)
+            for batch_key in keys:
+                self.cache[batch_key] = values.get(batch_key, self.default() if self.default else None)
+        return self.cache[key]
+
+
+def load_users(ids):
+    return CustomUser.objects.in_bulk(ids)
+
+
+def load_locations(ids):
+    return Location.objects.in_bulk(ids)
+
+
+def load_authorized_users(greenhouse_ids):
+    users = defaultdict(list)
+    memberships = (
+        GreenHouse.authorized_users.through.objects.filter(greenhouse_id__in=greenhouse_ids)
+        .select_related("customuser")
+        .order_by("customuser_id")
+    )
+    for membership in memberships:
+        users[membership.greenhouse_id].append(membership.customuser)
+    return users
+
+
+def load_devices(greenhouse_ids):
+    devices = defaultdict(list)
+    for device in Device.objects.filter(greenhouse_id__in=greenhouse_ids):
+        devices[device.greenhouse_id].append(device)
+    return devices
+
+
+def load_environments(greenhouse_ids):
+    environments = defaultdict(list)
+    for environment in Environment.objects.filter(green_house_id__in=greenhouse_ids):
+        environments[environment.green_house_id].append(environment)
+    return environments
+
+
+def load_current_environments(greenhouse_ids):
+    return CurrentEnvironment.objects.in_bulk(greenhouse_ids)
+
+
+class Loaders:
+    """Loaders of GreenHouse relations, named after the relations."""
+
+    def __init__(self):
+        self.owner = Loader(load_users)
+        self.location = Loader(load_locations)
+        self.authorized_users = Loader(load_authorized_users, list)
+        self.device_set = Loader(load_devices, list)
+        self.environment_set = Loader(load_environments, list)
+        self.latest_environment = Loader(load_current_environments)
+
+    def prime_greenhouses(self, greenhouses):
+        """Announce the relations of greenhouses that are about to be resolved."""
+        self.owner.prime(greenhouse.owner_id for greenhouse in greenhouses)
+        self.location.prime(greenhouse.location_id for greenhouse in greenhouses)
+        for loader in (self.authorized_users, self.device_set, self.environment_set, self.latest_environment):
+            loader.prime(greenhouse.id for greenhouse in greenhouses)
+
+
+def get_loaders(info):
+    """Loaders of the current request, created on first use."""
+    if not hasattr(info.context, "loaders"):
+        info.context.loaders = Loaders()
+    return info.context.loaders
+
+
+def load_relation(info, instance, name, key):
+    """
+    Value of relation 'name' of 'instance'. Relations already fetched with select_related or prefetch_related
+    are returned as they are, the others go through the loader of the relation.
+    """
+    if name in instance._state.fields_cache:
+        return instance._state.fields_cache[name]
+    prefetched = getattr(instance, "_prefetched_objects_cache", {})
+    if name in prefetched:
+        return list(prefetched[name])
+    return getattr(get_loaders(info), name).load(key)
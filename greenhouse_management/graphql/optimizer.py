@@ -0,0 +1,79 @@
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+
+def _collect(selection_set, info, selections):
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            if not selection.name.value.startswith("__"):
+                selections.setdefault(to_snake_case(selection.name.value), []).append(selection)
+        elif isinstance(selection, FragmentSpreadNode):
+            _collect(info.fragments[selection.name.value].selection_set, info, selections)
+        elif isinstance(selection, InlineFragmentNode):
+            _collect(selection.selection_set, info, selections)
+    return selections
+
+
+def _children(nodes, info):
+    selections = {}
+    for node in nodes:
+        if node.selection_set:
+            _collect(node.selection_set, info, selections)
+    return selections
+
+
+def _model_fields(model):
+    fields = {}
+    for field in model._meta.get_fields():
+        if field.auto_created and not field.concrete:
+            name = field.get_accessor_name()
+            if name:
+                fields[name] = field
+        else:
+            fields[field.name] = field
+    return fields
+
+
+def _plan(model, selections, info, prefix, only, select_related, prefetch_related):
+    fields = _model_fields(model)
+    # Primary and foreign keys are always loaded, resolvers and loaders rely on them.
+    loaded = {model._meta.pk.name} | {field.name for field in model._meta.concrete_fields if field.is_relation}
+    complete = True
+
+    for name, nodes in selections.items():
+        field = fields.get(name)
+        if field is None:
+            # Not a model field, its resolver may read anything from the instance.
+            complete = False
+        elif field.is_relation and field.concrete and (field.many_to_one or field.one_to_one):
+            select_related.append(prefix + name)
+            _plan(field.related_model, _children(nodes, info), info, f"{prefix}{name}__", only, select_related,
+                  prefetch_related)
+        elif field.is_relation:
+            queryset = optimize_queryset(field.related_model._default_manager.all(), info, _children(nodes, info))
+            prefetch_related.append(Prefetch(prefix + name, queryset=queryset))
+        else:
+            loaded.add(field.name)
+
+    if not complete:
+        loaded = {field.name for field in model._meta.concrete_fields}
+    only.extend(prefix + name for name in loaded)
+
+
+def optimize_queryset(queryset, info, selections=None):
+    """
+    Apply select_related, prefetch_related and only() to 'queryset' for the fields selected by the current
+    GraphQL field, so resolving the result takes one query per level of nested lists instead of one per object.
+    """
+    if selections is None:
+        selections = _children(info.field_nodes, info)
+
+    only, select_related, prefetch_related = [], [], []
+    _plan(queryset.model, selections, info, "", only, select_related, prefetch_related)
+
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset.only(*only)
@@ -1,4 +1,6 @@
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from graphql_jwt.testcases import JSONWebTokenTestCase
 from greenhouse_management.models import CustomUser, GreenHouse
 from greenhouse_management.models import Location
@@ -45,6 +47,22 @@ update_greenhouse = '''mutation updateMutation($name: String, $cropType: String,
                         }
                     }'''
 
+update_greenhouse_retention = '''mutation updateMutation($rawRetentionDays: Int, $id: Int!){
+                        updateGreenhouse(input: {rawRetentionDays: $rawRetentionDays}, id: $id){
+                            greenhouse{
+                                rawRetentionDays
+                            }
+                        }
+                    }'''
+
+update_greenhouse_name = '''mutation updateMutation($name: String, $id: Int!){
+                        updateGreenhouse(input: {name: $name}, id: $id){
+                            greenhouse{
+                                rawRetentionDays
+                            }
+                        }
+                    }'''
+
 delete_greenhouse = '''mutation deleteMutation($id: Int!){
                         deleteGreenhouse(id: $id){
                             greenhouse{
@@ -91,6 +109,17 @@ get_greenhouses = '''query {
                         }
                     }'''
 
+get_greenhouses_relations = '''query {
+                        greenhouses{
+                            name,
+                            owner { email },
+                            location { name },
+                            authorizedUsers { email },
+                            deviceSet { name },
+                            environmentSet { date }
+                        }
+                    }'''
+
 class GreenHouseTests(JSONWebTokenTestCase):
     def setUp(self):
         usual_user1 = CustomUser.objects.create_user(first_name="custom1", last_name="user1", password="njw#kncw22",
@@ -185,6 +214,18 @@ class GreenHouseTests(JSONWebTokenTestCase):
         }
 
 
+    def test_update_greenhouse_retention(self):
+        executed = self.client.execute(update_greenhouse_retention, {"id": 1, "rawRetentionDays": 0})
+        assert executed.data == {"updateGreenhouse": {"greenhouse": {"rawRetentionDays": 0}}}
+        executed = self.client.execute(update_greenhouse_name, {"id": 1, "name": "Renamed"})
+        assert executed.data == {"updateGreenhouse": {"greenhouse": {"rawRetentionDays": 0}}}
+        executed = self.client.execute(update_greenhouse_retention, {"id": 1, "rawRetentionDays": None})
+        assert executed.data == {"updateGreenhouse": {"greenhouse": {"rawRetentionDays": None}}}
+        executed = self.client.execute(update_greenhouse_retention, {"id": 1, "rawRetentionDays": -1})
+        assert executed.errors[0].message == "Raw retention days can not be negative."
+        assert GreenHouse.objects.get(pk=1).raw_retention_days is None
+
+
     def test_delete_greenhouse(self):
         variables = {
             "id": 2
@@ -275,3 +316,21 @@ class GreenHouseTests(JSONWebTokenTestCase):
                 ]
             }]
         }
+
+    def test_get_greenhouses_relations_are_batched(self):
+        with CaptureQueriesContext(connection) as two_greenhouses:
+            executed = self.client.execute(get_greenhouses_relations)
+        assert len(executed.data["greenhouses"]) == 2
+
+        owner = CustomUser.objects.get(email="def2@abc.com")
+        location = Location.objects.create(name="Warszawa", coordinates=(52.2297, 21.0122), owner=owner)
+        for number in range(3, 8):
+            greenhouse = GreenHouse.objects.create(name=f"TestGreenHouse{number}", location=location, owner=owner)
+            greenhouse.authorized_users.set([owner, self.user])
+
+        with CaptureQueriesContext(connection) as seven_greenhouses:
+            executed = self.client.execute(get_greenhouses_relations)
+        assert len(executed.data["greenhouses"]) == 7
+        assert executed.data["greenhouses"][6]["authorizedUsers"] == [{"email": "def2@abc.com"},
+                                                                      {"email": "default@abc.com"}]
+        assert len(seven_greenhouses) == len(two_greenhouses)
@@ -1,4 +1,6 @@
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from graphql_jwt.testcases import JSONWebTokenTestCase
 from greenhouse_management.models import *
 
@@ -58,6 +60,18 @@ get_devices = '''query{
                   }
                 }'''
 
+get_devices_nested = '''query{
+                  devices{
+                    name,
+                    greenhouse{
+                      name,
+                      owner{ email },
+                      location{ name, coordinates },
+                      authorizedUsers{ email }
+                    }
+                  }
+                }'''
+
 
 class SuperUserTests(JSONWebTokenTestCase):
     def setUp(self):
@@ -162,4 +176,19 @@ class SuperUserTests(JSONWebTokenTestCase):
                     "name": "TestGreenHouse2"
                 }
             }]
-        }
\ No newline at end of file
+        }
+
+    def test_get_devices_query_count(self):
+        with CaptureQueriesContext(connection) as two_devices:
+            executed = self.client.execute(get_devices_nested)
+        assert len(executed.data["devices"]) == 2
+
+        greenhouse = GreenHouse.objects.get(name="TestGreenHouse2")
+        Device.objects.bulk_create(Device(name=f"test{number}", greenhouse=greenhouse) for number in range(3, 10))
+
+        with CaptureQueriesContext(connection) as nine_devices:
+            executed = self.client.execute(get_devices_nested)
+        assert len(executed.data["devices"]) == 9
+        assert executed.data["devices"][8]["greenhouse"]["location"] == {"name": "Bialystok",
+                                                                         "coordinates": "42.12345, -71.98765"}
+        assert len(nine_devices) == len(two_devices)
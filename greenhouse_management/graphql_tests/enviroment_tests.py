@@ -1,4 +1,10 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import tempfile
 from django.contrib.auth import get_user_model
+from django.test import override_settings
+from greenhouse_management.archive import archive_environments
+from greenhouse_management.graphql.Enviroment import ENVIRONMENTS_PAGE_SIZE
 from graphql_jwt.testcases import JSONWebTokenTestCase
 from greenhouse_management.models import *
 
@@ -21,6 +27,35 @@ create_environment = '''mutation createEnvironment($greenhouse: Int!, $date: Dat
     }
 }'''
 
+create_environments = '''mutation createEnvironments($input: [EnvironmentInput!]!){
+    createEnvironments(input: $input){
+        created,
+        statuses{
+            index,
+            success,
+            error,
+            environment{
+                date,
+                temperature
+            }
+        }
+    }
+}'''
+
+create_environments_duplicates = '''mutation createEnvironments($input: [EnvironmentInput!]!){
+    createEnvironments(input: $input){
+        created,
+        duplicates,
+        statuses{
+            success,
+            duplicate,
+            environment{
+                temperature
+            }
+        }
+    }
+}'''
+
 delete_environment = '''mutation deleteEnvironment($id: Int!){
     deleteEnvironment(id: $id){
         environment{
@@ -71,6 +106,50 @@ get_environments = '''query {
     }
 }'''
 
+get_environments_page = '''query getEnvironments($greenhouse: Int, $from: DateTime, $to: DateTime, $first: Int, $after: String){
+    environments(greenhouse: $greenhouse, from: $from, to: $to, first: $first, after: $after){
+        date,
+        temperature,
+        cursor
+    }
+}'''
+
+get_environment_aggregates = '''query getEnvironmentAggregates($greenhouse: Int!, $from: DateTime, $to: DateTime, $bucket: BucketEnum, $metrics: [MetricEnum!]){
+    environmentAggregates(greenhouse: $greenhouse, from: $from, to: $to, bucket: $bucket, metrics: $metrics){
+        bucket,
+        count,
+        metrics{
+            metric,
+            min,
+            max,
+            avg
+        }
+    }
+}'''
+
+get_current_environment = '''query getCurrentEnvironment($greenhouse: Int!){
+    currentEnvironment(greenhouse: $greenhouse){
+        date,
+        temperature,
+        environmentId
+    }
+    greenhouses{
+        latestEnvironment{
+            date
+        }
+    }
+}'''
+
+get_environment_series = '''query getEnvironmentSeries($greenhouse: Int!, $from: DateTime, $metrics: [MetricEnum!]){
+    environmentSeries(greenhouse: $greenhouse, from: $from, metrics: $metrics){
+        timestamps,
+        metrics{
+            metric,
+            values
+        }
+    }
+}'''
+
 
 class EnvironmentTests(JSONWebTokenTestCase):
     def setUp(self):
@@ -126,6 +205,118 @@ class EnvironmentTests(JSONWebTokenTestCase):
             }
         }
 
+    @override_settings(INGEST_BUFFER_SIZE=2, INGEST_BUFFER_INTERVAL=timedelta(minutes=1))
+    def test_create_environment_buffered(self):
+        variables = {
+            "greenhouse": 1,
+            "date": "2023-01-01T12:00:00",
+            "temperature": 36.00,
+            "airHumidity": 120.00,
+            "lightLevel": 100.00,
+            "par": 200.00,
+            "co2Level": 40.00,
+            "soilMoistureLevel": 4.00,
+            "soilSalinity": 9.50,
+            "soilTemperature": 40.00,
+            "weightOfSoilAndPlants": 160.00,
+            "stemMicroVariability": 1.5,
+        }
+
+        create_buffered = '''mutation createEnvironment($input: EnvironmentInput!){
+            createEnvironment(input: $input){
+                environment{
+                    id
+                },
+                buffered
+            }
+        }'''
+        executed = self.client.execute(create_buffered, {"input": variables})
+        assert executed.errors is None
+        assert executed.data["createEnvironment"] == {"environment": None, "buffered": True}
+        assert Environment.objects.count() == 1
+
+        executed = self.client.execute(create_environment, {**variables, "date": "2023-01-01T12:01:00"})
+        assert executed.errors is None
+        assert Environment.objects.count() == 3
+
+    def test_create_environments(self):
+        reading = {
+            "greenhouse": 1,
+            "date": "2023-01-01T12:00:00+00:00",
+            "temperature": 36.00,
+            "airHumidity": 120.00,
+            "lightLevel": 100.00,
+            "par": 200.00,
+            "co2Level": 40.00,
+            "soilMoistureLevel": 4.00,
+            "soilSalinity": 9.50,
+            "soilTemperature": 40.00,
+            "weightOfSoilAndPlants": 160.00,
+            "stemMicroVariability": 1.5,
+        }
+        variables = {
+            "input": [
+                reading,
+                {**reading, "greenhouse": 2},
+                {**reading, "date": "2023-01-01T12:01:00+00:00", "temperature": 36.5},
+            ]
+        }
+
+        executed = self.client.execute(create_environments, variables)
+        assert executed.data == {
+            "createEnvironments": {
+                "created": 2,
+                "statuses": [{
+                    "index": 0,
+                    "success": True,
+                    "error": None,
+                    "environment": {"date": "2023-01-01T12:00:00+00:00", "temperature": "36"}
+                }, {
+                    "index": 1,
+                    "success": False,
+                    "error": "Greenhouse with this credentials does not exist.",
+                    "environment": None
+                }, {
+                    "index": 2,
+                    "success": True,
+                    "error": None,
+                    "environment": {"date": "2023-01-01T12:01:00+00:00", "temperature": "36.5"}
+                }]
+            }
+        }
+        assert Environment.objects.count() == 3
+
+    def test_create_environments_retry(self):
+        reading = {
+            "greenhouse": 1,
+            "date": "2023-01-01T12:00:00+00:00",
+            "temperature": 36.00,
+            "airHumidity": 120.00,
+            "lightLevel": 100.00,
+            "par": 200.00,
+            "co2Level": 40.00,
+            "soilMoistureLevel": 4.00,
+            "soilSalinity": 9.50,
+            "soilTemperature": 40.00,
+            "weightOfSoilAndPlants": 160.00,
+            "stemMicroVariability": 1.5,
+        }
+        self.client.execute(create_environments, {"input": [reading]})
+
+        executed = self.client.execute(create_environments_duplicates,
+                                       {"input": [{**reading, "temperature": 37}, reading]})
+        assert executed.data == {
+            "createEnvironments": {
+                "created": 0,
+                "duplicates": 1,
+                "statuses": [
+                    {"success": False, "duplicate": None, "environment": None},
+                    {"success": True, "duplicate": True, "environment": {"temperature": "36.00"}},
+                ]
+            }
+        }
+        assert Environment.objects.count() == 2
+
     def test_delete_environment(self):
         variables = {
             "id": 1
@@ -173,3 +364,158 @@ class EnvironmentTests(JSONWebTokenTestCase):
                 "stemMicroVariability": "0.20",
             }]
         }
+
+    def test_get_environments_page(self):
+        green_house = GreenHouse.objects.get(name="GreenHouse1")
+        for hour in range(13, 18):
+            Environment.objects.create(green_house=green_house, date=f"2023-01-02T{hour}:00:00+00:00",
+                                       temperature=hour, air_humidity=60.00, light_level=500.00, par=150.00,
+                                       co2_level=400.00, soil_moisture_level=40.00, soil_salinity=3.50,
+                                       soil_temperature=20.00, weight_of_soil_and_plants=150.00,
+                                       stem_micro_variability=0.20)
+        variables = {
+            "greenhouse": green_house.id,
+            "from": "2023-01-02T13:00:00+00:00",
+            "to": "2023-01-02T17:00:00+00:00",
+            "first": 3,
+        }
+
+        executed = self.client.execute(get_environments_page, variables)
+        page = executed.data["environments"]
+        assert [environment["temperature"] for environment in page] == ["13.00", "14.00", "15.00"]
+
+        executed = self.client.execute(get_environments_page, {**variables, "after": page[-1]["cursor"]})
+        assert [environment["temperature"] for environment in executed.data["environments"]] == ["16.00"]
+
+        executed = self.client.execute(get_environments_page, {**variables, "after": "invalid"})
+        assert executed.errors[0].message == "Invalid cursor."
+
+    @override_settings(ENVIRONMENTS_UNPAGINATED_LIMIT=ENVIRONMENTS_PAGE_SIZE + 1)
+    def test_get_environments_page_size(self):
+        green_house = GreenHouse.objects.get(name="GreenHouse1")
+        start = datetime(2023, 2, 1, tzinfo=timezone.utc)
+        Environment.objects.bulk_create(
+            Environment(green_house=green_house, date=start + timedelta(minutes=minute), temperature=20.00,
+                        air_humidity=60.00, light_level=500.00, par=150.00, co2_level=400.00,
+                        soil_moisture_level=40.00, soil_salinity=3.50, soil_temperature=20.00,
+                        weight_of_soil_and_plants=150.00, stem_micro_variability=0.20)
+            for minute in range(ENVIRONMENTS_PAGE_SIZE + 1)
+        )
+        variables = {"greenhouse": green_house.id, "from": "2023-02-01T00:00:00+00:00"}
+
+        executed = self.client.execute(get_environments_page, variables)
+        assert len(executed.data["environments"]) == ENVIRONMENTS_PAGE_SIZE + 1
+
+        executed = self.client.execute(get_environments_page, {**variables, "first": ENVIRONMENTS_PAGE_SIZE + 1})
+        assert len(executed.data["environments"]) == ENVIRONMENTS_PAGE_SIZE
+
+        with override_settings(ENVIRONMENTS_UNPAGINATED_LIMIT=ENVIRONMENTS_PAGE_SIZE):
+            executed = self.client.execute(get_environments_page, variables)
+        assert executed.errors[0].message == (f"More than {ENVIRONMENTS_PAGE_SIZE} readings, "
+                                              "paginate with 'first' and 'after'.")
+
+    def test_get_environments_page_with_archive(self):
+        green_house = GreenHouse.objects.get(name="GreenHouse1")
+        for day in (1, 3, 5, 35, 36):
+            Environment.objects.create(green_house=green_house, date=datetime(2023, 1, 1, tzinfo=timezone.utc) +
+                                       timedelta(days=day), temperature=day, air_humidity=60.00, light_level=500.00,
+                                       par=150.00, co2_level=400.00, soil_moisture_level=40.00, soil_salinity=3.50,
+                                       soil_temperature=20.00, weight_of_soil_and_plants=150.00,
+                                       stem_micro_variability=0.20)
+        with tempfile.TemporaryDirectory() as archive_root, \
+                override_settings(ARCHIVE_ROOT=Path(archive_root), ENVIRONMENT_ARCHIVE_AFTER_DAYS=1):
+            archive_environments(datetime(2023, 2, 10, tzinfo=timezone.utc))
+            assert Environment.objects.count() == 2
+
+            variables = {"greenhouse": green_house.id, "from": "2023-01-02T00:00:00+00:00", "first": 3}
+            executed = self.client.execute(get_environments_page, variables)
+            page = executed.data["environments"]
+            assert [environment["temperature"] for environment in page] == ["1.00", "25.00", "3.00"]
+
+            executed = self.client.execute(get_environments_page, {**variables, "after": page[-1]["cursor"]})
+            assert [environment["temperature"] for environment in executed.data["environments"]] == [
+                "5.00", "35.00", "36.00"
+            ]
+
+    def test_get_environment_aggregates(self):
+        green_house = GreenHouse.objects.get(name="GreenHouse1")
+        for minute, temperature in [(10, 20.00), (40, 30.00), (70, 10.00)]:
+            Environment.objects.create(green_house=green_house, date=datetime(2023, 1, 3, tzinfo=timezone.utc) +
+                                       timedelta(minutes=minute), temperature=temperature, air_humidity=60.00,
+                                       light_level=500.00, par=150.00, co2_level=400.00, soil_moisture_level=40.00,
+                                       soil_salinity=3.50, soil_temperature=20.00, weight_of_soil_and_plants=150.00,
+                                       stem_micro_variability=0.20)
+        variables = {
+            "greenhouse": green_house.id,
+            "from": "2023-01-03T00:00:00+00:00",
+            "bucket": "HOUR",
+            "metrics": ["TEMPERATURE"],
+        }
+
+        executed = self.client.execute(get_environment_aggregates, variables)
+        assert executed.data == {
+            "environmentAggregates": [{
+                "bucket": "2023-01-03T00:00:00+00:00",
+                "count": 2,
+                "metrics": [{"metric": "TEMPERATURE", "min": 20.0, "max": 30.0, "avg": 25.0}]
+            }, {
+                "bucket": "2023-01-03T01:00:00+00:00",
+                "count": 1,
+                "metrics": [{"metric": "TEMPERATURE", "min": 10.0, "max": 10.0, "avg": 10.0}]
+            }]
+        }
+
+        executed = self.client.execute(get_environment_aggregates, {**variables, "bucket": "DAY", "metrics": None})
+        [day] = executed.data["environmentAggregates"]
+        assert day["count"] == 3
+        assert len(day["metrics"]) == len(Environment.METRICS)
+
+    def test_get_current_environment(self):
+        green_house = GreenHouse.objects.get(name="GreenHouse1")
+        green_house.authorized_users.add(self.user)
+        executed = self.client.execute(get_current_environment, {"greenhouse": green_house.id})
+        assert executed.data == {
+            "currentEnvironment": {"date": "2023-01-02T12:00:00+00:00", "temperature": "25.00", "environmentId": 1},
+            "greenhouses": [{"latestEnvironment": {"date": "2023-01-02T12:00:00+00:00"}}],
+        }
+
+        reading = {
+            "greenhouse": green_house.id, "temperature": 30, "airHumidity": 60, "lightLevel": 500, "par": 150,
+            "co2Level": 400, "soilMoistureLevel": 40, "soilSalinity": 3.5, "soilTemperature": 20,
+            "weightOfSoilAndPlants": 150, "stemMicroVariability": 0.2,
+        }
+        self.client.execute(create_environments, {"input": [
+            {**reading, "date": "2023-01-03T12:00:00+00:00"},
+            {**reading, "date": "2023-01-01T12:00:00+00:00", "temperature": 10},
+        ]})
+        # Readings are stored in date order, not in the order of the input.
+        latest = Environment.objects.get(green_house=green_house, date=datetime(2023, 1, 3, 12, tzinfo=timezone.utc))
+        executed = self.client.execute(get_current_environment, {"greenhouse": green_house.id})
+        assert executed.data["currentEnvironment"] == {"date": "2023-01-03T12:00:00+00:00", "temperature": "30.00",
+                                                       "environmentId": latest.id}
+
+        self.client.execute(delete_environment, {"id": latest.id})
+        executed = self.client.execute(get_current_environment, {"greenhouse": green_house.id})
+        assert executed.data["currentEnvironment"]["environmentId"] == 1
+
+    def test_get_environment_series(self):
+        green_house = GreenHouse.objects.get(name="GreenHouse1")
+        for minute, temperature in [(10, 20.25), (40, 30.50)]:
+            Environment.objects.create(green_house=green_house, date=datetime(2023, 1, 3, tzinfo=timezone.utc) +
+                                       timedelta(minutes=minute), temperature=temperature, air_humidity=60.00,
+                                       light_level=500.00, par=150.00, co2_level=400.00, soil_moisture_level=40.00,
+                                       soil_salinity=3.50, soil_temperature=20.00, weight_of_soil_and_plants=150.00,
+                                       stem_micro_variability=0.20)
+        variables = {"greenhouse": green_house.id, "from": "2023-01-03T00:00:00+00:00",
+                     "metrics": ["TEMPERATURE", "PAR"]}
+
+        executed = self.client.execute(get_environment_series, variables)
+        assert executed.data == {
+            "environmentSeries": {
+                "timestamps": [1672704600000.0, 1672706400000.0],
+                "metrics": [
+                    {"metric": "TEMPERATURE", "values": [20.25, 30.5]},
+                    {"metric": "PAR", "values": [150.0, 150.0]},
+                ],
+            }
+        }
@@ -0,0 +1,89 @@
+import json
+from django.contrib.auth import get_user_model
+from graphql_jwt.testcases import JSONWebTokenTestCase
+from greenhouse_management.models import *
+
+get_job = '''query($id: Int!){
+              job(id: $id){
+                kind,
+                status,
+                progress,
+                fileUrl
+              }
+            }'''
+
+get_job_params = '''query($id: Int!){
+                     job(id: $id){
+                       params
+                     }
+                   }'''
+
+create_export_job = '''mutation($greenhouse: Int){
+                         createExportJob(greenhouse: $greenhouse){
+                           job{
+                             kind,
+                             status,
+                             params
+                           }
+                         }
+                       }'''
+
+create_rollup_rebuild_job = '''mutation{
+                                 createRollupRebuildJob{
+                                   job{
+                                     kind
+                                   }
+                                 }
+                               }'''
+
+
+class JobTests(JSONWebTokenTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(first_name="Jane", last_name="Doe", password="F3d3w8ddf",
+                                                         email="default@abc.com")
+        self.other_user = get_user_model().objects.create_user(first_name="John", last_name="Doe",
+                                                               password="F3d3w8ddf", email="other@abc.com")
+        location = Location.objects.create(name="Bialystok", coordinates=(42.12345, -71.98765), owner=self.user)
+        self.greenhouse = GreenHouse.objects.create(name="TestGreenHouse1", location=location, owner=self.user)
+        self.client.authenticate(self.user)
+
+    def test_create_export_job(self):
+        executed = self.client.execute(create_export_job, {"greenhouse": self.greenhouse.id})
+        assert executed.errors is None
+        job = executed.data["createExportJob"]["job"]
+        assert job["kind"] == "EXPORT"
+        assert job["status"] == "QUEUED"
+
+    def test_create_export_job_of_other_greenhouse(self):
+        self.client.authenticate(self.other_user)
+        executed = self.client.execute(create_export_job, {"greenhouse": self.greenhouse.id})
+        assert executed.errors[0].message == "You do not have the required permissions to perform this action"
+        assert not Job.objects.exists()
+
+    def test_create_rollup_rebuild_job(self):
+        executed = self.client.execute(create_rollup_rebuild_job)
+        assert executed.errors[0].message == "You do not have the required permissions to perform this action"
+
+    def test_job(self):
+        job = Job.objects.create(kind=Job.Kinds.EXPORT, status=Job.Statuses.SUCCEEDED, progress=1,
+                                 created_by=self.user)
+        executed = self.client.execute(get_job, {"id": job.id})
+        assert executed.data == {
+            "job": {
+                "kind": "EXPORT",
+                "status": "SUCCEEDED",
+                "progress": 1.0,
+                "fileUrl": f"/jobs/{job.id}/file/"
+            }
+        }
+
+        self.client.authenticate(self.other_user)
+        executed = self.client.execute(get_job, {"id": job.id})
+        assert executed.errors[0].message == "You do not have the required permissions to perform this action"
+
+    def test_import_job_path_is_not_shown(self):
+        job = Job.objects.create(kind=Job.Kinds.IMPORT, params={"path": "/srv/imports/readings.ndjson",
+                                                                 "format": "ndjson"}, created_by=self.user)
+        executed = self.client.execute(get_job_params, {"id": job.id})
+        assert executed.errors is None
+        assert json.loads(executed.data["job"]["params"]) == {"path": "readings.ndjson", "format": "ndjson"}
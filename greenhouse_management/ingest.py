@@ -0,0 +1,315 @@
+import csv
+import json
+from copy import copy
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError, transaction
+from django.utils import timezone
+
+from greenhouse_management import metrics
+from greenhouse_management.archive import archived_environments, archives_in_range, from_milliseconds
+from greenhouse_management.codec import CodecError, read_readings
+from greenhouse_management.current_environment import update_current_environments
+from greenhouse_management.models import Environment, GreenHouse
+from greenhouse_management.rollups import update_rollups
+
+INGEST_BATCH_SIZE = 1000
+INGEST_ATTEMPTS = 3
+MAX_REPORTED_ERRORS = 100
+GREENHOUSE_DOES_NOT_EXIST = "Greenhouse with this credentials does not exist."
+CONFLICTING_READING = "Another reading of this greenhouse with other values is stored for this date."
+INVALID_UTF8 = "Invalid UTF-8"
+MICROSECOND = timedelta(microseconds=1)
+# SQLSTATE of the transaction PostgreSQL aborts to break a deadlock.
+DEADLOCK_DETECTED = "40P01"
+
+
+def _greenhouse_id(reading):
+    try:
+        return int(reading.get("greenhouse"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _metric_value(metric, value):
+    """
+    Round a metric value to the decimal places of its column, as the database would when storing it.
+    Floats (also the ones graphene turned into Decimals) rarely have an exact two-decimal representation.
+    Values too long to round are returned as they are, for clean_fields() to report.
+    """
+    if isinstance(value, float):
+        value = repr(value)
+    if isinstance(value, str):
+        try:
+            value = Decimal(value)
+        except InvalidOperation:
+            return value
+    places = Environment._meta.get_field(metric).decimal_places
+    if isinstance(value, Decimal) and value.is_finite() and value.as_tuple().exponent < -places:
+        try:
+            value = value.quantize(Decimal(10) ** -places)
+        except InvalidOperation:
+            pass
+    return value
+
+
+def _format_validation_error(error):
+    if hasattr(error, "message_dict"):
+        return "; ".join(f"{field}: {' '.join(messages)}" for field, messages in error.message_dict.items())
+    return " ".join(error.messages)
+
+
+def _reading_key(environment):
+    date = environment.date
+    return environment.green_house_id, timezone.make_aware(date) if timezone.is_naive(date) else date
+
+
+def _stored_environments(environments):
+    """
+    The already stored readings with the greenhouse and date of one of 'environments', by their key.
+    Readings of archived months are looked up in the archives that can hold them.
+    """
+    keys = {_reading_key(environment) for environment in environments}
+    stored = Environment.objects.filter(
+        green_house_id__in={green_house_id for green_house_id, date in keys},
+        date__in={date for green_house_id, date in keys},
+    )
+    found = {_reading_key(environment): environment for environment in stored}
+
+    first, last = min(date for green_house_id, date in keys), max(date for green_house_id, date in keys)
+    bounds = {}
+    for archive in archives_in_range({green_house_id for green_house_id, date in keys}, first, last + MICROSECOND):
+        dates = [date for green_house_id, date in keys
+                 if green_house_id == archive.green_house_id and archive.first_date <= date <= archive.last_date]
+        if dates:
+            dates.extend(bounds.get(archive.green_house_id, ()))
+            bounds[archive.green_house_id] = min(dates), max(dates)
+    for green_house_id, (low, high) in bounds.items():
+        for environment in archived_environments([green_house_id], low, high + MICROSECOND):
+            key = _reading_key(environment)
+            if key in keys:
+                found.setdefault(key, environment)
+    return found
+
+
+def _is_deadlock(error):
+    cause = error.__cause__
+    # psycopg2 and psycopg 3 name the SQLSTATE differently.
+    return getattr(cause, "pgcode", None) == DEADLOCK_DETECTED or getattr(cause, "sqlstate", None) == DEADLOCK_DETECTED
+
+
+def _same_values(environment, other):
+    return all(getattr(environment, metric) == getattr(other, metric) for metric in Environment.METRICS)
+
+
+def reading_greenhouses(readings):
+    """The greenhouses the readings refer to, by id, with a single query."""
+    return GreenHouse.objects.in_bulk({_greenhouse_id(reading) for reading in readings} - {None})
+
+
+def validate_reading(reading, greenhouses):
+    """
+    An unsaved Environment for a reading of one of 'greenhouses' (a dict by id),
+    as an (environment, error) pair where exactly one of the pair is None.
+    """
+    green_house = greenhouses.get(_greenhouse_id(reading))
+    if green_house is None:
+        return None, GREENHOUSE_DOES_NOT_EXIST
+
+    environment = Environment(
+        green_house=green_house,
+        date=reading.get("date"),
+        **{metric: _metric_value(metric, reading.get(metric)) for metric in Environment.METRICS},
+    )
+    try:
+        environment.clean_fields(exclude=["green_house"])
+    except ValidationError as error:
+        return None, _format_validation_error(error)
+    except TypeError:
+        # Values of the wrong JSON type, e.g. a number as the date.
+        return None, "Reading has values of an invalid type."
+    return environment, None
+
+
+def ingest_environments(readings):
+    """
+    Validate a batch of environment readings and insert the valid ones with a single bulk_create.
+
+    Every reading is a mapping with a 'greenhouse' id, a 'date' and the metric values.
+    Greenhouses are resolved with one query for the whole batch.
+    A greenhouse has one reading per date: retried readings cost one indexed lookup for the whole batch
+    and are answered with the stored reading, in the table or archived, instead of being inserted again.
+    A reading with other values than the stored one of its greenhouse and date is refused as conflicting.
+    Readings, rollups and current environments are written in key order; a batch aborted to break a deadlock
+    with a concurrent one is retried.
+    Returns a list of (environment, error) pairs in the order of the readings,
+    where exactly one of the pair is None. Environments have 'duplicate' set when they were stored before.
+    """
+    readings = list(readings)
+    greenhouses = reading_greenhouses(readings)
+
+    results = []
+    candidates = {}
+    for reading in readings:
+        environment, error = validate_reading(reading, greenhouses)
+        results.append((environment, error))
+        if environment is not None:
+            # The first of several readings of the same greenhouse and date in a batch is stored.
+            candidates.setdefault(_reading_key(environment), environment)
+
+    environments = []
+    stored = {}
+    # A concurrent ingest may store some of the same readings in between, the loser probes again and retries.
+    for attempt in range(INGEST_ATTEMPTS):
+        stored = _stored_environments(candidates.values()) if candidates else {}
+        environments = [environment for key, environment in sorted(candidates.items()) if key not in stored]
+        try:
+            if environments:
+                with transaction.atomic():
+                    Environment.objects.bulk_create(environments)
+                    update_rollups(environments)
+                    update_current_environments(environments)
+            break
+        except IntegrityError:
+            if attempt == INGEST_ATTEMPTS - 1:
+                raise
+        except OperationalError as error:
+            if not _is_deadlock(error) or attempt == INGEST_ATTEMPTS - 1:
+                raise
+            # Ids given by the rolled back insert are not stored.
+            for environment in environments:
+                environment.pk = None
+                environment._state.adding = True
+
+    duplicates = 0
+    for index, (environment, error) in enumerate(results):
+        if error:
+            continue
+        original = stored.get(_reading_key(environment)) or candidates[_reading_key(environment)]
+        if original is environment:
+            environment.duplicate = False
+        elif _same_values(original, environment):
+            environment = copy(original)
+            environment.duplicate = True
+            duplicates += 1
+        else:
+            # Another reading of the greenhouse at that date, e.g. of a second device, is not dropped silently.
+            results[index] = (None, CONFLICTING_READING)
+            continue
+        results[index] = (environment, None)
+
+    metrics.observe_ingest(environments, len(readings) - len(environments) - duplicates, duplicates)
+    return results
+
+
+def ndjson_readings(stream):
+    """Yield (row number, reading, error) for every non-empty line of a NDJSON stream."""
+    number = 0
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        number += 1
+        try:
+            reading = json.loads(line, parse_float=Decimal)
+        except ValueError as error:
+            yield number, None, f"Invalid JSON: {error}"
+            continue
+        if not isinstance(reading, dict):
+            yield number, None, "Reading must be a JSON object."
+            continue
+        yield number, reading, None
+
+
+def csv_readings(stream):
+    """Yield (row number, reading, error) for every row of a CSV stream with a header line."""
+    # Undecodable bytes are kept as surrogates, to fail only the rows they are in.
+    lines = (line.decode("utf-8", "surrogateescape") for line in stream)
+    for number, reading in enumerate(csv.DictReader(lines), start=1):
+        if not all(is_utf8(text) for text in (*reading.keys(), *reading.values()) if isinstance(text, str)):
+            yield number, None, INVALID_UTF8
+            continue
+        yield number, {key: value if value != "" else None for key, value in reading.items()}, None
+
+
+def is_utf8(text):
+    """False for text decoded with 'surrogateescape' from bytes that are not UTF-8."""
+    try:
+        text.encode("utf-8")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def binary_readings(stream):
+    """
+    Yield (row number, reading, error) for every reading of a stream of codec.encode_readings() blocks,
+    with the metric columns in Environment.METRICS order. A corrupt block ends the stream with an error.
+    """
+    places = [Environment._meta.get_field(metric).decimal_places for metric in Environment.METRICS]
+    number = 0
+    try:
+        for green_house_id, timestamps, columns in read_readings(stream):
+            if len(columns) != len(Environment.METRICS):
+                raise CodecError(f"Block has {len(columns)} metric columns instead of {len(Environment.METRICS)}.")
+            for timestamp, *values in zip(timestamps, *columns):
+                number += 1
+                yield number, {
+                    "greenhouse": green_house_id, "date": from_milliseconds(timestamp),
+                    **{
+                        metric: Decimal(value).scaleb(-decimal_places)
+                        for metric, value, decimal_places in zip(Environment.METRICS, values, places)
+                    },
+                }, None
+    except CodecError as error:
+        yield number + 1, None, f"Invalid binary readings: {error}"
+
+
+# Parsers of the accepted upload formats, by name.
+READING_FORMATS = {"ndjson": ndjson_readings, "csv": csv_readings, "binary": binary_readings}
+
+
+def ingest_stream(rows, on_batch=None):
+    """
+    Store the (row number, reading, error) tuples of one of the READING_FORMATS parsers in batches
+    of INGEST_BATCH_SIZE readings, so memory use does not depend on the size of the stream.
+
+    'on_batch' is called with the summary so far after every batch.
+    Returns the number of 'created', 'duplicates' (stored before) and 'failed' readings
+    and the first MAX_REPORTED_ERRORS 'errors'.
+    """
+    summary = {"created": 0, "duplicates": 0, "failed": 0, "errors": []}
+    numbers = []
+    batch = []
+
+    def report(number, error):
+        summary["failed"] += 1
+        if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+            summary["errors"].append({"row": number, "error": error})
+
+    def flush():
+        for number, (environment, error) in zip(numbers, ingest_environments(batch)):
+            if error:
+                report(number, error)
+            elif environment.duplicate:
+                summary["duplicates"] += 1
+            else:
+                summary["created"] += 1
+        numbers.clear()
+        batch.clear()
+        if on_batch:
+            on_batch(summary)
+
+    for number, reading, error in rows:
+        if error:
+            report(number, error)
+            continue
+        numbers.append(number)
+        batch.append(reading)
+        if len(batch) >= INGEST_BATCH_SIZE:
+            flush()
+    flush()
+
+    return summary
@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from graphene_django.views import GraphQLView
+
+from greenhouse_management import metrics
+
+# Operations that can not be named after a root field of the schema.
+OTHER_OPERATION = "other"
+
+
+class RequestStats:
+    """SQL and resolver costs of one request."""
+
+    def __init__(self):
+        self.operation = None
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.resolver_time = 0.0
+        self.response_size = 0
+        self.duration = 0.0
+        self.errors = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper(), runs around every SQL statement.
+        began = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_count += 1
+            self.sql_time += time.perf_counter() - began
+
+    def extension(self):
+        """Costs known before the response is encoded, times in milliseconds."""
+        return {
+            "operation": self.operation,
+            "sqlCount": self.sql_count,
+            "sqlTime": round(self.sql_time * 1000, 3),
+            "resolverTime": round(self.resolver_time * 1000, 3),
+        }
+
+
+class OperationStatsTable:
+    """Rolling window of the latest request stats, summarized per operation."""
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def record(self, stats):
+        with self.lock:
+            self.samples.append(stats)
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+    def summary(self):
+        with self.lock:
+            samples = list(self.samples)
+
+        operations = {}
+        for stats in samples:
+            operations.setdefault(stats.operation, []).append(stats)
+
+        summary = []
+        for operation, group in sorted(operations.items()):
+            durations = sorted(stats.duration for stats in group)
+            summary.append({
+                "operation": operation,
+                "count": len(group),
+                "avg_sql_count": sum(stats.sql_count for stats in group) / len(group),
+                "max_sql_count": max(stats.sql_count for stats in group),
+                "avg_sql_time": sum(stats.sql_time for stats in group) / len(group) * 1000,
+                "avg_resolver_time": sum(stats.resolver_time for stats in group) / len(group) * 1000,
+                "avg_response_size": sum(stats.response_size for stats in group) / len(group),
+                "p95_duration": durations[max(int(len(durations) * 0.95) - 1, 0)] * 1000,
+            })
+        return summary
+
+
+operation_stats = OperationStatsTable(settings.GRAPHQL_STATS_WINDOW)
+
+
+class RequestStatsMiddleware:
+    """Django middleware counting SQL statements and time of every request into the rolling stats table
+    and the Prometheus metrics."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.stats = stats = RequestStats()
+        began = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+
+        stats.duration = time.perf_counter() - began
+        # Named after the URL pattern rather than the path, so ids in paths do not multiply the metric labels.
+        route = request.resolver_match.route if request.resolver_match else "unmatched"
+        stats.operation = stats.operation or f"{request.method} /{route}"
+        if not response.streaming:
+            stats.response_size = len(response.content)
+        operation_stats.record(stats)
+        metrics.observe_request(stats, response.status_code)
+        return response
+
+
+class ResolverTimingMiddleware:
+    """Graphene middleware adding the time spent in resolvers to the stats of the request,
+    and the latency of root fields to the Prometheus metrics.
+
+    The request is named after the root field it selects, e.g. 'query environments', as graphene resolves it:
+    the query is not parsed a second time. Client chosen operation names are not used, they would add a metric
+    label per name: the labels are bounded by the fields of the schema.
+    """
+
+    def resolve(self, next, root, info, **args):
+        stats = getattr(info.context, "stats", None)
+        if stats is None:
+            return next(root, info, **args)
+
+        if info.path.prev is None and info.field_name in info.parent_type.fields:
+            operation = info.operation.operation.value
+            label = f"{operation} {info.field_name}"
+            if stats.operation in (None, OTHER_OPERATION):
+                stats.operation = label
+            elif stats.operation != label:
+                stats.operation = f"{operation} multiple"
+
+        began = time.perf_counter()
+        try:
+            return next(root, info, **args)
+        finally:
+            elapsed = time.perf_counter() - began
+            stats.resolver_time += elapsed
+            if info.path.prev is None:
+                metrics.resolver_duration.labels(f"{info.parent_type.name}.{info.field_name}").observe(elapsed)
+
+
+class InstrumentedGraphQLView(GraphQLView):
+    """GraphQL view naming the request stats after the operation, and reporting them in the
+    'extensions' of the response when GRAPHQL_STATS_EXTENSION is enabled."""
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        stats = getattr(request, "stats", None)
+        if stats is not None:
+            # Until ResolverTimingMiddleware resolves a root field of the schema.
+            stats.operation = OTHER_OPERATION
+        return super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+
+    def json_encode(self, request, d, pretty=False):
+        stats = getattr(request, "stats", None)
+        if stats is not None and isinstance(d, dict):
+            stats.errors = len(d.get("errors") or ())
+        if settings.GRAPHQL_STATS_EXTENSION and stats is not None and isinstance(d, dict):
+            d = {**d, "extensions": {"stats": stats.extension()}}
+        return super().json_encode(request, d, pretty)
@@ -0,0 +1,229 @@
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Max, Min, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from greenhouse_management.archive import archive_environments, archived_count, archived_rows
+from greenhouse_management.export import EXPORT_CHUNK_SIZE, export_environments_csv, gzip_chunks, visible_green_houses
+from greenhouse_management.ingest import READING_FORMATS, ingest_stream
+from greenhouse_management.models import Environment, EnvironmentArchive, EnvironmentRollup, Job
+from greenhouse_management.retention import prune_environments
+from greenhouse_management.rollups import rebuild_rollups, truncate
+
+RETRY_DELAY = timedelta(seconds=30)
+CLAIM_CANDIDATES = 10
+WORKER_LOST = "The worker running the job stopped reporting progress."
+
+HANDLERS = {}
+# Jobs queued by the worker itself, with the setting holding the time between two runs.
+PERIODIC_JOBS = {
+    Job.Kinds.ARCHIVE_ENVIRONMENTS: "ENVIRONMENT_ARCHIVE_INTERVAL",
+    Job.Kinds.PRUNE_ENVIRONMENTS: "ENVIRONMENT_PRUNE_INTERVAL",
+}
+
+
+def job_handler(kind):
+    """Register the decorated function as the handler of jobs of 'kind', called with the job, returns its result."""
+    def register(handler):
+        HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def default_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(kind, params=None, user=None, max_attempts=3):
+    """Queue a job of 'kind' with the JSON serializable 'params' for the next free worker."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'.")
+    job = Job.objects.create(kind=kind, params=params or {}, created_by=user, max_attempts=max_attempts)
+    # Read back plain strings instead of the choices members the fields were given, e.g. for the GraphQL enums.
+    job.refresh_from_db()
+    return job
+
+
+def enqueue_periodic(now=None):
+    """Queue the periodic jobs that are not queued or running and were last queued longer than their interval ago."""
+    now = now or timezone.now()
+    queued = []
+    for kind, interval in PERIODIC_JOBS.items():
+        recent = Q(created_at__gt=now - getattr(settings, interval)) | Q(
+            status__in=[Job.Statuses.QUEUED, Job.Statuses.RUNNING]
+        )
+        if not Job.objects.filter(recent, kind=kind).exists():
+            queued.append(enqueue(kind))
+    return queued
+
+
+def claim(worker):
+    """
+    Take the next due job for 'worker', or None if there is nothing to do.
+
+    Queued jobs are handed out oldest first, as well as running jobs whose worker stopped reporting progress
+    for JOB_LOCK_TIMEOUT seconds, unless they used up their max_attempts: those failed, e.g. by crashing every
+    worker that ran them, and are marked so instead of being retried forever. Several workers may poll concurrently: a job is claimed with a conditional
+    UPDATE on the state it was read in, so only one of them wins it, the others move on to the next candidate.
+    """
+    now = timezone.now()
+    stale = Q(status=Job.Statuses.RUNNING, heartbeat_at__lt=now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT))
+    Job.objects.filter(stale, attempts__gte=F("max_attempts")).update(
+        status=Job.Statuses.FAILED, error=WORKER_LOST, finished_at=now,
+    )
+    due = Q(status=Job.Statuses.QUEUED, run_after__lte=now) | stale & Q(attempts__lt=F("max_attempts"))
+    candidates = Job.objects.filter(due).order_by("run_after", "id").values_list("id", "status", "heartbeat_at")
+    for pk, status, heartbeat_at in candidates[:CLAIM_CANDIDATES]:
+        claimed = Job.objects.filter(pk=pk, status=status, heartbeat_at=heartbeat_at).update(
+            status=Job.Statuses.RUNNING, worker=worker, started_at=now, heartbeat_at=now, attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def report_progress(job, progress):
+    """Record the progress (0 to 1) of a running job, which also tells other workers it is still alive."""
+    job.progress = min(max(progress, 0), 1)
+    job.heartbeat_at = timezone.now()
+    Job.objects.filter(pk=job.pk).update(progress=job.progress, heartbeat_at=job.heartbeat_at)
+
+
+def run(job):
+    """
+    Run a claimed job with its handler and store the outcome.
+
+    A failed job is queued again with an exponential backoff of RETRY_DELAY until it used up its max_attempts.
+    """
+    try:
+        result = HANDLERS[job.kind](job)
+    except Exception as error:
+        job.error = "".join(traceback.format_exception_only(type(error), error)).strip()
+        if job.attempts < job.max_attempts:
+            job.status = Job.Statuses.QUEUED
+            job.run_after = timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1)
+        else:
+            job.status = Job.Statuses.FAILED
+            job.finished_at = timezone.now()
+        job.save(update_fields=["status", "error", "run_after", "finished_at"])
+        return job
+
+    job.status = Job.Statuses.SUCCEEDED
+    job.progress = 1
+    job.result = result
+    job.error = ""
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "progress", "result", "error", "finished_at"])
+    return job
+
+
+def run_next(worker):
+    """Claim and run the next due job, returns it or None when the queue is empty."""
+    job = claim(worker)
+    return run(job) if job else None
+
+
+def _date_param(job, name):
+    value = job.params.get(name)
+    return parse_datetime(value) if value else None
+
+
+def export_path(job):
+    extension = "csv.gz" if job.params.get("gzip") else "csv"
+    return settings.JOBS_ROOT / f"export-{job.pk}.{extension}"
+
+
+@job_handler(Job.Kinds.EXPORT)
+def export_job(job):
+    """
+    Write the readings the job's creator can see as CSV to JOBS_ROOT, like the export endpoint.
+    Params: optional 'greenhouse', 'from', 'to' (ISO 8601) and 'gzip'.
+    """
+    if job.created_by is None:
+        raise ValueError("Export jobs need a user.")
+    green_house, start, end = job.params.get("greenhouse"), _date_param(job, "from"), _date_param(job, "to")
+    environments = Environment.objects.visible_to(job.created_by).in_range(green_house, start, end)
+    green_houses = visible_green_houses(job.created_by, green_house)
+    total = environments.count() + archived_count(green_houses, start, end)
+
+    def chunks():
+        # Every chunk after the header holds EXPORT_CHUNK_SIZE rows, only the last one may be shorter.
+        archived = archived_rows(green_houses, start, end)
+        for number, chunk in enumerate(export_environments_csv(environments, archived)):
+            if number:
+                report_progress(job, number * EXPORT_CHUNK_SIZE / total)
+            yield chunk
+
+    path = export_path(job)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as file:
+        for chunk in gzip_chunks(chunks()) if job.params.get("gzip") else chunks():
+            file.write(chunk)
+    return {"rows": total, "file": path.name, "size": path.stat().st_size}
+
+
+@job_handler(Job.Kinds.REBUILD_ROLLUPS)
+def rebuild_rollups_job(job):
+    """
+    Rebuild the rollups one UTC day at a time, so progress can be reported and a retry only repeats one day.
+    Params: optional 'from', 'to' (ISO 8601) and 'greenhouses', like the rebuild_rollups command.
+    """
+    green_houses = job.params.get("greenhouses")
+    start, end = _date_param(job, "from"), _date_param(job, "to")
+    if start is None or end is None:
+        environments = Environment.objects.all()
+        archives = EnvironmentArchive.objects.all()
+        if green_houses is not None:
+            environments = environments.filter(green_house__in=green_houses)
+            archives = archives.filter(green_house__in=green_houses)
+        bounds = [
+            environments.aggregate(first=Min("date"), last=Max("date")),
+            archives.aggregate(first=Min("first_date"), last=Max("last_date")),
+        ]
+        firsts = [bound["first"] for bound in bounds if bound["first"] is not None]
+        if not firsts:
+            return {"rows": 0}
+        start = start or min(firsts)
+        end = end or max(bound["last"] for bound in bounds if bound["last"] is not None) + timedelta(microseconds=1)
+
+    days = [truncate(start, EnvironmentRollup.Resolutions.DAY)]
+    while days[-1] + timedelta(days=1) < end:
+        days.append(days[-1] + timedelta(days=1))
+    written = 0
+    for number, day in enumerate(days, start=1):
+        written += rebuild_rollups(day, day + timedelta(days=1), green_houses)
+        report_progress(job, number / len(days))
+    return {"rows": written}
+
+
+@job_handler(Job.Kinds.IMPORT)
+def import_job(job):
+    """
+    Ingest a file of readings stored on the server.
+    Params: 'path', 'format' ('ndjson', 'csv' or 'binary') and 'delete' to remove the file once it was imported.
+    """
+    path = job.params["path"]
+    parse = READING_FORMATS[job.params.get("format", "ndjson")]
+    size = os.path.getsize(path) or 1
+    with open(path, "rb") as file:
+        summary = ingest_stream(parse(file), on_batch=lambda summary: report_progress(job, file.tell() / size))
+    if job.params.get("delete"):
+        os.remove(path)
+    return summary
+
+
+@job_handler(Job.Kinds.PRUNE_ENVIRONMENTS)
+def prune_environments_job(job):
+    """Enforce the raw data retention of every greenhouse, see retention.prune_environments."""
+    return prune_environments(on_progress=lambda progress: report_progress(job, progress))
+
+
+@job_handler(Job.Kinds.ARCHIVE_ENVIRONMENTS)
+def archive_environments_job(job):
+    """Move old raw readings to the cold archive, see archive.archive_environments."""
+    return archive_environments(on_progress=lambda progress: report_progress(job, progress))
@@ -0,0 +1,63 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from greenhouse_management.models import Environment, GreenHouse
+
+
+class Command(BaseCommand):
+    help = ("Time 'readings of greenhouse X between t1 and t2' queries on Environment. "
+            "Use --seed to generate synthetic readings first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0, help="Number of readings to generate before timing.")
+        parser.add_argument("--greenhouses", type=int, default=10, help="Number of greenhouses to seed readings for.")
+        parser.add_argument("--queries", type=int, default=200, help="Number of range queries to time.")
+        parser.add_argument("--window-hours", type=int, default=24, help="Width of every queried range.")
+
+    def handle(self, *args, **options):
+        if options["queries"] < 1:
+            raise CommandError("--queries must be at least 1.")
+        if options["seed"]:
+            if options["greenhouses"] < 1:
+                raise CommandError("--greenhouses must be at least 1.")
+            self.seed(options["seed"], options["greenhouses"])
+
+        bounds = Environment.objects.aggregate(start=Min("date"), end=Max("date"))
+        green_house_ids = list(GreenHouse.objects.filter(environment__isnull=False).distinct().values_list("id", flat=True))
+        if not green_house_ids:
+            raise CommandError("There are no readings to query, use --seed to generate some.")
+
+        window = timedelta(hours=options["window_hours"])
+        span = max((bounds["end"] - bounds["start"] - window).total_seconds(), 0)
+
+        timings = []
+        rows = 0
+        for _ in range(options["queries"]):
+            green_house_id = random.choice(green_house_ids)
+            start = bounds["start"] + timedelta(seconds=random.uniform(0, span))
+            queryset = Environment.objects.in_range(green_house_id, start, start + window).values_list("date", "temperature")
+
+            began = time.perf_counter()
+            rows += len(list(queryset))
+            timings.append(time.perf_counter() - began)
+
+        timings.sort()
+        self.stdout.write(f"readings: {Environment.objects.count()}, queries: {len(timings)}, "
+                          f"rows per query: {rows / len(timings):.1f}")
+        self.stdout.write(f"p50: {statistics.median(timings) * 1000:.2f} ms, "
+                          f"p95: {timings[int(len(timings) * 0.95) - 1] * 1000:.2f} ms, "
+                          f"max: {timings[-1] * 1000:.2f} ms")
+        self.stdout.write(Environment.objects.in_range(green_house_ids[0], bounds["start"], bounds["end"]).explain())
+
+    def seed(self, count, greenhouses):
+        # One reading per minute and greenhouse, the readings of seed_telemetry without its devices and rollups.
+        minutes = -(-count // greenhouses)
+        call_command("seed_telemetry", locations=1, greenhouses=greenhouses, devices=0, days=minutes / (24 * 60),
+                     interval=60, owner="benchmark@greenhouse.local", prefix="Benchmark", skip_rollups=True,
+                     stdout=self.stdout)
@@ -0,0 +1,109 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from greenhouse_management.backfill import (
+    BACKFILL_CHUNK_SIZE, Checkpoint, GreenHouseResolver, csv_chunks, csv_header, import_chunk, open_csv,
+)
+from greenhouse_management.ingest import MAX_REPORTED_ERRORS
+
+
+class Command(BaseCommand):
+    help = ("Import historical environment readings from CSV files (optionally gzip compressed) with a header line: "
+            "'date', the metrics and a 'greenhouse' id or name. Files are read in chunks, stored by parallel "
+            "worker processes and resumed after the last committed chunk when interrupted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+", help="CSV files to import.")
+        parser.add_argument("--greenhouse", default="",
+                            help="Greenhouse id or name of the rows without a 'greenhouse' value.")
+        parser.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE,
+                            help="Rows per chunk, the unit of work and of resuming.")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Processes storing chunks in parallel, on PostgreSQL.")
+        parser.add_argument("--timezone", default=settings.TIME_ZONE, help="Time zone of dates without an offset.")
+        parser.add_argument("--restart", action="store_true",
+                            help="Import from the first row even when a checkpoint of an earlier run exists.")
+
+    def handle(self, *args, **options):
+        try:
+            ZoneInfo(options["timezone"])
+        except (ZoneInfoNotFoundError, ValueError):
+            raise CommandError(f"Unknown time zone '{options['timezone']}'.")
+        if options["workers"] > 1 and connection.vendor == "sqlite":
+            # Concurrent transactions upgrading their read lock fail at once with 'database is locked'.
+            self.stderr.write("SQLite allows one writer at a time, importing with a single worker.")
+            options["workers"] = 1
+        for path in options["files"]:
+            self.import_file(path, options)
+
+    def import_file(self, path, options):
+        header = csv_header(path)
+        if "date" not in header:
+            raise CommandError(f"{path} has no 'date' column.")
+        if "greenhouse" not in header and not options["greenhouse"]:
+            raise CommandError(f"{path} has no 'greenhouse' column, set --greenhouse.")
+        column = header.index("greenhouse") if "greenhouse" in header else None
+
+        checkpoint = Checkpoint(f"{path}.checkpoint", path)
+        if options["restart"]:
+            checkpoint.rows = 0
+        elif checkpoint.rows:
+            self.stdout.write(f"{path}: resuming after row {checkpoint.rows}")
+        resolver = GreenHouseResolver()
+        totals = {"created": 0, "duplicates": 0, "failed": 0, "errors": []}
+        rows = 0
+        start = time.monotonic()
+
+        def chunk_arguments(first_row, chunk):
+            values = [
+                row[column] if column is not None and len(row) > column and row[column] else options["greenhouse"]
+                for row in chunk
+            ]
+            return first_row, header, chunk, resolver.resolve(values), options["timezone"]
+
+        def committed(first_row, count, summary):
+            nonlocal rows
+            checkpoint.commit(first_row, count)
+            rows += count
+            for key in ("created", "duplicates", "failed"):
+                totals[key] += summary[key]
+            totals["errors"].extend(summary["errors"][:MAX_REPORTED_ERRORS - len(totals["errors"])])
+            if options["verbosity"] > 0:
+                self.stdout.write(f"{path}: {rows} rows, {rows / (time.monotonic() - start):.0f} rows/s, "
+                                  f"committed up to row {checkpoint.rows}")
+
+        with open_csv(path) as stream:
+            chunks = csv_chunks(stream, options["chunk_size"], skip=checkpoint.rows)
+            if options["workers"] == 1:
+                for first_row, chunk in chunks:
+                    committed(first_row, len(chunk), import_chunk(*chunk_arguments(first_row, chunk)))
+            else:
+                # Spawned processes set Django up on their own, no database connection is inherited.
+                with ProcessPoolExecutor(options["workers"], mp_context=multiprocessing.get_context("spawn"),
+                                         initializer=django.setup) as pool:
+                    pending = {}
+                    for first_row, chunk in chunks:
+                        pending[pool.submit(import_chunk, *chunk_arguments(first_row, chunk))] = first_row, len(chunk)
+                        # At most two chunks per worker are read ahead.
+                        while len(pending) >= 2 * options["workers"]:
+                            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                committed(*pending.pop(future), future.result())
+                    for future in wait(pending).done:
+                        committed(*pending.pop(future), future.result())
+
+        checkpoint.remove()
+        elapsed = time.monotonic() - start
+        for error in totals["errors"]:
+            self.stderr.write(f"{path}: row {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{path}: {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s), "
+            f"created {totals['created']}, duplicates {totals['duplicates']}, failed {totals['failed']}"
+        ))
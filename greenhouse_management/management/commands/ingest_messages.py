@@ -0,0 +1,56 @@
+import signal
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from greenhouse_management.ingest import INGEST_BATCH_SIZE
+from greenhouse_management.messaging import (
+    DEFAULT_CLIENT_ID, DEFAULT_TOPICS, MESSAGE_QUEUE_SIZE, MessageIngestWorker, SocketSource, TopicResolver, message_source,
+)
+
+
+class Command(BaseCommand):
+    help = ("Store environment readings published to 'greenhouses/<id>/environment' or "
+            "'devices/<id>/environment' topics, read from an MQTT broker, a TCP socket or a file.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="mqtt://HOST[:PORT], tcp://HOST:PORT or file:PATH ('file:-' for stdin) "
+                                           "with 'topic payload' lines.")
+        parser.add_argument("--topic", action="append", dest="topics",
+                            help=f"Topic to subscribe to on a broker, repeatable. Defaults to {', '.join(DEFAULT_TOPICS)}.")
+        parser.add_argument("--client-id", default=DEFAULT_CLIENT_ID,
+                            help="MQTT client id whose session the broker keeps, one per running worker.")
+        parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="Readings per transaction.")
+        parser.add_argument("--max-delay", type=float, default=1,
+                            help="Seconds a received reading waits at most for its batch to fill up.")
+        parser.add_argument("--queue-size", type=int, default=MESSAGE_QUEUE_SIZE,
+                            help="Messages received ahead of the database before the source is paused.")
+        parser.add_argument("--cache-ttl", type=float, default=60, help="Seconds topic lookups are cached.")
+
+    def handle(self, *args, **options):
+        try:
+            source = message_source(options["source"], options["topics"] or DEFAULT_TOPICS, options["client_id"])
+        except (ValueError, ImproperlyConfigured) as error:
+            raise CommandError(error)
+        worker = MessageIngestWorker(source, options["batch_size"], options["max_delay"], options["queue_size"],
+                                     TopicResolver(options["cache_ttl"]))
+        if isinstance(source, SocketSource):
+            self.stdout.write("Listening on %s:%s" % source.address)
+        # Stopping the source lets the worker store what it received before exiting. Stopped from another
+        # thread, the source may be blocked on the full queue this thread is emptying.
+        handlers = {
+            signum: signal.signal(signum, lambda *args: threading.Thread(target=worker.stop).start())
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+
+        def report(summary):
+            if options["verbosity"] > 1:
+                self.stdout.write(", ".join(f"{key} {value}" for key, value in summary.items()))
+
+        try:
+            summary = worker.run(on_batch=report)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(", ".join(f"{key} {value}" for key, value in summary.items())))
@@ -0,0 +1,207 @@
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+from graphene.utils.str_converters import to_camel_case
+
+from greenhouse_management.telemetry import GreenHouseSimulator, solar
+
+REQUEST_TIMEOUT = 30
+
+token_auth = '''mutation($email: String!, $password: String!){
+                    tokenAuth(email: $email, password: $password){
+                        token
+                    }
+                }'''
+
+create_environment = '''mutation($input: EnvironmentInput!){
+                            createEnvironment(input: $input){
+                                environment { id }
+                            }
+                        }'''
+
+greenhouses = '''query {
+                    greenhouses {
+                        id, name,
+                        location { name },
+                        latestEnvironment { date, temperature, airHumidity }
+                    }
+                }'''
+
+current_environment = '''query($greenhouse: Int!){
+                            currentEnvironment(greenhouse: $greenhouse){
+                                date, temperature, airHumidity, par, co2Level, soilMoistureLevel
+                            }
+                        }'''
+
+environments = '''query($greenhouse: Int!, $from: DateTime!){
+                    environments(greenhouse: $greenhouse, from: $from){
+                        date, temperature, airHumidity, par
+                    }
+                }'''
+
+environment_aggregates = '''query($greenhouse: Int!, $from: DateTime!){
+                                environmentAggregates(greenhouse: $greenhouse, from: $from, bucket: HOUR){
+                                    bucket,
+                                    metrics { metric, min, max, avg }
+                                }
+                            }'''
+
+
+def percentile(timings, fraction):
+    return timings[min(int(len(timings) * fraction), len(timings) - 1)]
+
+
+class Results:
+    """Latencies and errors per operation, shared by all simulated clients."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.errors = {}
+        self.first_errors = {}
+
+    def record(self, operation, elapsed, error):
+        with self.lock:
+            self.timings.setdefault(operation, []).append(elapsed)
+            if error:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+                self.first_errors.setdefault(operation, error)
+
+    def report(self, duration):
+        lines = [f"{'operation':<24}{'requests':>10}{'req/s':>10}{'errors':>10}"
+                 f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+        with self.lock:
+            rows = sorted(self.timings.items())
+            rows.append(("total", [elapsed for _, timings in rows for elapsed in timings]))
+            for operation, timings in rows:
+                timings = sorted(timings)
+                errors = sum(self.errors.values()) if operation == "total" else self.errors.get(operation, 0)
+                if not timings:
+                    continue
+                lines.append(
+                    f"{operation:<24}{len(timings):>10}{len(timings) / duration:>10.1f}"
+                    f"{errors / len(timings):>10.2%}{percentile(timings, 0.5) * 1000:>10.1f}"
+                    f"{percentile(timings, 0.95) * 1000:>10.1f}{percentile(timings, 0.99) * 1000:>10.1f}"
+                )
+            lines.extend(f"first {operation} error: {error}" for operation, error in sorted(self.first_errors.items()))
+        return "\n".join(lines)
+
+
+class GraphQLClient:
+    def __init__(self, url, token=None):
+        self.url = url
+        self.token = token
+
+    def execute(self, query, variables=None):
+        """Returns the data of the response and the first error, if any."""
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"JWT {self.token}"
+        body = json.dumps({"query": query, "variables": variables or {}}).encode()
+        try:
+            with urlopen(Request(self.url, data=body, headers=headers), timeout=REQUEST_TIMEOUT) as response:
+                result = json.loads(response.read())
+        except (URLError, OSError, ValueError) as error:
+            return None, str(error)
+        if result.get("errors"):
+            return result.get("data"), result["errors"][0].get("message")
+        return result["data"], None
+
+
+class Command(BaseCommand):
+    help = ("Replay gateway and dashboard traffic against a running server: every gateway posts createEnvironment "
+            "readings of one greenhouse, every dashboard issues read queries. Reports throughput, latency "
+            "percentiles and error rates per operation.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://localhost:8000/graphql/", help="GraphQL endpoint of the server.")
+        parser.add_argument("--email", required=True, help="Email of the user the dashboards log in as.")
+        parser.add_argument("--password", required=True, help="Password of the user the dashboards log in as.")
+        parser.add_argument("--gateways", type=int, default=10, help="Number of simulated gateways.")
+        parser.add_argument("--dashboards", type=int, default=2, help="Number of simulated dashboards.")
+        parser.add_argument("--duration", type=float, default=30, help="Seconds to generate traffic for.")
+        parser.add_argument("--gateway-interval", type=float, default=1,
+                            help="Seconds between two readings of a gateway, 0 to post as fast as possible.")
+        parser.add_argument("--dashboard-interval", type=float, default=1,
+                            help="Seconds between two queries of a dashboard, 0 to query as fast as possible.")
+        parser.add_argument("--seed", type=int, help="Random seed of the generated readings.")
+
+    def handle(self, *args, **options):
+        client = GraphQLClient(options["url"])
+        data, error = client.execute(token_auth, {"email": options["email"], "password": options["password"]})
+        if error:
+            raise CommandError(f"Could not log in: {error}")
+        client.token = data["tokenAuth"]["token"]
+
+        data, error = client.execute(greenhouses)
+        if error:
+            raise CommandError(f"Could not list greenhouses: {error}")
+        green_house_ids = [int(green_house["id"]) for green_house in data["greenhouses"]]
+        if not green_house_ids:
+            raise CommandError("The user has no greenhouses to send readings for.")
+
+        results = Results()
+        stop = threading.Event()
+        rng = random.Random(options["seed"])
+        threads = [
+            threading.Thread(target=self.gateway, daemon=True, args=(
+                client, GreenHouseSimulator(green_house_ids[number % len(green_house_ids)],
+                                            timedelta(seconds=options["gateway_interval"] or 1),
+                                            random.Random(rng.random())),
+                options["gateway_interval"], results, stop,
+            ))
+            for number in range(options["gateways"])
+        ] + [
+            threading.Thread(target=self.dashboard, daemon=True, args=(
+                client, green_house_ids, options["dashboard_interval"], random.Random(rng.random()), results, stop,
+            ))
+            for _ in range(options["dashboards"])
+        ]
+
+        self.stdout.write(f"Running {options['gateways']} gateways and {options['dashboards']} dashboards "
+                          f"against {options['url']} for {options['duration']}s...")
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        stop.wait(options["duration"])
+        stop.set()
+        for thread in threads:
+            thread.join(REQUEST_TIMEOUT)
+        self.stdout.write(results.report(time.perf_counter() - began))
+
+    def request(self, client, operation, query, variables, results):
+        began = time.perf_counter()
+        _, error = client.execute(query, variables)
+        results.record(operation, time.perf_counter() - began, error)
+
+    def gateway(self, client, simulator, interval, results, stop):
+        while not stop.is_set():
+            date = datetime.now(timezone.utc)
+            variables = {"input": {
+                "greenhouse": simulator.green_house_id,
+                "date": date.isoformat(),
+                **{to_camel_case(metric): value for metric, value in simulator.reading(*solar(date)).items()},
+            }}
+            self.request(client, "createEnvironment", create_environment, variables, results)
+            stop.wait(interval)
+
+    def dashboard(self, client, green_house_ids, interval, rng, results, stop):
+        while not stop.is_set():
+            green_house_id = rng.choice(green_house_ids)
+            since = datetime.now(timezone.utc)
+            operation, query, variables = rng.choice((
+                ("greenhouses", greenhouses, {}),
+                ("currentEnvironment", current_environment, {"greenhouse": green_house_id}),
+                ("environments", environments,
+                 {"greenhouse": green_house_id, "from": (since - timedelta(hours=1)).isoformat()}),
+                ("environmentAggregates", environment_aggregates,
+                 {"greenhouse": green_house_id, "from": (since - timedelta(days=1)).isoformat()}),
+            ))
+            self.request(client, operation, query, variables, results)
+            stop.wait(interval)
@@ -0,0 +1,27 @@
+from argparse import ArgumentTypeError
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from greenhouse_management.rollups import rebuild_rollups
+
+
+def _date(value):
+    date = parse_datetime(value)
+    if date is None:
+        raise ArgumentTypeError(f"'{value}' is not a valid ISO 8601 date.")
+    return date
+
+
+class Command(BaseCommand):
+    help = "Recompute hourly and daily environment rollups of whole UTC days from the raw readings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", type=_date, help="First day to rebuild (ISO 8601).")
+        parser.add_argument("--to", dest="end", type=_date, help="End of the range to rebuild, exclusive (ISO 8601).")
+        parser.add_argument("--greenhouse", type=int, action="append", dest="green_houses",
+                            help="Greenhouse id to rebuild, can be given several times. Defaults to all greenhouses.")
+
+    def handle(self, *args, **options):
+        written = rebuild_rollups(options["start"], options["end"], options["green_houses"])
+        self.stdout.write(f"Rebuilt {written} rollup rows.")
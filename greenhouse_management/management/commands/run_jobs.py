@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from greenhouse_management.jobs import default_worker_name, enqueue_periodic, run_next
+from greenhouse_management.models import Job
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (exports, rollup rebuilds, imports), polling the database for new ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit as soon as no job is due instead of polling.")
+        parser.add_argument("--poll-interval", type=float, default=5, help="Seconds to wait when no job is due.")
+        parser.add_argument("--worker", default=default_worker_name(),
+                            help="Name of this worker, recorded on the jobs it runs. Defaults to host:pid.")
+        parser.add_argument("--no-periodic", action="store_true",
+                            help="Do not queue periodic jobs such as the retention prune, e.g. on extra workers.")
+
+    def handle(self, *args, **options):
+        while True:
+            if not options["no_periodic"]:
+                enqueue_periodic()
+            job = run_next(options["worker"])
+            if job is not None:
+                style = self.style.SUCCESS if job.status == Job.Statuses.SUCCEEDED else self.style.WARNING
+                self.stdout.write(style(f"{job}: attempt {job.attempts}/{job.max_attempts}"
+                                        + (f", {job.error}" if job.error else "")))
+                continue
+            if options["once"]:
+                return
+            close_old_connections()
+            time.sleep(options["poll_interval"])
@@ -0,0 +1,100 @@
+import random
+from argparse import ArgumentTypeError
+from datetime import timedelta
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import reset_queries
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from greenhouse_management.current_environment import refresh_current_environment
+from greenhouse_management.models import CustomUser, Device, Environment, GreenHouse, Location
+from greenhouse_management.rollups import rebuild_rollups
+from greenhouse_management.telemetry import generate_environments
+
+SEED_CHUNK_SIZE = 10000
+PROGRESS_EVERY = 1000000
+
+
+def _date(value):
+    date = parse_datetime(value)
+    if date is None:
+        raise ArgumentTypeError(f"'{value}' is not a valid ISO 8601 date.")
+    return date
+
+
+class Command(BaseCommand):
+    help = ("Create a fleet of locations, greenhouses and devices with synthetic but physically plausible "
+            "environment readings, streamed into the database in chunks.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--locations", type=int, default=10, help="Number of locations to create.")
+        parser.add_argument("--greenhouses", type=int, default=100, help="Number of greenhouses, spread over the locations.")
+        parser.add_argument("--devices", type=int, default=4, help="Number of devices per greenhouse.")
+        parser.add_argument("--days", type=float, default=30, help="Length of the generated time series.")
+        parser.add_argument("--interval", type=int, default=300, help="Seconds between two readings of a greenhouse.")
+        parser.add_argument("--start", type=_date, help="Date of the first readings (ISO 8601). "
+                                                        "Defaults to --days before now.")
+        parser.add_argument("--owner", default="telemetry@greenhouse.local", help="Email of the owner of the fleet.")
+        parser.add_argument("--prefix", default="Telemetry", help="Prefix of the names of the created objects.")
+        parser.add_argument("--chunk-size", type=int, default=SEED_CHUNK_SIZE, help="Readings per bulk_create.")
+        parser.add_argument("--seed", type=int, help="Random seed, for reproducible data.")
+        parser.add_argument("--skip-rollups", action="store_true",
+                            help="Do not rebuild rollups and current environments of the fleet afterwards.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        green_house_ids = self.create_fleet(options, rng)
+
+        interval = timedelta(seconds=options["interval"])
+        steps = int(timedelta(days=options["days"]) / interval)
+        start = options["start"] or timezone.now().replace(microsecond=0) - steps * interval
+        if timezone.is_naive(start):
+            start = timezone.make_aware(start)
+
+        readings = generate_environments(green_house_ids, start, interval, steps, seed=rng.random())
+        total = 0
+        while chunk := list(islice(readings, options["chunk_size"])):
+            Environment.objects.bulk_create(chunk)
+            # With DEBUG on, every statement is kept in connection.queries and would pile up.
+            reset_queries()
+            total += len(chunk)
+            if total // PROGRESS_EVERY != (total - len(chunk)) // PROGRESS_EVERY:
+                self.stdout.write(f"{total} readings...")
+        self.stdout.write(f"Seeded {total} readings for {len(green_house_ids)} greenhouses.")
+
+        if not options["skip_rollups"] and total:
+            written = rebuild_rollups(start, start + steps * interval, green_house_ids)
+            for green_house_id in green_house_ids:
+                refresh_current_environment(green_house_id)
+            self.stdout.write(f"Rebuilt {written} rollup rows.")
+
+    def create_fleet(self, options, rng):
+        prefix = options["prefix"]
+        owner, _ = CustomUser.objects.get_or_create(
+            email=options["owner"], defaults={"first_name": prefix, "last_name": "Owner"}
+        )
+        locations = Location.objects.bulk_create(
+            Location(name=f"{prefix} {number}", owner=owner,
+                     coordinates=(round(rng.uniform(-60, 60), 5), round(rng.uniform(-180, 180), 5)))
+            for number in range(max(options["locations"], 1))
+        )
+        green_houses = GreenHouse.objects.bulk_create(
+            GreenHouse(name=f"{prefix} {number}", crop_type=rng.choice(GreenHouse.CropTypes.values),
+                       location=locations[number % len(locations)], owner=owner)
+            for number in range(options["greenhouses"])
+        )
+        GreenHouse.authorized_users.through.objects.bulk_create(
+            GreenHouse.authorized_users.through(greenhouse_id=green_house.id, customuser_id=owner.id)
+            for green_house in green_houses
+        )
+        functionalities = Device.Functionality.values
+        Device.objects.bulk_create(
+            Device(name=f"{prefix} sensor {number}", greenhouse=green_house,
+                   functionality=functionalities[number % len(functionalities)])
+            for green_house in green_houses for number in range(options["devices"])
+        )
+        self.stdout.write(f"Created {len(locations)} locations, {len(green_houses)} greenhouses "
+                          f"and {len(green_houses) * options['devices']} devices.")
+        return [green_house.id for green_house in green_houses]
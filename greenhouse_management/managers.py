@@ -1,4 +1,5 @@
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import models
 from django.utils.translation import gettext_lazy as _
 
 
@@ -34,3 +35,28 @@ class CustomUserManager(BaseUserManager):
         if extra_fields.get('is_superuser') is not True:
             raise ValueError(_('Superuser must have is_superuser=True.'))
         return self.create_user(email, password, **extra_fields)
+
+
+class EnvironmentQuerySet(models.QuerySet):
+    def in_range(self, green_house=None, start=None, end=None):
+        """
+        Readings of one greenhouse (or of all greenhouses) with start <= date < end.
+        Both bounds are optional, the filter is served by the (green_house, date) and (date) indexes.
+        """
+        queryset = self
+        if green_house is not None:
+            queryset = queryset.filter(green_house=green_house)
+        if start is not None:
+            queryset = queryset.filter(date__gte=start)
+        if end is not None:
+            queryset = queryset.filter(date__lt=end)
+        return queryset
+
+    def visible_to(self, user):
+        """Readings of the greenhouses 'user' owns or is authorized for, all readings for superusers."""
+        if user.is_superuser:
+            return self
+        green_houses = self.model._meta.get_field("green_house").related_model.objects.filter(
+            models.Q(owner=user) | models.Q(authorized_users=user)
+        )
+        return self.filter(green_house__in=green_houses)
@@ -0,0 +1,355 @@
+import base64
+import binascii
+import io
+import json
+import logging
+import queue
+import re
+import socketserver
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from functools import partial
+from urllib.parse import urlsplit
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections
+
+from greenhouse_management import metrics
+from greenhouse_management.codec import READINGS_MAGIC
+from greenhouse_management.ingest import INGEST_BATCH_SIZE, binary_readings, ingest_stream
+from greenhouse_management.models import Device, GreenHouse
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_QUEUE_SIZE = 10000
+MAX_RETRY_DELAY = 60
+DEFAULT_TOPICS = ("greenhouses/+/environment", "devices/+/environment")
+# Optionally prefixed, e.g. 'site-1/greenhouses/3/environment'.
+TOPIC = re.compile(r"(?:^|/)(greenhouses|devices)/(\d+)/environment$")
+
+DEFAULT_CLIENT_ID = "greenhouse-ingest"
+
+# 'ack' acknowledges the message to its source once its readings are stored, None when there is nothing to ack.
+Message = namedtuple("Message", "topic payload received ack", defaults=(None,))
+
+
+class PayloadError(ValueError):
+    pass
+
+
+def decode_payload(payload):
+    """
+    The readings of a message payload: blocks of codec.encode_readings(),
+    or a JSON object or a list of them with the metric values by name.
+    """
+    if payload.startswith(READINGS_MAGIC):
+        readings = []
+        for number, reading, error in binary_readings(io.BytesIO(payload)):
+            if error:
+                raise PayloadError(error)
+            readings.append(reading)
+        return readings
+    try:
+        readings = json.loads(payload, parse_float=Decimal)
+    except ValueError as error:
+        raise PayloadError(f"Invalid JSON: {error}")
+    if isinstance(readings, dict):
+        readings = [readings]
+    if not isinstance(readings, list) or not all(isinstance(reading, dict) for reading in readings):
+        raise PayloadError("Payload must be a JSON object or a list of objects.")
+    return readings
+
+
+class TopicResolver:
+    """
+    Greenhouse id of the readings published to a topic, by the greenhouse or device id in the topic.
+    Lookups are cached for 'ttl' seconds, unknown ids too, so a flood of messages costs no queries.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._cache = {}
+
+    def resolve(self, topic):
+        match = TOPIC.search(topic)
+        if match is None:
+            return None
+        key = match[1], int(match[2])
+        cached = self._cache.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+
+        kind, id = key
+        if kind == "greenhouses":
+            green_house_id = id if GreenHouse.objects.filter(pk=id).exists() else None
+        else:
+            green_house_id = Device.objects.filter(pk=id).values_list("greenhouse_id", flat=True).first()
+        self._cache[key] = green_house_id, time.monotonic() + self.ttl
+        return green_house_id
+
+
+def line_message(line):
+    """
+    The message of a 'topic payload' line of the file and socket sources, None for blank lines.
+    Binary payloads are base64 encoded and prefixed with 'base64:', they may contain line breaks.
+    """
+    topic, _, payload = line.rstrip(b"\r\n").partition(b" ")
+    if not topic:
+        return None
+    if payload.startswith(b"base64:"):
+        try:
+            payload = base64.b64decode(payload[len(b"base64:"):], validate=True)
+        except binascii.Error:
+            # Not a valid payload of any format, left to be counted as invalid.
+            pass
+    # Topics that are not UTF-8 can not name a greenhouse, they are counted as unroutable.
+    return Message(topic.decode(errors="replace"), payload, time.time())
+
+
+class FileSource:
+    """Messages from a file of 'topic payload' lines, e.g. recorded from a broker; '-' reads standard input."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def run(self, put):
+        stream = sys.stdin.buffer if self.path == "-" else open(self.path, "rb")
+        with stream:
+            for line in stream:
+                message = line_message(line)
+                if message is not None:
+                    put(message)
+
+    def stop(self):
+        pass
+
+
+class SocketSource:
+    """Messages sent as 'topic payload' lines over TCP connections, a stand-in for a broker in tests and labs."""
+
+    def __init__(self, host, port):
+        source = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    message = line_message(line)
+                    if message is not None:
+                        # Blocks while the queue is full, the sender then waits on TCP flow control.
+                        source._put(message)
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._put = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def run(self, put):
+        self._put = put
+        with self.server:
+            self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+class MqttSource:
+    """
+    Messages of the 'topics' of an MQTT broker, needs paho-mqtt (the 'mqtt' extra).
+
+    Delivery is at least once: the session of 'client_id' is kept by the broker while the worker is away
+    and messages are only acknowledged once their batch was stored, unacknowledged ones are sent again.
+    Every worker subscribed to the broker needs its own client id.
+    """
+
+    def __init__(self, host, port=1883, topics=DEFAULT_TOPICS, client_id=DEFAULT_CLIENT_ID):
+        try:
+            from paho.mqtt import client as mqtt
+        except ImportError:
+            raise ImproperlyConfigured("The MQTT source needs paho-mqtt, install it with the 'mqtt' extra.")
+        self.host = host
+        self.port = port
+        self.topics = topics
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id, clean_session=False)
+        self.client.manual_ack_set(True)
+
+    def run(self, put):
+        def on_connect(client, userdata, *args):
+            # Subscribed again on every reconnect, the broker kept the messages published meanwhile.
+            client.subscribe([(topic, 1) for topic in self.topics])
+
+        def on_message(client, userdata, message):
+            try:
+                topic = message.topic
+            except UnicodeDecodeError:
+                # Can not name a greenhouse, counted as unroutable.
+                topic = ""
+            # Blocks the network loop while the queue is full, the broker then holds the messages.
+            put(Message(topic, message.payload, time.time(), partial(client.ack, message.mid, message.qos)))
+
+        self.client.on_connect = on_connect
+        self.client.on_message = on_message
+        self.client.connect(self.host, self.port)
+        self.client.loop_forever()
+
+    def stop(self):
+        self.client.disconnect()
+
+
+def message_source(url, topics=DEFAULT_TOPICS, client_id=DEFAULT_CLIENT_ID):
+    """A source for 'file:PATH', 'tcp://HOST:PORT' or 'mqtt://HOST[:PORT]'."""
+    if url.startswith("file:"):
+        return FileSource(url[len("file:"):])
+    parts = urlsplit(url)
+    if parts.scheme == "tcp":
+        return SocketSource(parts.hostname or "localhost", parts.port or 0)
+    if parts.scheme == "mqtt":
+        return MqttSource(parts.hostname or "localhost", parts.port or 1883, topics, client_id)
+    raise ValueError(f"Unknown message source '{url}'.")
+
+
+class MessageIngestWorker:
+    """
+    Store the readings of the messages of a source in batches of up to 'batch_size' readings,
+    written at the latest 'max_delay' seconds after the first reading of a batch was received.
+
+    The source runs in a thread and puts its messages into a queue of 'queue_size' messages. While the database
+    falls behind the queue fills up and the source blocks, which pushes back to the sender or the broker.
+    Readings without a 'date' are dated when they were received, all readings of a message belong to
+    the greenhouse of its topic.
+
+    A batch that can not be stored, e.g. while the database is down, is retried after 'retry_delay' seconds,
+    doubled up to MAX_RETRY_DELAY. Its messages are only acknowledged once it was stored; stopped meanwhile,
+    they are left unacknowledged for the broker to send again.
+    """
+
+    _END = object()
+
+    def __init__(self, source, batch_size=INGEST_BATCH_SIZE, max_delay=1, queue_size=MESSAGE_QUEUE_SIZE,
+                 resolver=None, retry_delay=1):
+        self.source = source
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.queue = queue.Queue(queue_size)
+        self.resolver = resolver or TopicResolver()
+        self.retry_delay = retry_delay
+        self.summary = {"messages": 0, "unroutable": 0, "invalid": 0, "created": 0, "duplicates": 0, "failed": 0}
+        self._error = None
+        self._stopped = threading.Event()
+
+    def _read(self):
+        try:
+            self.source.run(self.queue.put)
+        except Exception as error:
+            self._error = error
+        finally:
+            self.queue.put(self._END)
+
+    def readings(self, message):
+        """The readings of a message with their greenhouse, counted in the summary."""
+        self.summary["messages"] += 1
+        try:
+            green_house_id = self.resolver.resolve(message.topic)
+            if green_house_id is None:
+                self.summary["unroutable"] += 1
+                metrics.messages_total.labels("unroutable").inc()
+                return []
+            readings = decode_payload(message.payload)
+        except Exception as error:
+            # One bad message must not stop the worker and lose the batch it holds.
+            if not isinstance(error, PayloadError):
+                logger.exception("Message of topic '%s' could not be read.", message.topic)
+            self.summary["invalid"] += 1
+            metrics.messages_total.labels("invalid").inc()
+            return []
+        metrics.messages_total.labels("accepted").inc()
+        received = datetime.fromtimestamp(message.received, dt_timezone.utc)
+        return [{"date": received, **reading, "greenhouse": green_house_id} for reading in readings]
+
+    def flush(self, batch, received):
+        """Store a batch of readings, raises when it can not be stored and keeps the batch then."""
+        if not batch:
+            return
+        stored = ingest_stream((number, reading, None) for number, reading in enumerate(batch, start=1))
+        for key in ("created", "duplicates", "failed"):
+            self.summary[key] += stored[key]
+        metrics.message_lag.set(time.time() - received)
+        batch.clear()
+
+    def _store(self, batch, received):
+        """Flush a batch until it was stored, False when the worker was stopped before."""
+        delay = self.retry_delay
+        while True:
+            try:
+                self.flush(batch, received)
+                return True
+            except Exception:
+                logger.exception("Batch of %d readings could not be stored, retrying in %s s.", len(batch), delay)
+                # A broken connection is replaced before the next attempt.
+                close_old_connections()
+            if self._stopped.wait(delay):
+                return False
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def _acknowledge(self, acks):
+        for ack in acks:
+            ack()
+        acks.clear()
+
+    def run(self, on_batch=None):
+        """Consume messages until the source ends or stop() is called, returns the summary."""
+        reader = threading.Thread(target=self._read, daemon=True)
+        reader.start()
+
+        batch = []
+        # Acknowledged once the batch of the messages was stored.
+        acks = []
+        received = deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                message = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                message = None
+
+            if message is not None and message is not self._END:
+                readings = self.readings(message)
+                if message.ack is not None:
+                    acks.append(message.ack)
+                if readings and not batch:
+                    received, deadline = message.received, time.monotonic() + self.max_delay
+                batch.extend(readings)
+                if not batch:
+                    # Nothing to store for the messages, e.g. invalid ones.
+                    self._acknowledge(acks)
+                    continue
+                if len(batch) < self.batch_size:
+                    continue
+            if not self._store(batch, received):
+                if message is not self._END:
+                    # Unblocks the source, the dropped messages are not acknowledged.
+                    while self.queue.get() is not self._END:
+                        pass
+                break
+            self._acknowledge(acks)
+            received = deadline = None
+            if on_batch:
+                on_batch(self.summary)
+            if message is self._END:
+                break
+
+        reader.join()
+        if self._error is not None:
+            raise self._error
+        return self.summary
+
+    def stop(self):
+        """Stop the source, the readings received so far are stored unless the database is unavailable."""
+        self._stopped.set()
+        self.source.stop()
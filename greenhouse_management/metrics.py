@@ -0,0 +1,81 @@
+import os
+from collections import Counter as Tally
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+
+# Metrics are kept in memory-mapped files shared by all worker processes when PROMETHEUS_MULTIPROC_DIR is set
+# (it has to be set before the server starts), otherwise in the memory of the process.
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+SQL_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+requests_total = Counter(
+    "greenhouse_requests_total", "Handled requests by operation and response status.", ["operation", "status"]
+)
+request_duration = Histogram(
+    "greenhouse_request_duration_seconds", "Request duration by operation.", ["operation"]
+)
+request_sql_queries = Histogram(
+    "greenhouse_request_sql_queries", "SQL statements per request by operation.", ["operation"],
+    buckets=SQL_COUNT_BUCKETS,
+)
+request_sql_duration = Histogram(
+    "greenhouse_request_sql_duration_seconds", "Time spent in SQL per request by operation.", ["operation"]
+)
+graphql_errors_total = Counter(
+    "greenhouse_graphql_errors_total", "Errors returned in GraphQL responses by operation.", ["operation"]
+)
+resolver_duration = Histogram(
+    "greenhouse_graphql_resolver_duration_seconds", "Duration of root field resolvers.", ["field"]
+)
+ingested_rows_total = Counter(
+    "greenhouse_ingested_rows_total", "Stored environment readings by greenhouse.", ["greenhouse"]
+)
+rejected_rows_total = Counter(
+    "greenhouse_rejected_rows_total", "Environment readings rejected by ingest validation."
+)
+duplicate_rows_total = Counter(
+    "greenhouse_duplicate_rows_total", "Environment readings ingested again, e.g. by retrying gateways."
+)
+
+buffered_rows = Gauge(
+    "greenhouse_buffered_rows", "Environment readings acknowledged by the write-behind buffer, not stored yet.",
+    multiprocess_mode="livesum",
+)
+
+messages_total = Counter(
+    "greenhouse_messages_total", "Messages consumed by the message ingest worker by outcome.", ["status"]
+)
+message_lag = Gauge(
+    "greenhouse_message_lag_seconds", "Time from receiving the first reading of a batch to storing the batch.",
+    multiprocess_mode="max",
+)
+
+
+def observe_request(stats, status):
+    """Export the costs of a finished request."""
+    requests_total.labels(stats.operation, str(status)).inc()
+    request_duration.labels(stats.operation).observe(stats.duration)
+    request_sql_queries.labels(stats.operation).observe(stats.sql_count)
+    request_sql_duration.labels(stats.operation).observe(stats.sql_time)
+    if stats.errors:
+        graphql_errors_total.labels(stats.operation).inc(stats.errors)
+
+
+def observe_ingest(environments, rejected, duplicates=0):
+    """Export the outcome of an ingested batch."""
+    for green_house_id, count in Tally(environment.green_house_id for environment in environments).items():
+        ingested_rows_total.labels(str(green_house_id)).inc(count)
+    if rejected:
+        rejected_rows_total.inc(rejected)
+    if duplicates:
+        duplicate_rows_total.inc(duplicates)
+
+
+def exposition():
+    """All metrics in the Prometheus text format, aggregated over worker processes in multiprocess mode."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
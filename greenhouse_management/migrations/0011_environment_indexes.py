@@ -0,0 +1,31 @@
+# Generated by Django 4.2.6 on 2026-10-18 17:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('greenhouse_management', '0010_rename_stem_micro_variability_environment_stem_micro_variability'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='environment',
+            options={'ordering': ('date', 'id')},
+        ),
+        migrations.AlterField(
+            model_name='environment',
+            name='green_house',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='greenhouse_management.greenhouse'),
+        ),
+        migrations.AddIndex(
+            model_name='environment',
+            index=models.Index(fields=['green_house', 'date'], name='environment_greenhouse_date'),
+        ),
+        migrations.AddIndex(
+            model_name='environment',
+            index=models.Index(fields=['date'], name='environment_date'),
+        ),
+    ]
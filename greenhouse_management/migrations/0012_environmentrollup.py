@@ -0,0 +1,73 @@
+# Generated by Django 4.2.6 on 2026-10-18 17:26
+
+from datetime import timezone
+
+from django.db import migrations, models
+from django.db.models.functions import Trunc
+import django.db.models.deletion
+
+METRICS = (
+    'temperature', 'air_humidity', 'light_level', 'par', 'co2_level', 'soil_moisture_level', 'soil_salinity',
+    'soil_temperature', 'weight_of_soil_and_plants', 'stem_micro_variability',
+)
+
+
+def build_rollups(apps, schema_editor):
+    Environment = apps.get_model('greenhouse_management', 'Environment')
+    EnvironmentRollup = apps.get_model('greenhouse_management', 'EnvironmentRollup')
+
+    aggregates = {'count': models.Count('id')}
+    for metric in METRICS:
+        aggregates[f'{metric}__min'] = models.Min(metric)
+        aggregates[f'{metric}__max'] = models.Max(metric)
+        aggregates[f'{metric}__sum'] = models.Sum(metric)
+
+    for resolution in ('hour', 'day'):
+        rows = (
+            Environment.objects.order_by()
+            .annotate(bucket=Trunc('date', resolution, tzinfo=timezone.utc))
+            .values('green_house_id', 'bucket')
+            .annotate(**aggregates)
+        )
+        batch = []
+        for row in rows.iterator():
+            batch.extend(
+                EnvironmentRollup(
+                    green_house_id=row['green_house_id'], resolution=resolution, bucket=row['bucket'], metric=metric,
+                    count=row['count'], minimum=row[f'{metric}__min'], maximum=row[f'{metric}__max'],
+                    total=row[f'{metric}__sum'],
+                )
+                for metric in METRICS
+            )
+            if len(batch) >= 1000:
+                EnvironmentRollup.objects.bulk_create(batch)
+                batch = []
+        EnvironmentRollup.objects.bulk_create(batch)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('greenhouse_management', '0011_environment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvironmentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('metric', models.CharField(max_length=32)),
+                ('count', models.PositiveIntegerField()),
+                ('minimum', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('maximum', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('green_house', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='greenhouse_management.greenhouse')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='environmentrollup',
+            constraint=models.UniqueConstraint(fields=('green_house', 'resolution', 'bucket', 'metric'), name='environment_rollup_unique'),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
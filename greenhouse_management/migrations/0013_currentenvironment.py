@@ -0,0 +1,51 @@
+# Generated by Django 4.2.6 on 2026-10-18 17:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_current_environments(apps, schema_editor):
+    Environment = apps.get_model('greenhouse_management', 'Environment')
+    CurrentEnvironment = apps.get_model('greenhouse_management', 'CurrentEnvironment')
+    GreenHouse = apps.get_model('greenhouse_management', 'GreenHouse')
+
+    fields = [field.name for field in CurrentEnvironment._meta.concrete_fields if field.name != 'green_house']
+    for green_house_id in GreenHouse.objects.values_list('id', flat=True):
+        environment = Environment.objects.filter(green_house_id=green_house_id).order_by('-date', '-id').first()
+        if environment:
+            CurrentEnvironment.objects.create(
+                green_house_id=green_house_id,
+                **{field: getattr(environment, 'id' if field == 'environment_id' else field) for field in fields},
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('greenhouse_management', '0012_environmentrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrentEnvironment',
+            fields=[
+                ('date', models.DateTimeField()),
+                ('temperature', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('air_humidity', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('light_level', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('par', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('co2_level', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('soil_moisture_level', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('soil_salinity', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('soil_temperature', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('weight_of_soil_and_plants', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('stem_micro_variability', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('green_house', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest_environment', serialize=False, to='greenhouse_management.greenhouse')),
+                ('environment_id', models.BigIntegerField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(build_current_environments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Cast, Round
+
+import greenhouse_management.fields
+
+METRICS = {
+    'temperature': 5,
+    'air_humidity': 5,
+    'light_level': 5,
+    'par': 5,
+    'co2_level': 5,
+    'soil_moisture_level': 5,
+    'soil_salinity': 5,
+    'soil_temperature': 5,
+    'weight_of_soil_and_plants': 8,
+    'stem_micro_variability': 5,
+}
+MODELS = ('environment', 'currentenvironment')
+
+
+def to_fixed_point(apps, schema_editor):
+    for model_name in MODELS:
+        model = apps.get_model('greenhouse_management', model_name)
+        model.objects.update(**{
+            f'{metric}_fixed': Cast(Round(F(metric) * 100), models.BigIntegerField()) for metric in METRICS
+        })
+
+
+def to_decimal(apps, schema_editor):
+    for model_name in MODELS:
+        model = apps.get_model('greenhouse_management', model_name)
+        model.objects.update(**{
+            metric: Cast(F(f'{metric}_fixed'), models.DecimalField(max_digits=20, decimal_places=2)) / 100
+            for metric in METRICS
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('greenhouse_management', '0013_currentenvironment'),
+    ]
+
+    # Metrics become integers of centi-units: a fixed point column is added next to every decimal one,
+    # the scaled values are copied over with one UPDATE per table, then the columns are swapped.
+    operations = [
+        *[
+            migrations.AddField(
+                model_name=model_name,
+                name=f'{metric}_fixed',
+                field=greenhouse_management.fields.FixedPointField(
+                    decimal_places=2, max_digits=max_digits, null=True
+                ),
+            )
+            for model_name in MODELS for metric, max_digits in METRICS.items()
+        ],
+        migrations.RunPython(to_fixed_point, to_decimal),
+        *[
+            migrations.RemoveField(model_name=model_name, name=metric)
+            for model_name in MODELS for metric in METRICS
+        ],
+        *[
+            migrations.RenameField(model_name=model_name, old_name=f'{metric}_fixed', new_name=metric)
+            for model_name in MODELS for metric in METRICS
+        ],
+        *[
+            migrations.AlterField(
+                model_name=model_name,
+                name=metric,
+                field=greenhouse_management.fields.FixedPointField(decimal_places=2, max_digits=max_digits),
+            )
+            for model_name in MODELS for metric, max_digits in METRICS.items()
+        ],
+    ]
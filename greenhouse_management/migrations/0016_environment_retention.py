@@ -0,0 +1,104 @@
+# Generated by Django 4.2.6 on 2026-10-18 18:20
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+TABLE = 'greenhouse_management_environment'
+GREENHOUSE_TABLE = 'greenhouse_management_greenhouse'
+PARTITIONS_AHEAD = 3
+
+
+def _month(date, months=0):
+    month = date.year * 12 + date.month - 1 + months
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def _swap_table(cursor, suffix):
+    """
+    Move the current table out of the way, with its indexes, primary key and id sequence,
+    under a name ending in 'suffix'.
+    """
+    cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_{suffix}')
+    cursor.execute(f'ALTER TABLE {TABLE}_{suffix} RENAME CONSTRAINT {TABLE}_pkey TO {TABLE}_{suffix}_pkey')
+    cursor.execute(f'ALTER SEQUENCE {TABLE}_id_seq RENAME TO {TABLE}_{suffix}_id_seq')
+    for index in ('environment_greenhouse_date', 'environment_date'):
+        cursor.execute(f'ALTER INDEX {index} RENAME TO {index}_{suffix}')
+
+
+def _add_constraints_and_indexes(cursor):
+    cursor.execute(
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_green_house_id_fk FOREIGN KEY (green_house_id) '
+        f'REFERENCES {GREENHOUSE_TABLE} (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    cursor.execute(f'CREATE INDEX environment_greenhouse_date ON {TABLE} (green_house_id, date)')
+    cursor.execute(f'CREATE INDEX environment_date ON {TABLE} (date)')
+
+
+def partition_environments(apps, schema_editor):
+    """
+    Turn the environment table into one partitioned by month of 'date' on PostgreSQL, so that retention
+    drops whole partitions instead of deleting rows. The primary key has to include the partition key
+    and becomes (id, date); rows outside of the created months go to a default partition.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        _swap_table(cursor, 'unpartitioned')
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {TABLE}_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (date)')
+        cursor.execute(f'CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id')
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, date)')
+        _add_constraints_and_indexes(cursor)
+
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+        cursor.execute(f'SELECT MIN(date) FROM {TABLE}_unpartitioned')
+        first = cursor.fetchone()[0] or datetime.now(timezone.utc)
+        start, end = _month(first), _month(datetime.now(timezone.utc), PARTITIONS_AHEAD + 1)
+        while start < end:
+            cursor.execute(
+                f'CREATE TABLE {TABLE}_p{start:%Y%m} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+                [start, _month(start, 1)],
+            )
+            start = _month(start, 1)
+
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {TABLE}_unpartitioned')
+        cursor.execute(f"SELECT setval('{TABLE}_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}")
+        cursor.execute(f'DROP TABLE {TABLE}_unpartitioned')
+
+
+def unpartition_environments(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        _swap_table(cursor, 'partitioned')
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {TABLE}_partitioned)')
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id)')
+        cursor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+        _add_constraints_and_indexes(cursor)
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {TABLE}_partitioned')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}"
+        )
+        cursor.execute(f'DROP TABLE {TABLE}_partitioned')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('greenhouse_management', '0015_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='greenhouse',
+            name='raw_retention_days',
+            field=models.PositiveIntegerField(blank=True, help_text='Days raw readings are kept, ENVIRONMENT_RETENTION_DAYS when empty. Rollups are kept forever.', null=True),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('export', 'Export'), ('rebuild_rollups', 'Rebuild rollups'), ('import', 'Import'), ('prune_environments', 'Prune environments')], max_length=32),
+        ),
+        migrations.RunPython(partition_environments, unpartition_environments),
+    ]
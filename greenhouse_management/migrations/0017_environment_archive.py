@@ -0,0 +1,37 @@
+# Generated by Django 4.2.6 on 2026-10-18 18:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('greenhouse_management', '0016_environment_retention'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('export', 'Export'), ('rebuild_rollups', 'Rebuild rollups'), ('import', 'Import'), ('prune_environments', 'Prune environments'), ('archive_environments', 'Archive environments')], max_length=32),
+        ),
+        migrations.CreateModel(
+            name='EnvironmentArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateTimeField(help_text='First instant of the month')),
+                ('count', models.PositiveIntegerField()),
+                ('first_date', models.DateTimeField()),
+                ('last_date', models.DateTimeField()),
+                ('file', models.CharField(max_length=255)),
+                ('size', models.PositiveIntegerField(help_text='Bytes')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('green_house', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='greenhouse_management.greenhouse')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='environmentarchive',
+            constraint=models.UniqueConstraint(fields=('green_house', 'month'), name='environment_archive_unique'),
+        ),
+    ]
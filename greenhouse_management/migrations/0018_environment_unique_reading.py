@@ -0,0 +1,57 @@
+# Generated by Django 4.2.6 on 2026-10-18 18:29
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Keep the first stored of the readings sharing a greenhouse and date, and queue a rebuild of the rollups
+    of the affected days, which counted the duplicates.
+    """
+    Environment = apps.get_model('greenhouse_management', 'Environment')
+    Job = apps.get_model('greenhouse_management', 'Job')
+
+    duplicates = (
+        Environment.objects.order_by()
+        .values('green_house_id', 'date')
+        .annotate(first=Min('id'), count=Count('id'))
+        .filter(count__gt=1)
+    )
+    green_houses = set()
+    dates = []
+    for duplicate in duplicates.iterator():
+        Environment.objects.filter(
+            green_house_id=duplicate['green_house_id'], date=duplicate['date'], id__gt=duplicate['first']
+        ).delete()
+        green_houses.add(duplicate['green_house_id'])
+        dates.append(duplicate['date'])
+
+    if dates:
+        Job.objects.create(kind='rebuild_rollups', params={
+            'from': min(dates).isoformat(),
+            'to': (max(dates) + timedelta(seconds=1)).isoformat(),
+            'greenhouses': sorted(green_houses),
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('greenhouse_management', '0017_environment_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        # The unique constraint's index serves the lookups by greenhouse and date the plain index did.
+        migrations.AddConstraint(
+            model_name='environment',
+            constraint=models.UniqueConstraint(fields=('green_house', 'date'), name='environment_greenhouse_date_unique'),
+        ),
+        migrations.RemoveIndex(
+            model_name='environment',
+            name='environment_greenhouse_date',
+        ),
+    ]
@@ -4,7 +4,8 @@ from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from mapbox_location_field.models import LocationField
 
-from .managers import CustomUserManager
+from .fields import FixedPointField
+from .managers import CustomUserManager, EnvironmentQuerySet
 
 
 class CustomUser(AbstractBaseUser, PermissionsMixin):
@@ -57,24 +58,120 @@ class GreenHouse(models.Model):
         on_delete=models.CASCADE,  # to consider
         related_name="owned_greenhouses",
     )
+    raw_retention_days = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text=_("Days raw readings are kept, ENVIRONMENT_RETENTION_DAYS when empty. Rollups are kept forever."),
+    )
 
     def __str__(self):
         return self.name
 
 
-class Environment(models.Model):
-    green_house = models.ForeignKey(GreenHouse, on_delete=models.CASCADE)
+class Measurements(models.Model):
+    """Date and metric values of an environment reading, the metrics are stored as integers of centi-units."""
+
+    METRICS = (
+        "temperature",
+        "air_humidity",
+        "light_level",
+        "par",
+        "co2_level",
+        "soil_moisture_level",
+        "soil_salinity",
+        "soil_temperature",
+        "weight_of_soil_and_plants",
+        "stem_micro_variability",
+    )
+
     date = models.DateTimeField()
-    temperature = models.DecimalField(max_digits=5, decimal_places=2)  
-    air_humidity = models.DecimalField(max_digits=5, decimal_places=2)  
-    light_level = models.DecimalField(max_digits=5, decimal_places=2)  
-    par = models.DecimalField(max_digits=5, decimal_places=2)  
-    co2_level = models.DecimalField(max_digits=5, decimal_places=2)  
-    soil_moisture_level = models.DecimalField(max_digits=5, decimal_places=2)  
-    soil_salinity = models.DecimalField(max_digits=5, decimal_places=2)  
-    soil_temperature = models.DecimalField(max_digits=5, decimal_places=2)  
-    weight_of_soil_and_plants = models.DecimalField(max_digits=8, decimal_places=2)  
-    stem_micro_variability = models.DecimalField(max_digits=5, decimal_places=2)
+    temperature = FixedPointField(max_digits=5, decimal_places=2)
+    air_humidity = FixedPointField(max_digits=5, decimal_places=2)
+    light_level = FixedPointField(max_digits=5, decimal_places=2)
+    par = FixedPointField(max_digits=5, decimal_places=2)
+    co2_level = FixedPointField(max_digits=5, decimal_places=2)
+    soil_moisture_level = FixedPointField(max_digits=5, decimal_places=2)
+    soil_salinity = FixedPointField(max_digits=5, decimal_places=2)
+    soil_temperature = FixedPointField(max_digits=5, decimal_places=2)
+    weight_of_soil_and_plants = FixedPointField(max_digits=8, decimal_places=2)
+    stem_micro_variability = FixedPointField(max_digits=5, decimal_places=2)
+
+    class Meta:
+        abstract = True
+
+
+class Environment(Measurements):
+    # (green_house, date) unique constraint below covers lookups by greenhouse, so the FK does not need its own index
+    green_house = models.ForeignKey(GreenHouse, on_delete=models.CASCADE, db_index=False)
+
+    objects = EnvironmentQuerySet.as_manager()
+
+    class Meta:
+        ordering = ("date", "id")
+        constraints = [
+            # One reading per greenhouse and date, so retried ingests do not store readings twice.
+            models.UniqueConstraint(fields=["green_house", "date"], name="environment_greenhouse_date_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["date"], name="environment_date"),
+        ]
+
+
+class EnvironmentRollup(models.Model):
+    class Resolutions(models.TextChoices):
+        HOUR = "hour", _("Hour")
+        DAY = "day", _("Day")
+
+    green_house = models.ForeignKey(GreenHouse, on_delete=models.CASCADE, db_index=False)
+    resolution = models.CharField(max_length=4, choices=Resolutions.choices)
+    bucket = models.DateTimeField()
+    metric = models.CharField(max_length=32)
+    count = models.PositiveIntegerField()
+    minimum = models.DecimalField(max_digits=8, decimal_places=2)
+    maximum = models.DecimalField(max_digits=8, decimal_places=2)
+    total = models.DecimalField(max_digits=20, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["green_house", "resolution", "bucket", "metric"], name="environment_rollup_unique"
+            ),
+        ]
+
+
+class EnvironmentArchive(models.Model):
+    """Readings of a greenhouse of one UTC month, moved out of the Environment table into a compressed file."""
+
+    green_house = models.ForeignKey(GreenHouse, on_delete=models.CASCADE, db_index=False)
+    month = models.DateTimeField(help_text=_("First instant of the month"))
+    count = models.PositiveIntegerField()
+    first_date = models.DateTimeField()
+    last_date = models.DateTimeField()
+    # Relative to ARCHIVE_ROOT.
+    file = models.CharField(max_length=255)
+    size = models.PositiveIntegerField(help_text=_("Bytes"))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["green_house", "month"], name="environment_archive_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.green_house_id} {self.month:%Y-%m}"
+
+
+class CurrentEnvironment(Measurements):
+    """Latest reading of a greenhouse, upserted on ingest so the current state is a primary key lookup."""
+
+    green_house = models.OneToOneField(
+        GreenHouse,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="latest_environment",
+    )
+    # Not a foreign key, the reading may be pruned or archived while it still is the latest one.
+    environment_id = models.BigIntegerField()
 
 
 class Device(models.Model):
@@ -96,3 +193,45 @@ class Device(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class Job(models.Model):
+    """Task run out of band by the run_jobs worker, see greenhouse_management.jobs."""
+
+    class Kinds(models.TextChoices):
+        EXPORT = "export", _("Export")
+        REBUILD_ROLLUPS = "rebuild_rollups", _("Rebuild rollups")
+        IMPORT = "import", _("Import")
+        PRUNE_ENVIRONMENTS = "prune_environments", _("Prune environments")
+        ARCHIVE_ENVIRONMENTS = "archive_environments", _("Archive environments")
+
+    class Statuses(models.TextChoices):
+        QUEUED = "queued", _("Queued")
+        RUNNING = "running", _("Running")
+        SUCCEEDED = "succeeded", _("Succeeded")
+        FAILED = "failed", _("Failed")
+
+    kind = models.CharField(max_length=32, choices=Kinds.choices)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=Statuses.choices, default=Statuses.QUEUED)
+    progress = models.FloatField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed with every progress report, a running job with a stale heartbeat lost its worker.
+    worker = models.CharField(max_length=255, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="job_status_run_after"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
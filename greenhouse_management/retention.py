@@ -0,0 +1,159 @@
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from greenhouse_management.models import Environment, GreenHouse
+
+RETENTION_CHUNK_SIZE = 5000
+PARTITIONS_AHEAD = 3
+PARTITION_NAME = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+def retention_cutoffs(now=None):
+    """Date before which raw readings of a greenhouse are pruned, per greenhouse id, None when they are kept."""
+    now = now or timezone.now()
+    cutoffs = {}
+    for green_house_id, days in GreenHouse.objects.values_list("id", "raw_retention_days"):
+        # 0 days is a retention of its own, not the default.
+        days = days if days is not None else settings.ENVIRONMENT_RETENTION_DAYS
+        cutoffs[green_house_id] = now - timedelta(days=days) if days is not None else None
+    return cutoffs
+
+
+def delete_environments_before(green_house_id, cutoff, chunk_size=RETENTION_CHUNK_SIZE, on_chunk=None):
+    """
+    Delete the readings of a greenhouse older than 'cutoff', oldest first, 'chunk_size' rows per statement.
+
+    Every chunk is found through the (green_house, date) index and deleted in its own short transaction,
+    so concurrent ingest never waits on a long running delete. Rollups are left as they are.
+    'on_chunk' is called with the number of readings deleted so far after every chunk.
+    Returns the number of deleted readings.
+    """
+    deleted = 0
+    while True:
+        ids = list(
+            Environment.objects.filter(green_house_id=green_house_id, date__lt=cutoff)
+            .order_by("date").values_list("id", flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        # No signal or cascade is attached to the deletion of readings, so this is a single DELETE.
+        deleted += Environment.objects.filter(id__in=ids).delete()[0]
+        if on_chunk:
+            on_chunk(deleted)
+
+
+def is_partitioned():
+    """Whether the Environment table is a PostgreSQL table partitioned by month, see migration 0016."""
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table JOIN pg_class ON pg_class.oid = partrelid WHERE relname = %s",
+            [Environment._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+
+def month_start(date, months=0):
+    """First instant of the UTC month of 'date', 'months' later."""
+    month = date.year * 12 + date.month - 1 + months
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def month_partitions():
+    """Month partitions of the Environment table as (table name, first day of the month), oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s",
+            [Environment._meta.db_table],
+        )
+        names = [name for name, in cursor.fetchall()]
+    return sorted(
+        (name, datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc))
+        for name in names if (match := PARTITION_NAME.search(name))
+    )
+
+
+def ensure_month_partitions(now=None, ahead=PARTITIONS_AHEAD):
+    """
+    Create the partitions of the current and the next 'ahead' months that do not exist yet.
+    Readings of months without a partition land in the default partition, which is only pruned row by row.
+    They are moved to the partition of their month when it is created, in the same transaction.
+    """
+    table = Environment._meta.db_table
+    default = connection.ops.quote_name(f"{table}_default")
+    existing = {month for name, month in month_partitions()}
+    created = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        for months in range(ahead + 1):
+            start = month_start(now or timezone.now(), months)
+            if start in existing:
+                continue
+            # A partition can not be created while the default partition holds rows of its range.
+            bounds = [start, month_start(start, 1)]
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE environment_moved AS SELECT * FROM {default} WHERE date >= %s AND date < %s",
+                bounds,
+            )
+            cursor.execute(f"DELETE FROM {default} WHERE date >= %s AND date < %s", bounds)
+            cursor.execute(
+                f"CREATE TABLE {connection.ops.quote_name(f'{table}_p{start:%Y%m}')} PARTITION OF "
+                f"{connection.ops.quote_name(table)} FOR VALUES FROM (%s) TO (%s)",
+                bounds,
+            )
+            cursor.execute(f"INSERT INTO {connection.ops.quote_name(table)} SELECT * FROM environment_moved")
+            cursor.execute("DROP TABLE environment_moved")
+            created += 1
+    return created
+
+
+def drop_month_partitions(cutoff):
+    """Drop the month partitions whose readings are all older than 'cutoff', returns their number."""
+    table = connection.ops.quote_name(Environment._meta.db_table)
+    dropped = 0
+    with connection.cursor() as cursor:
+        for name, month in month_partitions():
+            if month_start(month, 1) > cutoff:
+                break
+            # Detaching first keeps the lock on the parent table, which ingest inserts into, short.
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {connection.ops.quote_name(name)}")
+            cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
+            dropped += 1
+    return dropped
+
+
+def prune_environments(now=None, chunk_size=RETENTION_CHUNK_SIZE, on_progress=None):
+    """
+    Remove raw readings older than the retention of their greenhouse, rollups are kept.
+
+    On a partitioned PostgreSQL table, whole months older than the retention of every greenhouse are dropped
+    as partitions first, and the partitions of the coming months are created. Whatever is left past
+    the cutoff of a greenhouse is deleted in chunks of 'chunk_size' readings.
+    'on_progress' is called with the share of greenhouses done after every deleted chunk and greenhouse,
+    so a job pruning a long history of one greenhouse keeps reporting progress.
+    Returns the number of 'dropped_partitions' and 'deleted' readings.
+    """
+    cutoffs = retention_cutoffs(now)
+    dropped = 0
+    if is_partitioned():
+        ensure_month_partitions(now)
+        if cutoffs and None not in cutoffs.values():
+            dropped = drop_month_partitions(min(cutoffs.values()))
+
+    deleted = 0
+    for number, (green_house_id, cutoff) in enumerate(cutoffs.items(), start=1):
+        if cutoff is not None:
+            done = (number - 1) / len(cutoffs)
+            deleted += delete_environments_before(
+                green_house_id, cutoff, chunk_size, on_chunk=on_progress and (lambda count: on_progress(done)),
+            )
+        if on_progress:
+            on_progress(number / len(cutoffs))
+    return {"dropped_partitions": dropped, "deleted": deleted}
@@ -0,0 +1,252 @@
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from greenhouse_management.archive import archived_columns, archives_in_range, from_milliseconds
+from greenhouse_management.models import Environment, EnvironmentRollup
+from greenhouse_management.retention import retention_cutoffs
+
+RESOLUTIONS = (EnvironmentRollup.Resolutions.HOUR, EnvironmentRollup.Resolutions.DAY)
+UPDATE_ATTEMPTS = 3
+REBUILD_BATCH_SIZE = 1000
+
+
+def truncate(date, resolution):
+    """Start of the UTC hour or day that contains 'date'."""
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, dt_timezone.utc)
+    date = date.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if resolution == EnvironmentRollup.Resolutions.DAY:
+        date = date.replace(hour=0)
+    return date
+
+
+def _field_value(environment, name):
+    return Environment._meta.get_field(name).to_python(getattr(environment, name))
+
+
+def _merge(rollup, count, minimum, maximum, total):
+    rollup.count += count
+    rollup.minimum = min(rollup.minimum, minimum)
+    rollup.maximum = max(rollup.maximum, maximum)
+    rollup.total += total
+
+
+def update_rollups(environments):
+    """
+    Fold newly stored readings into the hourly and daily rollups of their greenhouses.
+
+    The readings are summed up in memory first, so every affected rollup row is read and written once per call.
+    Rows are locked and created in the order of their key, so concurrent ingests wait for each other
+    instead of deadlocking.
+    """
+    deltas = {}
+    for environment in environments:
+        date = _field_value(environment, "date")
+        for resolution in RESOLUTIONS:
+            bucket = truncate(date, resolution)
+            for metric in Environment.METRICS:
+                value = _field_value(environment, metric)
+                key = (environment.green_house_id, resolution, bucket, metric)
+                if key in deltas:
+                    count, minimum, maximum, total = deltas[key]
+                    deltas[key] = (count + 1, min(minimum, value), max(maximum, value), total + value)
+                else:
+                    deltas[key] = (1, value, value, value)
+
+    if not deltas:
+        return
+
+    # Two ingests may create the same rollup row concurrently, the loser retries and merges into it.
+    for attempt in range(UPDATE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                _apply_deltas(deltas)
+            return
+        except IntegrityError:
+            if attempt == UPDATE_ATTEMPTS - 1:
+                raise
+
+
+def _apply_deltas(deltas):
+    buckets = [key[2] for key in deltas]
+    existing = {
+        (rollup.green_house_id, rollup.resolution, rollup.bucket, rollup.metric): rollup
+        for rollup in EnvironmentRollup.objects.select_for_update().filter(
+            green_house_id__in={key[0] for key in deltas},
+            bucket__gte=min(buckets),
+            bucket__lte=max(buckets),
+        ).order_by("green_house_id", "resolution", "bucket", "metric")
+    }
+
+    created = []
+    updated = []
+    for key, (count, minimum, maximum, total) in sorted(deltas.items()):
+        if key in existing:
+            _merge(existing[key], count, minimum, maximum, total)
+            updated.append(existing[key])
+        else:
+            green_house_id, resolution, bucket, metric = key
+            created.append(EnvironmentRollup(
+                green_house_id=green_house_id, resolution=resolution, bucket=bucket, metric=metric,
+                count=count, minimum=minimum, maximum=maximum, total=total,
+            ))
+
+    EnvironmentRollup.objects.bulk_update(updated, ["count", "minimum", "maximum", "total"])
+    EnvironmentRollup.objects.bulk_create(created)
+
+
+def _rebuild_floors(now=None):
+    """
+    First UTC day of every greenhouse with a raw data retention from which on all of its raw readings are kept,
+    per greenhouse id. The rollups of earlier days are all that is left of their readings.
+    """
+    return {
+        green_house_id: truncate(cutoff, EnvironmentRollup.Resolutions.DAY) + timedelta(days=1)
+        for green_house_id, cutoff in retention_cutoffs(now).items() if cutoff is not None
+    }
+
+
+def _after_floors(queryset, field, floors):
+    if not floors:
+        return queryset
+    condition = ~Q(green_house_id__in=floors)
+    for green_house_id, floor in floors.items():
+        condition |= Q(green_house_id=green_house_id, **{f"{field}__gte": floor})
+    return queryset.filter(condition)
+
+
+def _archived_aggregates(start, end, green_houses, floors):
+    """
+    Rows like the ones of the rebuild query of the archived readings with start <= date < end, by greenhouse id,
+    resolution and bucket. Readings of archived months are not in the table anymore.
+    """
+    sizes = {EnvironmentRollup.Resolutions.HOUR: 3600000, EnvironmentRollup.Resolutions.DAY: 86400000}
+    places = [Environment._meta.get_field(metric).decimal_places for metric in Environment.METRICS]
+    sums = {}
+    for archive in archives_in_range(green_houses, start, end):
+        floor = floors.get(archive.green_house_id)
+        columns = archived_columns(
+            archive, max(filter(None, (start, floor)), default=None), end, ["timestamp", *Environment.METRICS]
+        )
+        for timestamp, *values in zip(*columns.values()):
+            for resolution, size in sizes.items():
+                key = archive.green_house_id, resolution, from_milliseconds(timestamp - timestamp % size)
+                entry = sums.setdefault(key, [0, [[value, value, 0] for value in values]])
+                entry[0] += 1
+                for aggregate, value in zip(entry[1], values):
+                    aggregate[0] = min(aggregate[0], value)
+                    aggregate[1] = max(aggregate[1], value)
+                    aggregate[2] += value
+
+    rows = {}
+    for (green_house_id, resolution, bucket), (count, aggregates) in sums.items():
+        row = {"green_house_id": green_house_id, "bucket": bucket, "count": count}
+        for metric, place, (low, high, total) in zip(Environment.METRICS, places, aggregates):
+            row[f"{metric}__min"] = Decimal(low).scaleb(-place)
+            row[f"{metric}__max"] = Decimal(high).scaleb(-place)
+            row[f"{metric}__sum"] = Decimal(total).scaleb(-place)
+        rows[green_house_id, resolution, bucket] = row
+    return rows
+
+
+def _with_archived(rows, archived, resolution):
+    """The rows of the rebuild query merged with the archived rows of the same bucket, then the other archived rows."""
+    for row in rows:
+        other = archived.pop((row["green_house_id"], resolution, row["bucket"]), None)
+        if other is not None:
+            row["count"] += other["count"]
+            for metric in Environment.METRICS:
+                row[f"{metric}__min"] = min(row[f"{metric}__min"], other[f"{metric}__min"])
+                row[f"{metric}__max"] = max(row[f"{metric}__max"], other[f"{metric}__max"])
+                row[f"{metric}__sum"] += other[f"{metric}__sum"]
+        yield row
+    for key in [key for key in archived if key[1] == resolution]:
+        yield archived.pop(key)
+
+
+def rebuild_rollups(start=None, end=None, green_houses=None):
+    """
+    Recompute the rollups of whole UTC days between 'start' and 'end' from the raw readings,
+    in the table and in the archive.
+
+    The range is widened to day boundaries, both bounds are optional.
+    'green_houses' limits the rebuild to the given greenhouses (or their ids).
+    Days a greenhouse may have pruned raw readings of, see retention.prune_environments(), are left as they are.
+    Returns the number of rollup rows written.
+    """
+    start = truncate(start, EnvironmentRollup.Resolutions.DAY) if start else None
+    if end and end != truncate(end, EnvironmentRollup.Resolutions.DAY):
+        end = truncate(end, EnvironmentRollup.Resolutions.DAY) + timedelta(days=1)
+
+    environments = Environment.objects.in_range(start=start, end=end).order_by()
+    rollups = EnvironmentRollup.objects.all()
+    if start:
+        rollups = rollups.filter(bucket__gte=start)
+    if end:
+        rollups = rollups.filter(bucket__lt=end)
+    if green_houses is not None:
+        environments = environments.filter(green_house__in=green_houses)
+        rollups = rollups.filter(green_house__in=green_houses)
+    floors = _rebuild_floors()
+    environments = _after_floors(environments, "date", floors)
+    rollups = _after_floors(rollups, "bucket", floors)
+
+    aggregates = {"count": Count("id")}
+    for metric in Environment.METRICS:
+        aggregates[f"{metric}__min"] = Min(metric)
+        aggregates[f"{metric}__max"] = Max(metric)
+        aggregates[f"{metric}__sum"] = Sum(metric)
+
+    archived = _archived_aggregates(start, end, green_houses, floors)
+    written = 0
+    with transaction.atomic():
+        rollups.delete()
+        for resolution in RESOLUTIONS:
+            rows = (
+                environments.annotate(bucket=Trunc("date", resolution, tzinfo=dt_timezone.utc))
+                .values("green_house_id", "bucket")
+                .annotate(**aggregates)
+            )
+            batch = []
+            for row in _with_archived(rows.iterator(), archived, resolution):
+                batch.extend(
+                    EnvironmentRollup(
+                        green_house_id=row["green_house_id"], resolution=resolution, bucket=row["bucket"],
+                        metric=metric, count=row["count"], minimum=row[f"{metric}__min"],
+                        maximum=row[f"{metric}__max"], total=row[f"{metric}__sum"],
+                    )
+                    for metric in Environment.METRICS
+                )
+                if len(batch) >= REBUILD_BATCH_SIZE:
+                    EnvironmentRollup.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            EnvironmentRollup.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+def rebuild_day_rollups(date, green_houses=None):
+    """Recompute the rollups of the UTC day that contains 'date', e.g. after a reading was changed or removed."""
+    day = truncate(Environment._meta.get_field("date").to_python(date), EnvironmentRollup.Resolutions.DAY)
+    return rebuild_rollups(day, day + timedelta(days=1), green_houses)
+
+
+def rollup_resolution(start, end, bucket):
+    """
+    The coarsest rollup resolution that can answer an aggregation by 'bucket' over [start, end),
+    or None when the raw readings have to be aggregated.
+    """
+    candidates = {
+        "day": (EnvironmentRollup.Resolutions.DAY, EnvironmentRollup.Resolutions.HOUR),
+        "hour": (EnvironmentRollup.Resolutions.HOUR,),
+    }
+    for resolution in candidates.get(bucket, ()):
+        if all(date is None or date == truncate(date, resolution) for date in (start, end)):
+            return resolution
+    return None
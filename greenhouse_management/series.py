@@ -0,0 +1,57 @@
+import sys
+from array import array
+
+from django.db.models import IntegerField
+from django.db.models.functions import Cast
+
+from greenhouse_management.archive import archived_columns, archives_in_range
+from greenhouse_management.functions import EpochMilliseconds
+from greenhouse_management.models import Environment
+
+MAX_SERIES_POINTS = 1000000
+
+
+def environment_series(green_house, start=None, end=None, metrics=Environment.METRICS):
+    """
+    Readings of a greenhouse with start <= date < end as parallel arrays, ordered by date: 'timestamps'
+    in milliseconds since the epoch and 'metrics', a list of values per metric.
+
+    Timestamps and the stored fixed point integers are fetched with values_list and the values scaled in bulk,
+    no model instance, datetime or Decimal is built per reading. Archived readings are read from their files.
+    At most MAX_SERIES_POINTS readings are returned, continue from the last timestamp for more.
+    """
+    multipliers = [Environment._meta.get_field(metric).multiplier for metric in metrics]
+    columns = [EpochMilliseconds("date"), *[Cast(metric, IntegerField()) for metric in metrics]]
+    rows = Environment.objects.in_range(green_house, start, end).order_by("date", "id").values_list(*columns)
+
+    columns = list(zip(*rows[:MAX_SERIES_POINTS])) or [()] * len(columns)
+    archives = list(archives_in_range([green_house], start, end))
+    if archives:
+        archived = [archived_columns(archive, start, end, ["timestamp", *metrics]) for archive in archives]
+        columns = [
+            [value for part in archived for value in part[name]] + list(column)
+            for name, column in zip(["timestamp", *metrics], columns)
+        ]
+        # Readings stored after their month was archived are newer rows of older dates.
+        order = sorted(range(len(columns[0])), key=columns[0].__getitem__)[:MAX_SERIES_POINTS]
+        columns = [[column[index] for index in order] for column in columns]
+
+    return {
+        "timestamps": list(columns[0]),
+        "metrics": {
+            metric: [value / multiplier for value in column]
+            for metric, multiplier, column in zip(metrics, multipliers, columns[1:])
+        },
+    }
+
+
+def pack_series(series):
+    """
+    Little-endian binary form of environment_series(): the timestamps as int64,
+    followed by the values of every metric as float32, each array as long as the timestamps.
+    """
+    parts = [array("q", series["timestamps"])] + [array("f", values) for values in series["metrics"].values()]
+    if sys.byteorder == "big":
+        for part in parts:
+            part.byteswap()
+    return b"".join(part.tobytes() for part in parts)
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from greenhouse_management.current_environment import refresh_current_environment, update_current_environments
+from greenhouse_management.models import Environment, EnvironmentArchive
+from greenhouse_management.rollups import rebuild_day_rollups, update_rollups
+
+
+@receiver(post_save, sender=Environment)
+def update_environment_rollups(sender, instance, created, raw=False, **kwargs):
+    """Keep rollups and the current environment in line with readings saved one by one,
+    bulk ingest updates them itself."""
+    if raw:
+        return
+    if created:
+        update_rollups([instance])
+        update_current_environments([instance])
+    else:
+        rebuild_day_rollups(instance.date, green_houses=[instance.green_house_id])
+        refresh_current_environment(instance.green_house_id)
+
+
+@receiver(post_delete, sender=EnvironmentArchive)
+def delete_environment_archive_file(sender, instance, **kwargs):
+    """Archives go away with their greenhouse, so do their files."""
+    (settings.ARCHIVE_ROOT / instance.file).unlink(missing_ok=True)
@@ -0,0 +1,86 @@
+import math
+import random
+
+from greenhouse_management.models import Environment
+
+
+def _clamp(value, low, high):
+    return min(max(value, low), high)
+
+
+def solar(date):
+    """
+    Daylight, 0 at night and up to 1 at solar noon in midsummer, and the diurnal phase,
+    -1 at 03:00 and 1 at 15:00, of a UTC date taken as local solar time.
+    """
+    hour = date.hour + date.minute / 60 + date.second / 3600
+    season = 0.8 + 0.2 * math.cos(2 * math.pi * (date.timetuple().tm_yday - 172) / 365.25)
+    daylight = max(0.0, math.sin(math.pi * (hour - 6) / 12)) * season
+    diurnal = math.sin(2 * math.pi * (hour - 9) / 24)
+    return daylight, diurnal
+
+
+class GreenHouseSimulator:
+    """Physical state of one greenhouse, advanced by one reading at a time."""
+
+    def __init__(self, green_house_id, interval, rng):
+        self.green_house_id = green_house_id
+        self.hours = interval.total_seconds() / 3600
+        self.rng = rng
+        self.base_temperature = rng.uniform(18, 24)
+        self.temperature_swing = rng.uniform(3, 7)
+        self.peak_par = rng.uniform(600, 950)
+        self.growth = rng.uniform(2, 6) / 24
+        self.weight = rng.uniform(1000, 1500)
+        self.moisture = rng.uniform(40, 55)
+        self.salinity = rng.uniform(1.2, 2.5)
+        self.soil_temperature = self.base_temperature - 2
+        self.drift = 0.0
+
+    def reading(self, daylight, diurnal):
+        """Metric values of the next reading, for the sun position given by solar()."""
+        rng = self.rng
+        self.drift = 0.9 * self.drift + rng.gauss(0, 0.3)
+        temperature = self.base_temperature + self.temperature_swing * diurnal + self.drift
+        # The soil follows the air slowly and a few degrees cooler.
+        self.soil_temperature += (temperature - 2 - self.soil_temperature) * min(1.0, self.hours / 3)
+
+        # Plants and sun dry the soil until it is irrigated again, salts concentrate as it dries.
+        self.moisture -= (0.2 + daylight) * self.hours
+        if self.moisture < 30:
+            self.moisture = rng.uniform(55, 60)
+        self.salinity = _clamp(self.salinity + rng.gauss(0, 0.01), 1, 3)
+        self.weight += self.growth * self.hours * (0.5 + daylight)
+
+        par = _clamp(self.peak_par * daylight * (1 + rng.gauss(0, 0.05)), 0, 999)
+        return {
+            "temperature": round(temperature, 2),
+            "air_humidity": round(_clamp(75 - 3 * (temperature - self.base_temperature) + rng.gauss(0, 1.5), 30, 99), 2),
+            "light_level": round(_clamp(par * 1.05, 0, 999.99), 2),
+            "par": round(par, 2),
+            "co2_level": round(_clamp(800 - 350 * daylight + rng.gauss(0, 10), 350, 999), 2),
+            "soil_moisture_level": round(self.moisture, 2),
+            "soil_salinity": round(self.salinity * math.sqrt(55 / self.moisture), 2),
+            "soil_temperature": round(self.soil_temperature, 2),
+            "weight_of_soil_and_plants": round(self.weight + 2 * self.moisture, 2),
+            "stem_micro_variability": round(
+                _clamp(0.05 + 0.6 * daylight * (1 - self.moisture / 60) + rng.gauss(0, 0.03), 0, 0.99), 2
+            ),
+        }
+
+
+def generate_environments(green_house_ids, start, interval, steps, seed=None):
+    """
+    Yield unsaved Environment readings of every greenhouse, 'steps' times 'interval' apart from 'start'.
+
+    Readings are generated time step by time step, the sun position is computed once per step for the whole fleet,
+    and only the state of every greenhouse is kept, so any number of readings can be streamed into bulk_create.
+    """
+    rng = random.Random(seed)
+    simulators = [GreenHouseSimulator(green_house_id, interval, rng) for green_house_id in green_house_ids]
+    for step in range(steps):
+        date = start + step * interval
+        daylight, diurnal = solar(date)
+        for simulator in simulators:
+            yield Environment(green_house_id=simulator.green_house_id, date=date,
+                              **simulator.reading(daylight, diurnal))
@@ -1,7 +1,46 @@
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import OperationalError, connection
+from django.db.models import Avg
+from django.core.servers.basehttp import WSGIServer
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.test.testcases import LiveServerThread, QuietWSGIRequestHandler
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from .aggregation import aggregate_environments
+from .current_environment import refresh_current_environment
+from .archive import archive_environments, archived_environments
+from .backfill import Checkpoint, GreenHouseResolver
+from .buffer import BUFFER_FULL, WriteBehindBuffer
+from .codec import MAX_BLOCK_SIZE, CodecError, decode_columns, encode_columns, encode_readings, read_readings
+from .ingest import CONFLICTING_READING, ingest_environments
+from .instrumentation import operation_stats
+from .messaging import FileSource, Message, MessageIngestWorker, SocketSource, TopicResolver
+from .jobs import WORKER_LOST, enqueue, enqueue_periodic, job_handler, run_next
 from .models import *
-from datetime import datetime
+from graphql_jwt.shortcuts import get_token
+from prometheus_client import REGISTRY
+from .retention import ensure_month_partitions, prune_environments
+from .series import environment_series
+from .rollups import rebuild_day_rollups, rebuild_rollups, rollup_resolution
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import skipUnless
+import base64
+import csv
+import fcntl
+import gzip
+import json
+import struct
+import socket
+import tempfile
+import threading
+import time
 
 
 class UsersManagersTests(TestCase):
@@ -161,3 +200,1195 @@ class EnvironmentTestCase(TestCase):
         obj = self.create_environment()
         self.assertTrue(isinstance(obj, Environment))
         self.assertTrue(Environment.objects.get(id=obj.id))
+
+    def test_environment_in_range(self):
+        first = self.create_environment(date=timezone.make_aware(datetime(2023, 10, 17, 12)))
+        second = Environment.objects.get(pk=first.pk)
+        second.pk = None
+        second.date = timezone.make_aware(datetime(2023, 10, 17, 13))
+        second.save()
+
+        self.assertEqual(list(Environment.objects.in_range(first.green_house)), [first, second])
+        self.assertEqual(list(Environment.objects.in_range(start=second.date)), [second])
+        self.assertEqual(list(Environment.objects.in_range(first.green_house, end=second.date)), [first])
+
+    def test_metrics_are_stored_as_fixed_point(self):
+        environment = self.create_environment(temperature=Decimal("21.37"), weight_of_soil_and_plants=123456.78)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT temperature, weight_of_soil_and_plants FROM greenhouse_management_environment")
+            self.assertEqual(cursor.fetchone(), (2137, 12345678))
+
+        environment.refresh_from_db()
+        self.assertEqual(environment.temperature, Decimal("21.37"))
+        self.assertEqual(environment.weight_of_soil_and_plants, Decimal("123456.78"))
+        self.assertTrue(Environment.objects.filter(temperature__gt=Decimal("21.36"), temperature__lt=21.38).exists())
+        self.assertEqual(Environment.objects.aggregate(avg=Avg("temperature"))["avg"], Decimal("21.37"))
+
+        environment.temperature = Decimal("21.375")
+        with self.assertRaises(ValidationError):
+            environment.full_clean()
+
+
+class EnvironmentIngestViewTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user(email="owner@user.com", password="foo")
+        location = Location.objects.create(name="Bialystok", coordinates=(42.12345, -71.98765), owner=owner)
+        self.green_house = GreenHouse.objects.create(name="Green house", location=location, owner=owner)
+        self.reading = {
+            "greenhouse": self.green_house.id,
+            "date": "2023-10-17T12:00:00+00:00",
+            "temperature": "12.00",
+            "air_humidity": "60.00",
+            "light_level": "100.00",
+            "par": "400.00",
+            "co2_level": "500.00",
+            "soil_moisture_level": "40.00",
+            "soil_salinity": "1.50",
+            "soil_temperature": "20.00",
+            "weight_of_soil_and_plants": "1000.00",
+            "stem_micro_variability": "0.20",
+        }
+
+    def test_ndjson_ingest(self):
+        lines = [
+            json.dumps(self.reading),
+            "",
+            "{not json",
+            json.dumps({**self.reading, "greenhouse": self.green_house.id + 1}),
+            json.dumps({**self.reading, "date": "2023-10-17T12:01:00+00:00"}),
+        ]
+        response = self.client.post("/ingest/environments/", "\n".join(lines), content_type="application/x-ndjson")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 2)
+        self.assertEqual(response.json()["failed"], 2)
+        self.assertEqual([error["row"] for error in response.json()["errors"]], [2, 3])
+        self.assertEqual(Environment.objects.filter(green_house=self.green_house).count(), 2)
+
+    def test_ndjson_ingest_too_long_value(self):
+        lines = [
+            json.dumps({**self.reading, "temperature": "1234567890123456789012345678.123"}),
+            json.dumps({**self.reading, "date": "2023-10-17T12:01:00+00:00"}),
+        ]
+        response = self.client.post("/ingest/environments/", "\n".join(lines), content_type="application/x-ndjson")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 1)
+        self.assertEqual([error["row"] for error in response.json()["errors"]], [1])
+        self.assertIn("temperature", response.json()["errors"][0]["error"])
+
+    def test_csv_ingest(self):
+        header = ",".join(self.reading)
+        rows = [
+            ",".join(str(value) for value in self.reading.values()),
+            ",".join(str(value) if key != "temperature" else "" for key, value in self.reading.items()),
+        ]
+        response = self.client.post("/ingest/environments/", "\n".join([header, *rows]), content_type="text/csv")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 1)
+        self.assertEqual(response.json()["errors"][0]["row"], 2)
+        self.assertEqual(Environment.objects.get().temperature, Decimal("12.00"))
+
+    def test_csv_ingest_invalid_utf8(self):
+        header = ",".join(self.reading).encode()
+        row = ",".join(str(value) for value in self.reading.values()).encode()
+        body = b"\n".join([header, row.replace(b"12", b"\xff12", 1), row])
+        response = self.client.post("/ingest/environments/", body, content_type="text/csv")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 1)
+        self.assertEqual(response.json()["errors"], [{"row": 1, "error": "Invalid UTF-8"}])
+
+    def test_retried_ingest(self):
+        body = "\n".join([
+            json.dumps(self.reading),
+            json.dumps({**self.reading, "date": "2023-10-17T12:01:00+00:00"}),
+            json.dumps({**self.reading, "date": "2023-10-17T14:01:00+02:00", "temperature": "13.00"}),
+        ])
+        response = self.client.post("/ingest/environments/", body, content_type="application/x-ndjson")
+        self.assertEqual((response.json()["created"], response.json()["duplicates"]), (2, 0))
+        self.assertEqual(response.json()["errors"], [{"row": 3, "error": CONFLICTING_READING}])
+        rollups = list(EnvironmentRollup.objects.values_list("count", "total"))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/ingest/environments/", body, content_type="application/x-ndjson")
+        self.assertEqual((response.json()["created"], response.json()["duplicates"], response.json()["failed"]),
+                         (0, 2, 1))
+        # The greenhouses, the stored readings and the archives that could hold them.
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(Environment.objects.count(), 2)
+        self.assertEqual(Environment.objects.get(date="2023-10-17T12:01:00Z").temperature, Decimal("12.00"))
+        self.assertEqual(list(EnvironmentRollup.objects.values_list("count", "total")), rollups)
+
+    def test_binary_ingest(self):
+        timestamps = [1697544000000 + 60000 * number for number in range(50)]
+        columns = [[int(Decimal(self.reading[metric]) * 100) + number for number in range(50)]
+                   for metric in Environment.METRICS]
+        body = encode_readings(self.green_house.id, timestamps, columns)
+        self.assertLess(len(body) / 50, 40)
+
+        response = self.client.post("/ingest/environments/", body + b"GHR1",
+                                    content_type="application/x-greenhouse-readings")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 50)
+        self.assertEqual(response.json()["errors"], [{"row": 51, "error": "Invalid binary readings: Truncated header."}])
+        environment = Environment.objects.get(date="2023-10-17T12:01:00Z")
+        self.assertEqual((environment.temperature, environment.co2_level), (Decimal("12.01"), Decimal("500.01")))
+
+        body = encode_readings(self.green_house.id, [2 ** 62], [[1] for metric in Environment.METRICS])
+        response = self.client.post("/ingest/environments/", body, content_type="application/x-greenhouse-readings")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["errors"],
+                         [{"row": 1, "error": "Invalid binary readings: Timestamps out of range."}])
+
+    def test_unsupported_content_type(self):
+        response = self.client.post("/ingest/environments/", "<xml/>", content_type="application/xml")
+        self.assertEqual(response.status_code, 415)
+
+
+class EnvironmentRollupTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user(email="owner@user.com", password="foo")
+        location = Location.objects.create(name="Bialystok", coordinates=(42.12345, -71.98765), owner=owner)
+        self.green_house = GreenHouse.objects.create(name="Green house", location=location, owner=owner)
+
+    def reading(self, date, temperature):
+        return {
+            "greenhouse": self.green_house.id, "date": date, "temperature": temperature, "air_humidity": 60,
+            "light_level": 100, "par": 400, "co2_level": 500, "soil_moisture_level": 40, "soil_salinity": 1.5,
+            "soil_temperature": 20, "weight_of_soil_and_plants": 1000, "stem_micro_variability": 0.2,
+        }
+
+    def rollups(self):
+        return list(EnvironmentRollup.objects.filter(metric="temperature").order_by("resolution", "bucket")
+                    .values_list("resolution", "bucket", "count", "minimum", "maximum", "total"))
+
+    def test_ingest_updates_rollups(self):
+        day = timezone.make_aware(datetime(2023, 10, 17))
+        ingest_environments([self.reading(day + timedelta(minutes=10), 10), self.reading(day + timedelta(minutes=20), 20)])
+        ingest_environments([self.reading(day + timedelta(minutes=70), 5)])
+
+        self.assertEqual(self.rollups(), [
+            ("day", day, 3, Decimal("5.00"), Decimal("20.00"), Decimal("35.00")),
+            ("hour", day, 2, Decimal("10.00"), Decimal("20.00"), Decimal("30.00")),
+            ("hour", day + timedelta(hours=1), 1, Decimal("5.00"), Decimal("5.00"), Decimal("5.00")),
+        ])
+
+        incremental = self.rollups()
+        EnvironmentRollup.objects.all().delete()
+        self.assertEqual(rebuild_rollups(), 3 * len(Environment.METRICS))
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_deadlocked_ingest_is_retried(self):
+        class DeadlockDetected(Exception):
+            pgcode = "40P01"
+
+        table = EnvironmentRollup._meta.db_table
+        deadlocks = []
+
+        def deadlock_once(execute, sql, params, many, context):
+            if table in sql and not deadlocks:
+                deadlocks.append(sql)
+                raise OperationalError("deadlock detected") from DeadlockDetected()
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(deadlock_once):
+            [(environment, error)] = ingest_environments([self.reading(timezone.make_aware(datetime(2023, 10, 17)), 10)])
+        self.assertIsNone(error)
+        self.assertEqual(len(deadlocks), 1)
+        self.assertEqual(Environment.objects.count(), 1)
+        self.assertEqual(EnvironmentRollup.objects.filter(metric="temperature").count(), 2)
+
+    def test_rebuild_day_rollups(self):
+        day = timezone.make_aware(datetime(2023, 10, 17))
+        [(first, _), (second, _)] = ingest_environments([self.reading(day, 10),
+                                                         self.reading(day + timedelta(minutes=1), 20)])
+        second.delete()
+        rebuild_day_rollups(second.date, green_houses=[self.green_house.id])
+
+        self.assertEqual(self.rollups(), [
+            ("day", day, 1, Decimal("10.00"), Decimal("10.00"), Decimal("10.00")),
+            ("hour", day, 1, Decimal("10.00"), Decimal("10.00"), Decimal("10.00")),
+        ])
+
+    def test_rollup_resolution(self):
+        day = timezone.make_aware(datetime(2023, 10, 17))
+        self.assertEqual(rollup_resolution(day, None, "day"), EnvironmentRollup.Resolutions.DAY)
+        self.assertEqual(rollup_resolution(day + timedelta(hours=1), None, "day"), EnvironmentRollup.Resolutions.HOUR)
+        self.assertEqual(rollup_resolution(day, day + timedelta(minutes=30), "hour"), None)
+        self.assertEqual(rollup_resolution(None, None, "minute"), None)
+
+
+@override_settings(GRAPHQL_STATS_EXTENSION=True)
+class RequestStatsTestCase(TestCase):
+    def setUp(self):
+        operation_stats.clear()
+        owner = get_user_model().objects.create_user(email="owner@user.com", password="foo")
+        location = Location.objects.create(name="Bialystok", coordinates=(42.12345, -71.98765), owner=owner)
+        self.green_house = GreenHouse.objects.create(name="Green house", location=location, owner=owner)
+
+    def test_graphql_stats(self):
+        reading = {
+            "greenhouse": self.green_house.id, "date": "2023-10-17T12:00:00+00:00", "temperature": 12,
+            "airHumidity": 60, "lightLevel": 100, "par": 400, "co2Level": 500, "soilMoistureLevel": 40,
+            "soilSalinity": 1.5, "soilTemperature": 20, "weightOfSoilAndPlants": 1000, "stemMicroVariability": 0.2,
+        }
+        query = ("mutation Ingest($input: [EnvironmentInput!]!) "
+                 "{ createEnvironments(input: $input) { created, duplicates } }")
+        response = self.client.post("/graphql/", {"query": query, "variables": {"input": [reading, reading]}},
+                                    content_type="application/json")
+
+        stats = response.json()["extensions"]["stats"]
+        self.assertEqual(response.json()["data"], {"createEnvironments": {"created": 1, "duplicates": 1}})
+        self.assertEqual(stats["operation"], "mutation createEnvironments")
+        self.assertGreater(stats["sqlCount"], 0)
+        self.assertGreater(stats["resolverTime"], 0)
+
+        [summary] = operation_stats.summary()
+        self.assertEqual(summary["operation"], "mutation createEnvironments")
+        self.assertEqual(summary["count"], 1)
+        self.assertGreaterEqual(summary["max_sql_count"], stats["sqlCount"])
+        self.assertEqual(summary["avg_response_size"], len(response.content))
+
+    def test_metrics(self):
+        ingested = ("greenhouse_ingested_rows_total", {"greenhouse": str(self.green_house.id)})
+        before = REGISTRY.get_sample_value(*ingested) or 0
+        body = "\n".join([
+            json.dumps({
+                "greenhouse": self.green_house.id, "date": "2023-10-17T12:00:00+00:00", "temperature": 12,
+                "air_humidity": 60, "light_level": 100, "par": 400, "co2_level": 500, "soil_moisture_level": 40,
+                "soil_salinity": 1.5, "soil_temperature": 20, "weight_of_soil_and_plants": 1000,
+                "stem_micro_variability": 0.2,
+            }),
+            json.dumps({"greenhouse": self.green_house.id + 1, "date": "2023-10-17T12:00:00+00:00"}),
+        ])
+        self.client.post("/ingest/environments/", body, content_type="application/x-ndjson")
+        self.client.post("/graphql/", {"query": "query Broken { missing }"}, content_type="application/json")
+        self.client.post("/graphql/", {"query": "query Any { __typename }"}, content_type="application/json")
+
+        self.assertEqual(REGISTRY.get_sample_value(*ingested), before + 1)
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('greenhouse_requests_total{operation="POST /ingest/environments/",status="200"}', content)
+        # Client chosen operation names are not labels.
+        self.assertIn('greenhouse_graphql_errors_total{operation="other"}', content)
+        self.assertIn('greenhouse_requests_total{operation="other",status="200"}', content)
+        self.assertNotIn("Broken", content)
+        self.assertNotIn("Any", content)
+        self.assertIn("greenhouse_request_sql_queries_bucket", content)
+
+
+class SeedTelemetryTestCase(TestCase):
+    def test_seed_telemetry(self):
+        start = timezone.make_aware(datetime(2023, 6, 21))
+        call_command("seed_telemetry", locations=2, greenhouses=3, devices=2, days=2, interval=3600,
+                     start=start, seed=1, chunk_size=10, stdout=StringIO())
+
+        self.assertEqual(GreenHouse.objects.count(), 3)
+        self.assertEqual(Device.objects.count(), 6)
+        self.assertEqual(Environment.objects.count(), 3 * 48)
+        readings = Environment.objects.filter(green_house=GreenHouse.objects.first())
+        self.assertEqual(readings.get(date=start).par, 0)
+        self.assertGreater(readings.get(date=start + timedelta(hours=12)).par, 500)
+        self.assertLess(readings.get(date=start + timedelta(hours=3)).temperature,
+                        readings.get(date=start + timedelta(hours=15)).temperature)
+        weights = list(readings.values_list("weight_of_soil_and_plants", flat=True))
+        self.assertGreater(weights[-1], weights[0])
+        self.assertEqual(CurrentEnvironment.objects.count(), 3)
+        self.assertEqual(EnvironmentRollup.objects.filter(resolution="day", metric="par").count(), 3 * 2)
+
+    def test_benchmark_environment_range(self):
+        with self.assertRaises(CommandError):
+            call_command("benchmark_environment_range", queries=0)
+        out = StringIO()
+        call_command("benchmark_environment_range", seed=60, greenhouses=2, queries=3, stdout=out)
+        self.assertEqual(Environment.objects.count(), 60)
+        self.assertIn("queries: 3", out.getvalue())
+
+
+class SingleThreadedLiveServerThread(LiveServerThread):
+    # The in-memory test database is a single SQLite connection shared by the server threads,
+    # concurrent transactions on it would collide, so requests are served one at a time.
+    def _create_server(self, connections_override=None):
+        return WSGIServer((self.host, self.port), QuietWSGIRequestHandler, allow_reuse_address=False)
+
+
+class LoadTestCommandTestCase(LiveServerTestCase):
+    server_thread_class = SingleThreadedLiveServerThread
+
+    def test_load_test(self):
+        owner = get_user_model().objects.create_user(email="owner@user.com", password="foo")
+        location = Location.objects.create(name="Bialystok", coordinates=(42.12345, -71.98765), owner=owner)
+        green_house = GreenHouse.objects.create(name="Green house", location=location, owner=owner)
+        green_house.authorized_users.set([owner])
+
+        stdout = StringIO()
+        call_command("load_test", url=f"{self.live_server_url}/graphql/", email="owner@user.com", password="foo",
+                     gateways=2, dashboards=1, duration=1, gateway_interval=0.1, dashboard_interval=0.1, seed=1,
+                     stdout=stdout)
+
+        report = stdout.getvalue()
+        self.assertIn("createEnvironment", report)
+        self.assertNotIn("error:", report)
+        self.assertGreater(Environment.objects.filter(green_house=green_house).count(), 0)
+
+
+class EnvironmentSeriesViewTestCase(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(email="owner@user.com", password="foo")
+        location = Location.objects.create(name="Bialystok", coordinates=(42.12345, -71.98765), owner=self.owner)
+        self.green_house = GreenHouse.objects.create(name="Green house", location=location, owner=self.owner)
+        start = timezone.make_aware(datetime(2023, 10, 17, 12))
+        ingest_environments([
+            {
+                "greenhouse": self.green_house.id, "date": start + timedelta(minutes=minute), "temperature": 20.5,
+                "air_humidity": 60, "light_level": 100, "par": minute, "co2_level": 500, "soil_moisture_level": 40,
+                "soil_salinity": 1.5, "soil_temperature": 20, "weight_of_soil_and_plants": 1000,
+                "stem_micro_variability": 0.2,
+            }
+            for minute in range(3)
+        ])
+        self.timestamps = [round((start + timedelta(minutes=minute)).timestamp() * 1000) for minute in range(3)]
+
+    def get(self, user, **params):
+        return self.client.get("/series/environments/", {"greenhouse": self.green_house.id, **params},
+                               HTTP_AUTHORIZATION=f"JWT {get_token(user)}")
+
+    def test_json(self):
+        response = self.get(self.owner, metrics="temperature,par")
+        self.assertEqual(response.json(), {
+            "count": 3,
+            "timestamps": self.timestamps,
+            "metrics": {"temperature": [20.5, 20.5, 20.5], "par": [0.0, 1.0, 2.0]},
+        })
+
+    def test_binary(self):
+        response = self.get(self.owner, metrics="temperature,par", format="binary", **{"from": "2023-10-17T12:01:00Z"})
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+        self.assertEqual(response["X-Series-Count"], "2")
+        self.assertEqual(struct.unpack("<2q2f2f", response.content),
+                         (*self.timestamps[1:], 20.5, 20.5, 1.0, 2.0))
+
+    def test_errors(self):
+        stranger = get_user_model().objects.create_user(email="stranger@user.com", password="foo")
+        self.assertEqual(self.client.get("/series/environments/", {"greenhouse": self.green_house.id}).status_code, 401)
+        self.assertEqual(self.get(stranger).status_code, 403)
+        self.assertEqual(self.get(self.owner, metrics="temperature,unknown").status_code, 400)
+        self.assertEqual(self.get(self.owner, **{"from": "2023-13-45T00:00:00"}).status_code, 400)
+        self.assertEqual(self.get(self.owner, greenhouse=self.green_house.id + 1).status_code, 404)
+
+
+class EnvironmentExportViewTestCase(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(email="owner@user.com", password="foo")
+        location = Location.objects.create(name="Bialystok", coordinates=(42.12345, -71.98765), owner=self.owner)
+        self.green_houses = [
+            GreenHouse.objects.create(name=f"Green house {number}", location=location, owner=self.owner)
+            for number in range(2)
+        ]
+        start = timezone.make_aware(datetime(2023, 10, 17, 12))
+        ingest_environments([
+            {
+                "greenhouse": green_house.id, "date": start + timedelta(hours=hour), "temperature": 20.5 + hour,
+                "air_humidity": 60, "light_level": 100, "par": 400, "co2_level": 500, "soil_moisture_level": 40,
+                "soil_salinity": 1.5, "soil_temperature": 20, "weight_of_soil_and_plants": 1000.25,
+                "stem_micro_variability": 0.2,
+            }
+            for green_house in self.green_houses for hour in range(2)
+        ])
+
+    def get(self, user, **params):
+        return self.client.get("/export/environments/", params, HTTP_AUTHORIZATION=f"JWT {get_token(user)}")
+
+    def test_csv(self):
+        response = self.get(self.owner, greenhouse=self.green_houses[1].id, **{"from": "2023-10-17T13:00:00Z"})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(b"".join(response.streaming_content).decode().splitlines(), [
+            "greenhouse,date,temperature,air_humidity,light_level,par,co2_level,soil_moisture_level,soil_salinity,"
+            "soil_temperature,weight_of_soil_and_plants,stem_micro_variability",
+            f"{self.green_houses[1].id},2023-10-17T13:00:00+00:00,21.50,60.00,100.00,400.00,500.00,40.00,1.50,20.00,"
+            "1000.25,0.20",
+        ])
+
+    def test_gzip(self):
+        response = self.get(self.owner, gzip="1")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 1 + 4)
+
+    def test_permissions(self):
+        stranger = get_user_model().objects.create_user(email="stranger@user.com", password="foo")
+        self.assertEqual(self.client.get("/export/environments/").status_code, 401)
+        lines = b"".join(self.get(stranger).streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+
+
+class JobTestCase(TestCase):
+    def setUp(self):
+        jobs_root = tempfile.TemporaryDirectory()
+        self.addCleanup(jobs_root.cleanup)
+        overridden = override_settings(JOBS_ROOT=Path(jobs_root.name))
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        self.owner = get_user_model().objects.create_user(email="owner@user.com", password="foo")
+        location = Location.objects.create(name="Bialystok", coordinates=(42.12345, -71.98765), owner=self.owner)
+        self.green_house = GreenHouse.objects.create(name="Green house", location=location, owner=self.owner)
+        self.start = timezone.make_aware(datetime(2023, 10, 17, 12))
+        ingest_environments([
+            {
+                "greenhouse": self.green_house.id, "date": self.start + timedelta(hours=hour), "temperature": 20,
+                "air_humidity": 60, "light_level": 100, "par": 400, "co2_level": 500, "soil_moisture_level": 40,
+                "soil_salinity": 1.5, "soil_temperature": 20, "weight_of_soil_and_plants": 1000,
+                "stem_micro_variability": 0.2,
+            }
+            for hour in range(30)
+        ])
+
+    def test_export(self):
+        job = enqueue(Job.Kinds.EXPORT, {"greenhouse": self.green_house.id, "gzip": True}, user=self.owner)
+        call_command("run_jobs", once=True, stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Statuses.SUCCEEDED)
+        self.assertEqual(job.progress, 1)
+        self.assertEqual(job.result["rows"], 30)
+        response = self.client.get(f"/jobs/{job.id}/file/", HTTP_AUTHORIZATION=f"JWT {get_token(self.owner)}")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertEqual(len(gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()), 1 + 30)
+
+        stranger = get_user_model().objects.create_user(email="stranger@user.com", password="foo")
+        response = self.client.get(f"/jobs/{job.id}/file/", HTTP_AUTHORIZATION=f"JWT {get_token(stranger)}")
+        self.assertEqual(response.status_code, 403)
+
+    def test_rebuild_rollups(self):
+        EnvironmentRollup.objects.all().delete()
+        job = enqueue(Job.Kinds.REBUILD_ROLLUPS)
+        job = run_next("test")
+        self.assertEqual(job.status, Job.Statuses.SUCCEEDED)
+        self.assertEqual(job.result["rows"], EnvironmentRollup.objects.count())
+        days = EnvironmentRollup.objects.filter(resolution=EnvironmentRollup.Resolutions.DAY, metric="temperature")
+        self.assertEqual(list(days.order_by("bucket").values_list("count", flat=True)), [12, 18])
+
+    def test_background_import(self):
+        body = "\n".join(json.dumps({
+            "greenhouse": self.green_house.id, "date": (self.start - timedelta(hours=hour + 1)).isoformat(),
+            "temperature": 19, "air_humidity": 60, "light_level": 100, "par": 400, "co2_level": 500,
+            "soil_moisture_level": 40, "soil_salinity": 1.5, "soil_temperature": 20,
+            "weight_of_soil_and_plants": 1000, "stem_micro_variability": 0.2,
+        }) for hour in range(5))
+        response = self.client.post("/ingest/environments/?background=1", body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 401)
+
+        response = self.client.post("/ingest/environments/?background=1", body, content_type="application/x-ndjson",
+                                    HTTP_AUTHORIZATION=f"JWT {get_token(self.owner)}")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Environment.objects.count(), 30)
+
+        job = run_next("test")
+        self.assertEqual(job.pk, response.json()["job"])
+        self.assertEqual(job.created_by, self.owner)
+        self.assertEqual(job.status, Job.Statuses.SUCCEEDED)
+        self.assertEqual(job.result, {"created": 5, "duplicates": 0, "failed": 0, "errors": []})
+        self.assertEqual(Environment.objects.count(), 35)
+        self.assertFalse(Path(job.params["path"]).exists())
+
+    @override_settings(INGEST_BACKGROUND_MAX_SIZE=100)
+    def test_background_import_size_limit(self):
+        response = self.client.post("/ingest/environments/?background=1", "{}\n" * 51,
+                                    content_type="application/x-ndjson",
+                                    HTTP_AUTHORIZATION=f"JWT {get_token(self.owner)}")
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(list(settings.JOBS_ROOT.iterdir()), [])
+        self.assertFalse(Job.objects.exists())
+
+    def test_retries(self):
+        @job_handler("broken")
+        def broken(job):
+            raise RuntimeError("Disk full")
+
+        job = Job.objects.create(kind="broken", max_attempts=2)
+        job = run_next("test")
+        self.assertEqual((job.status, job.attempts, job.error), (Job.Statuses.QUEUED, 1, "RuntimeError: Disk full"))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIsNone(run_next("test"))
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        job = run_next("test")
+        self.assertEqual((job.status, job.attempts), (Job.Statuses.FAILED, 2))
+        self.assertIsNone(run_next("test"))
+
+    def test_stale_jobs_are_reclaimed(self):
+        job = enqueue(Job.Kinds.REBUILD_ROLLUPS)
+        Job.objects.filter(pk=job.pk).update(status=Job.Statuses.RUNNING, worker="lost", attempts=1,
+                                             heartbeat_at=timezone.now() - timedelta(hours=1))
+        job = run_next("test")
+        self.assertEqual((job.status, job.worker, job.attempts), (Job.Statuses.SUCCEEDED, "test", 2))
+
+    def test_stale_jobs_without_attempts_left_fail(self):
+        job = enqueue(Job.Kinds.REBUILD_ROLLUPS, max_attempts=2)
+        Job.objects.filter(pk=job.pk).update(status=Job.Statuses.RUNNING, worker="lost", attempts=2,
+                                             heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertIsNone(run_next("test"))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.attempts), (Job.Statuses.FAILED, "lost", 2))
+        self.assertEqual(job.error, WORKER_LOST)
+
+
+class RetentionTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user(email="owner@user.com", password="foo")
+        location = Location.objects.create(name="Bialystok", coordinates=(42.12345, -71.98765), owner=owner)
+        self.short = GreenHouse.objects.create(name="Short", location=location, owner=owner, raw_retention_days=2)
+        self.default = GreenHouse.objects.create(name="Default", location=location, owner=owner)
+        self.now = timezone.make_aware(datetime(2023, 10, 17, 12))
+        ingest_environments([
+            {
+                "greenhouse": green_house.id, "date": self.now - timedelta(hours=12 * number), "temperature": 20,
+                "air_humidity": 60, "light_level": 100, "par": 400, "co2_level": 500, "soil_moisture_level": 40,
+                "soil_salinity": 1.5, "soil_temperature": 20, "weight_of_soil_and_plants": 1000,
+                "stem_micro_variability": 0.2,
+            }
+            for green_house in (self.short, self.default) for number in range(10)
+        ])
+
+    def test_prune(self):
+        rollups = EnvironmentRollup.objects.count()
+        progress = []
+        with CaptureQueriesContext(connection) as queries:
+            result = prune_environments(self.now, chunk_size=2, on_progress=progress.append)
+
+        self.assertEqual(result, {"dropped_partitions": 0, "deleted": 5})
+        self.assertEqual(Environment.objects.filter(green_house=self.short).count(), 5)
+        self.assertEqual(Environment.objects.filter(green_house=self.default).count(), 10)
+        self.assertEqual(EnvironmentRollup.objects.count(), rollups)
+        # Not counting the moves of readings out of the default partition on PostgreSQL.
+        table = Environment._meta.db_table
+        deletes = [query for query in queries.captured_queries if query["sql"].startswith(f'DELETE FROM "{table}" ')]
+        self.assertEqual(len(deletes), 3)
+        # After every deleted chunk, so long prunes of one greenhouse keep the job alive, and every greenhouse.
+        self.assertEqual(len(progress), 3 + 2)
+        self.assertEqual(progress[-1], 1)
+
+    @skipUnless(connection.vendor == "postgresql", "Only PostgreSQL tables are partitioned.")
+    def test_partition_takes_over_default_partition_readings(self):
+        # The test database was partitioned around today, the readings of 2023 are in the default partition.
+        table = Environment._meta.db_table
+        self.assertEqual(ensure_month_partitions(self.now, ahead=0), 1)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}_p202310")
+            self.assertEqual(cursor.fetchone()[0], 20)
+            cursor.execute(f"SELECT COUNT(*) FROM {table}_default")
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertEqual(Environment.objects.count(), 20)
+
+    def test_rebuild_keeps_pruned_rollups(self):
+        rollups = sorted(EnvironmentRollup.objects.values_list("green_house", "bucket", "metric", "count"))
+        prune_environments(self.now)
+
+        rebuild_rollups()
+        rebuild_day_rollups(self.now - timedelta(days=4), green_houses=[self.short.id])
+        self.assertEqual(sorted(EnvironmentRollup.objects.values_list("green_house", "bucket", "metric", "count")),
+                         rollups)
+
+    @override_settings(ENVIRONMENT_RETENTION_DAYS=1)
+    def test_default_retention(self):
+        self.assertEqual(prune_environments(self.now)["deleted"], 5 + 7)
+        self.assertEqual(Environment.objects.filter(green_house=self.default).count(), 3)
+
+    @override_settings(ENVIRONMENT_RETENTION_DAYS=1)
+    def test_zero_days_retention(self):
+        GreenHouse.objects.filter(pk=self.default.pk).update(raw_retention_days=0)
+        prune_environments(self.now + timedelta(seconds=1))
+        self.assertFalse(Environment.objects.filter(green_house=self.default).exists())
+
+    def test_periodic_job(self):
+        jobs = enqueue_periodic(self.now)
+        self.assertEqual([job.kind for job in jobs], [Job.Kinds.ARCHIVE_ENVIRONMENTS, Job.Kinds.PRUNE_ENVIRONMENTS])
+        self.assertEqual(enqueue_periodic(self.now), [])
+        self.assertEqual(run_next("test").status, Job.Statuses.SUCCEEDED)
+        self.assertEqual(run_next("test").status, Job.Statuses.SUCCEEDED)
+        self.assertEqual(enqueue_periodic(), [])
+        self.assertEqual(len(enqueue_periodic(timezone.now() + timedelta(days=2))), 2)
+
+
+class CodecTestCase(TestCase):
+    def test_round_trip(self):
+        columns = {"timestamp": [1697544000000 + 300000 * number for number in range(100)],
+                   "temperature": [2000 + (-1) ** number * number for number in range(100)], "empty": [0] * 100}
+        data = encode_columns(columns)
+        self.assertLess(len(data), 200 * 8 // 4)
+        self.assertEqual(decode_columns(data), columns)
+        self.assertEqual(decode_columns(encode_columns({})), {})
+
+    def test_corrupt(self):
+        with self.assertRaises(CodecError):
+            decode_columns(b"nope")
+        with self.assertRaises(CodecError):
+            decode_columns(encode_columns({"value": [1, 2, 3]})[:-2])
+
+    def test_readings_round_trip(self):
+        timestamps = [1697544000000 + 10000 * number for number in range(100)]
+        columns = [[2000 + number for number in range(100)], [20] * 100, [-40000] * 100]
+        data = encode_readings(7, timestamps, columns)
+        self.assertEqual(len(data), 21 + 4 + 100 * (2 + 2 + 1 + 4))
+
+        blocks = list(read_readings(BytesIO(data + encode_readings(8, timestamps[:1], [[1], [2], [3]]))))
+        self.assertEqual(blocks, [(7, timestamps, columns), (8, timestamps[:1], [[1], [2], [3]])])
+        self.assertEqual(list(read_readings(BytesIO(encode_readings(7, [], [[]])))), [(7, [], [[]])])
+
+        with self.assertRaises(CodecError):
+            list(read_readings(BytesIO(data[:-1])))
+        with self.assertRaises(CodecError):
+            encode_readings(7, timestamps, [[2 ** 31] * 100])
+        with self.assertRaisesMessage(CodecError, "Timestamps out of range."):
+            list(read_readings(BytesIO(encode_readings(7, [2 ** 62], [[1]]))))
+
+    def test_oversized_block(self):
+        header = struct.pack("<4sIqIB", b"GHR1", 7, 1697544000000, 2 ** 32 - 1, 2) + bytes([4, 4])
+        with self.assertRaisesMessage(CodecError, "Block is larger than"):
+            list(read_readings(BytesIO(header)))
+        with self.assertRaises(CodecError):
+            # One byte per timestamp delta and four per value.
+            encode_readings(7, list(range(MAX_BLOCK_SIZE // 5 + 1)), [[2 ** 30] * (MAX_BLOCK_SIZE // 5 + 1)])
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        archive_root = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_root.cleanup)
+        overridden = override_settings(ARCHIVE_ROOT=Path(archive_root.name), ENVIRONMENT_ARCHIVE_AFTER_DAYS=10)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        owner = get_user_model().objects.create_user(email="owner@user.com", password="foo")
+        location = Location.objects.create(name="Bialystok", coordinates=(42.12345, -71.98765), owner=owner)
+        self.green_house = GreenHouse.objects.create(name="Green house", location=location, owner=owner)
+        self.now = timezone.make_aware(datetime(2023, 10, 17, 12))
+        ingest_environments([
+            {
+                "greenhouse": self.green_house.id, "date": self.now - timedelta(minutes=97 * number),
+                "temperature": 20 + number % 7 / 4, "air_humidity": 60, "light_level": 100, "par": 400,
+                "co2_level": 500, "soil_moisture_level": 40, "soil_salinity": 1.5, "soil_temperature": 20,
+                "weight_of_soil_and_plants": 1000.25, "stem_micro_variability": 0.2,
+            }
+            for number in range(600)
+        ])
+
+    def test_archive(self):
+        series = environment_series(self.green_house)
+        aggregates = aggregate_environments(self.green_house, bucket="minute", metrics=["temperature"])
+
+        self.assertEqual(archive_environments(self.now), {"months": 1, "readings": 355})
+        archive = EnvironmentArchive.objects.get()
+        self.assertEqual((archive.month, archive.count), (timezone.make_aware(datetime(2023, 9, 1)), 355))
+        self.assertEqual(Environment.objects.count(), 600 - 355)
+        self.assertLess(archive.size, 355 * 12)
+
+        self.assertEqual(environment_series(self.green_house), series)
+        self.assertEqual(aggregate_environments(self.green_house, bucket="minute", metrics=["temperature"]),
+                         aggregates)
+        self.assertEqual(archive_environments(self.now), {"months": 0, "readings": 0})
+
+    def test_late_readings_are_merged(self):
+        archive_environments(self.now)
+        late = self.now - timedelta(days=40)
+        ingest_environments([{
+            "greenhouse": self.green_house.id, "date": late, "temperature": 30, "air_humidity": 60,
+            "light_level": 100, "par": 400, "co2_level": 500, "soil_moisture_level": 40, "soil_salinity": 1.5,
+            "soil_temperature": 20, "weight_of_soil_and_plants": 1000.25, "stem_micro_variability": 0.2,
+        }])
+        series = environment_series(self.green_house, late - timedelta(minutes=97), late + timedelta(minutes=97))
+        self.assertIn(30, series["metrics"]["temperature"])
+
+        self.assertEqual(archive_environments(self.now), {"months": 1, "readings": 1})
+        self.assertEqual(EnvironmentArchive.objects.get().count, 356)
+        self.assertEqual(
+            environment_series(self.green_house, late - timedelta(minutes=97), late + timedelta(minutes=97)), series
+        )
+
+    def test_archived_readings_are_duplicates(self):
+        archive_environments(self.now)
+        archived = archived_environments([self.green_house])[:2]
+        readings = [
+            {"greenhouse": self.green_house.id, "date": environment.date,
+             **{metric: getattr(environment, metric) for metric in Environment.METRICS}}
+            for environment in archived
+        ]
+        readings[1]["temperature"] += 1
+
+        [(duplicate, error), (conflict, conflict_error)] = ingest_environments(readings)
+        self.assertIsNone(error)
+        self.assertTrue(duplicate.duplicate)
+        self.assertEqual((conflict, conflict_error), (None, CONFLICTING_READING))
+        self.assertFalse(Environment.objects.filter(date__in=[environment.date for environment in archived]).exists())
+
+    def test_archived_environments_query_count(self):
+        archive_environments(self.now)
+        with self.assertNumQueries(1):
+            environments = archived_environments([self.green_house])
+            self.assertEqual({environment.green_house.name for environment in environments}, {"Green house"})
+        self.assertEqual(len(environments), 355)
+
+    def test_rebuild_and_refresh_after_archive(self):
+        def rollups():
+            return sorted(EnvironmentRollup.objects.values_list("bucket", "resolution", "metric", "count", "minimum",
+                                                                "maximum", "total"))
+
+        before = rollups()
+        archive_environments(self.now)
+        rebuild_rollups()
+        self.assertEqual(rollups(), before)
+
+        Environment.objects.all().delete()
+        refresh_current_environment(self.green_house.id)
+        archive = EnvironmentArchive.objects.get()
+        self.assertEqual(CurrentEnvironment.objects.get().date, archive.last_date)
+        rebuild_rollups()
+        self.assertEqual(len(rollups()), len([rollup for rollup in before if rollup[0] <= archive.last_date]))
+
+    def test_export_after_archive(self):
+        jobs_root = tempfile.TemporaryDirectory()
+        self.addCleanup(jobs_root.cleanup)
+        overridden = override_settings(JOBS_ROOT=Path(jobs_root.name))
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        owner = self.green_house.owner
+        params = {"greenhouse": self.green_house.id, "from": "2023-09-20T00:00:00Z", "to": "2023-10-05T00:00:00Z"}
+
+        def export():
+            response = self.client.get("/export/environments/", params, HTTP_AUTHORIZATION=f"JWT {get_token(owner)}")
+            return b"".join(response.streaming_content).decode().splitlines()
+
+        exported = export()
+        archive_environments(self.now)
+        self.assertEqual(export(), exported)
+
+        job = enqueue(Job.Kinds.EXPORT, params, user=owner)
+        job = run_next("test")
+        self.assertEqual(job.result["rows"], len(exported) - 1)
+        self.assertEqual((settings.JOBS_ROOT / job.result["file"]).read_text().splitlines(), exported)
+
+    def test_greenhouse_deletion_removes_files(self):
+        archive_environments(self.now)
+        path = settings.ARCHIVE_ROOT / EnvironmentArchive.objects.get().file
+        self.assertTrue(path.exists())
+        self.green_house.delete()
+        self.assertFalse(path.exists())
+
+
+class WriteBehindBufferTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user(email="owner@user.com", password="foo")
+        location = Location.objects.create(name="Bialystok", coordinates=(42.12345, -71.98765), owner=owner)
+        self.green_house = GreenHouse.objects.create(name="Green house", location=location, owner=owner)
+        journal = tempfile.TemporaryDirectory()
+        self.addCleanup(journal.cleanup)
+        self.journal = Path(journal.name)
+
+    def reading(self, minute, temperature=21.5):
+        return {
+            "greenhouse": self.green_house.id, "date": timezone.make_aware(datetime(2023, 10, 17, 12, minute)),
+            "temperature": temperature, "air_humidity": 60, "light_level": 100, "par": 400, "co2_level": 500,
+            "soil_moisture_level": 40, "soil_salinity": 1.5, "soil_temperature": 20,
+            "weight_of_soil_and_plants": 1000.25, "stem_micro_variability": 0.2,
+        }
+
+    def test_flush_every_size_readings(self):
+        buffer = WriteBehindBuffer(size=3, interval=60)
+        self.addCleanup(buffer.close)
+
+        for minute in range(2):
+            environment, error = buffer.append(self.reading(minute))
+            self.assertIsNone(error)
+            self.assertIsNone(environment.id)
+        self.assertEqual(Environment.objects.count(), 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            buffer.append(self.reading(2))
+        self.assertEqual(Environment.objects.count(), 3)
+        self.assertEqual(len(buffer), 0)
+        # One statement each for the readings, their rollups and the current environment.
+        self.assertEqual(sum(query["sql"].startswith("INSERT") for query in queries), 3)
+        self.assertEqual(CurrentEnvironment.objects.get().date, self.reading(2)["date"])
+
+    def test_failed_flush_is_retried(self):
+        buffer = WriteBehindBuffer(size=2, interval=60, journal=self.journal)
+        self.addCleanup(buffer.close)
+
+        def unavailable(execute, sql, params, many, context):
+            if sql.startswith("INSERT"):
+                raise OperationalError("server closed the connection unexpectedly")
+            return execute(sql, params, many, context)
+
+        buffer.append(self.reading(0))
+        with connection.execute_wrapper(unavailable), self.assertLogs("greenhouse_management.buffer", "ERROR"):
+            environment, error = buffer.append(self.reading(1))
+        self.assertIsNone(error)
+        self.assertEqual(environment.date, self.reading(1)["date"])
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(len(buffer.journal.read_text().splitlines()), 2)
+        self.assertIsNotNone(buffer._timer)
+
+        self.assertEqual(buffer.flush()["created"], 2)
+        self.assertEqual(Environment.objects.count(), 2)
+
+    def test_failed_flush_is_left_to_the_timer(self):
+        buffer = WriteBehindBuffer(size=2, interval=60, limit=3)
+        self.addCleanup(buffer.close)
+
+        def unavailable(execute, sql, params, many, context):
+            if sql.startswith("INSERT"):
+                raise OperationalError("server closed the connection unexpectedly")
+            return execute(sql, params, many, context)
+
+        buffer.append(self.reading(0))
+        with connection.execute_wrapper(unavailable):
+            with self.assertLogs("greenhouse_management.buffer", "ERROR"):
+                buffer.append(self.reading(1))
+            with CaptureQueriesContext(connection) as queries:
+                self.assertIsNone(buffer.append(self.reading(2))[1])
+            self.assertFalse(any(query["sql"].startswith("INSERT") for query in queries))
+            self.assertEqual(buffer.append(self.reading(3)), (None, BUFFER_FULL))
+        self.assertEqual(len(buffer), 3)
+
+        self.assertEqual(buffer.flush()["created"], 3)
+        buffer.append(self.reading(3))
+        buffer.append(self.reading(4))
+        self.assertEqual(len(buffer), 0)
+
+    def test_readings_refused_at_flush_are_logged(self):
+        buffer = WriteBehindBuffer(size=3, interval=60)
+        self.addCleanup(buffer.close)
+
+        buffer.append(self.reading(0))
+        buffer.append(self.reading(1))
+        ingest_environments([self.reading(1, temperature=30)])
+        with self.assertLogs("greenhouse_management.buffer", "WARNING") as logs:
+            self.assertEqual(buffer.flush()["failed"], 1)
+        self.assertIn("1 buffered readings could not be stored", logs.output[0])
+        self.assertIn(CONFLICTING_READING, logs.output[0])
+
+    def test_invalid_readings_are_not_buffered(self):
+        buffer = WriteBehindBuffer(size=3, interval=60)
+        self.addCleanup(buffer.close)
+
+        self.assertEqual(buffer.append({**self.reading(0), "greenhouse": 0})[1],
+                         "Greenhouse with this credentials does not exist.")
+        self.assertIn("temperature", buffer.append(self.reading(0, temperature="hot"))[1])
+        self.assertEqual(len(buffer), 0)
+
+    def test_journal_is_replayed(self):
+        crashed = WriteBehindBuffer(size=10, interval=60, journal=self.journal)
+        crashed.append(self.reading(0))
+        crashed.append(self.reading(1, temperature=22.25))
+        crashed._timer.cancel()
+        crashed._file.close()
+        # Left by a crashed process with another pid.
+        crashed.journal.rename(self.journal / "1.ndjson")
+
+        buffer = WriteBehindBuffer(size=10, interval=60, journal=self.journal)
+        self.addCleanup(buffer.close)
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual([path.name for path in self.journal.glob("*.ndjson")], [buffer.journal.name])
+        self.assertEqual(buffer.flush()["created"], 2)
+        self.assertEqual(Environment.objects.get(date=self.reading(1)["date"]).temperature, Decimal("22.25"))
+        self.assertEqual(buffer.journal.read_text(), "")
+
+        buffer.append(self.reading(2))
+        buffer._file.close()
+        replayed = WriteBehindBuffer(size=10, interval=60, journal=self.journal)
+        self.addCleanup(replayed.close)
+        self.assertEqual(len(replayed), 1)
+
+    def test_journals_of_running_processes_are_kept(self):
+        running = self.journal / "1.ndjson"
+        with open(running, "w") as journal:
+            fcntl.flock(journal, fcntl.LOCK_EX)
+            journal.write(json.dumps(self.reading(0), cls=DjangoJSONEncoder) + "\n")
+            journal.flush()
+
+            buffer = WriteBehindBuffer(size=10, interval=60, journal=self.journal)
+            self.addCleanup(buffer.close)
+            buffer.append(self.reading(1))
+            buffer.flush()
+            self.assertEqual(len(running.read_text().splitlines()), 1)
+            buffer.close()
+
+        other = WriteBehindBuffer(size=10, interval=60, journal=self.journal)
+        self.addCleanup(other.close)
+        self.assertEqual(len(other), 1)
+        self.assertFalse(running.exists())
+
+
+class MessageIngestTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user(email="owner@user.com", password="foo")
+        location = Location.objects.create(name="Bialystok", coordinates=(42.12345, -71.98765), owner=owner)
+        self.green_house = GreenHouse.objects.create(name="Green house", location=location, owner=owner)
+        self.device = Device.objects.create(name="Sensor", greenhouse=self.green_house)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "messages.txt"
+
+    def payload(self, minute, temperature=21.5):
+        return json.dumps({
+            "date": f"2023-10-17T12:{minute:02}:00+00:00", "temperature": temperature, "air_humidity": 60,
+            "light_level": 100, "par": 400, "co2_level": 500, "soil_moisture_level": 40, "soil_salinity": 1.5,
+            "soil_temperature": 20, "weight_of_soil_and_plants": 1000.25, "stem_micro_variability": 0.2,
+        })
+
+    def test_file_source(self):
+        self.path.write_text("\n".join([
+            f"greenhouses/{self.green_house.id}/environment {self.payload(0)}",
+            f"site/devices/{self.device.id}/environment [{self.payload(1)}, {self.payload(2)}]",
+            f"greenhouses/{self.green_house.id}/environment {self.payload(0)}",
+            f"greenhouses/0/environment {self.payload(3)}",
+            f"greenhouses/{self.green_house.id}/status {self.payload(3)}",
+            f"devices/{self.device.id}/environment not json",
+            f"devices/{self.device.id}/environment {self.payload(4, temperature='hot')}",
+        ]))
+
+        with CaptureQueriesContext(connection) as queries:
+            summary = MessageIngestWorker(FileSource(self.path), batch_size=2).run()
+        self.assertEqual(summary, {
+            "messages": 7, "unroutable": 2, "invalid": 1, "created": 3, "duplicates": 1, "failed": 1,
+        })
+        self.assertEqual(Environment.objects.filter(green_house=self.green_house).count(), 3)
+        # Topics are looked up once.
+        self.assertEqual(sum("greenhouse_management_device" in query["sql"] for query in queries), 1)
+
+    def test_bad_messages_do_not_stop_the_worker(self):
+        class Resolver(TopicResolver):
+            def resolve(self, topic):
+                if topic.startswith("broken/"):
+                    raise RuntimeError("Lookup failed.")
+                return super().resolve(topic)
+
+        self.path.write_bytes(b"\n".join([
+            f"greenhouses/{self.green_house.id}/environment {self.payload(0)}".encode(),
+            b"\xff/environment " + self.payload(1).encode(),
+            f"broken/greenhouses/{self.green_house.id}/environment {self.payload(2)}".encode(),
+            f"greenhouses/{self.green_house.id}/environment ".encode() + b"base64:"
+            + base64.b64encode(encode_readings(0, [2 ** 62], [[1]] * len(Environment.METRICS))),
+            f"greenhouses/{self.green_house.id}/environment {json.dumps({'date': 5})}".encode(),
+            f"greenhouses/{self.green_house.id}/environment {self.payload(3)}".encode(),
+        ]))
+
+        with self.assertLogs("greenhouse_management.messaging", "ERROR"):
+            summary = MessageIngestWorker(FileSource(self.path), resolver=Resolver()).run()
+        self.assertEqual(summary, {
+            "messages": 6, "unroutable": 1, "invalid": 2, "created": 2, "duplicates": 0, "failed": 1,
+        })
+        self.assertEqual(Environment.objects.count(), 2)
+
+    def test_messages_are_acknowledged_once_stored(self):
+        acknowledged = []
+        topic = f"greenhouses/{self.green_house.id}/environment"
+        payloads = ["not json", self.payload(0), self.payload(1)]
+
+        class Source:
+            def run(self, put):
+                for payload in payloads:
+                    put(Message(topic, payload.encode(), time.time(),
+                                lambda: acknowledged.append(Environment.objects.count())))
+
+            def stop(self):
+                pass
+
+        MessageIngestWorker(Source(), batch_size=2).run()
+        self.assertEqual(acknowledged, [0, 2, 2])
+
+    def test_batches_are_retried_until_stored(self):
+        acknowledged = []
+        topic = f"greenhouses/{self.green_house.id}/environment"
+        payloads = [self.payload(0), self.payload(1)]
+
+        class Source:
+            def run(self, put):
+                for payload in payloads:
+                    put(Message(topic, payload.encode(), time.time(),
+                                lambda: acknowledged.append(Environment.objects.count())))
+
+            def stop(self):
+                pass
+
+        class Worker(MessageIngestWorker):
+            failures = 1
+
+            def flush(self, batch, received):
+                if self.failures:
+                    self.failures -= 1
+                    raise OperationalError("server closed the connection unexpectedly")
+                super().flush(batch, received)
+
+        with self.assertLogs("greenhouse_management.messaging", "ERROR"):
+            summary = Worker(Source(), batch_size=2, retry_delay=0.01).run()
+        self.assertEqual(summary["created"], 2)
+        self.assertEqual(acknowledged, [2, 2])
+
+    def test_unstored_messages_are_not_acknowledged(self):
+        acknowledged = []
+        topic = f"greenhouses/{self.green_house.id}/environment"
+
+        class Source:
+            def run(self, put):
+                put(Message(topic, self.payload.encode(), time.time(), lambda: acknowledged.append(1)))
+
+            def stop(self):
+                pass
+
+        class Worker(MessageIngestWorker):
+            def flush(self, batch, received):
+                # The database stays down until the worker is stopped.
+                self.stop()
+                raise OperationalError("server closed the connection unexpectedly")
+
+        source = Source()
+        source.payload = self.payload(0)
+        with self.assertLogs("greenhouse_management.messaging", "ERROR"):
+            Worker(source, batch_size=1).run()
+        self.assertEqual(acknowledged, [])
+        self.assertFalse(Environment.objects.exists())
+
+    def test_binary_payload(self):
+        block = encode_readings(0, [1697544000000, 1697544010000], [[2000, 2001]] * len(Environment.METRICS))
+        self.path.write_bytes(f"devices/{self.device.id}/environment base64:".encode()
+                              + base64.b64encode(block) + b"\n")
+
+        self.assertEqual(MessageIngestWorker(FileSource(self.path)).run()["created"], 2)
+        self.assertEqual(Environment.objects.filter(green_house=self.green_house, temperature=Decimal("20.01")).count(), 1)
+
+    def test_socket_source(self):
+        source = SocketSource("localhost", 0)
+        worker = MessageIngestWorker(source, max_delay=0.01)
+
+        def gateway():
+            with socket.create_connection(source.address) as client:
+                client.sendall(f"greenhouses/{self.green_house.id}/environment {self.payload(0)}\n".encode())
+            while not worker.summary["messages"]:
+                time.sleep(0.01)
+            worker.stop()
+
+        threading.Thread(target=gateway).start()
+        self.assertEqual(worker.run()["created"], 1)
+
+    def test_command(self):
+        self.path.write_text(f"devices/{self.device.id}/environment {self.payload(0)}\n")
+        out = StringIO()
+        call_command("ingest_messages", f"file:{self.path}", stdout=out)
+        self.assertIn("created 1", out.getvalue())
+        self.assertEqual(Environment.objects.count(), 1)
+
+
+class ImportEnvironmentCommandTestCase(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user(email="owner@user.com", password="foo")
+        location = Location.objects.create(name="Bialystok", coordinates=(42.12345, -71.98765), owner=owner)
+        self.green_house = GreenHouse.objects.create(name="Green house", location=location, owner=owner)
+        self.other = GreenHouse.objects.create(name="Other", location=location, owner=owner)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "history.csv.gz"
+
+        header = ["greenhouse", "date", *Environment.METRICS]
+        rows = [
+            [greenhouse, f"2023-10-17T{hour:02}:00:00", f"{20 + hour / 4:.2f}", "60", "100", "400", "500", "40",
+             "1.5", "20", "1000.25", "0.2"]
+            for hour in range(6) for greenhouse in ("Green house", str(self.other.id))
+        ]
+        rows += [["Unknown", *rows[0][1:]], ["Other", "yesterday", *rows[0][2:]]]
+        with gzip.open(self.path, "wt", newline="") as file:
+            csv.writer(file).writerows([header, *rows])
+
+    def test_import(self):
+        out, err = StringIO(), StringIO()
+        call_command("import_environment", str(self.path), "--chunk-size", "5", "--timezone", "Europe/Warsaw",
+                     stdout=out, stderr=err)
+
+        self.assertIn("14 rows", out.getvalue())
+        self.assertIn("created 12, duplicates 0, failed 2", out.getvalue())
+        self.assertIn("row 13: Greenhouse with this credentials does not exist.", err.getvalue())
+        self.assertEqual(Environment.objects.filter(green_house=self.other).count(), 6)
+        environment = Environment.objects.get(green_house=self.green_house, temperature=Decimal("21.25"))
+        self.assertEqual(environment.date, datetime(2023, 10, 17, 3, tzinfo=timezone.get_fixed_timezone(0)))
+        # Local midnight and 1 a.m. are on the previous UTC day.
+        days = EnvironmentRollup.objects.filter(green_house=self.green_house, resolution="day", metric="temperature")
+        self.assertEqual(list(days.order_by("bucket").values_list("count", flat=True)), [2, 4])
+        self.assertFalse(Path(f"{self.path}.checkpoint").exists())
+
+    def test_resume(self):
+        Checkpoint(f"{self.path}.checkpoint", self.path).commit(1, 10)
+
+        out = StringIO()
+        call_command("import_environment", str(self.path), "--chunk-size", "5", stdout=out, stderr=StringIO())
+        self.assertIn("resuming after row 10", out.getvalue())
+        self.assertEqual(Environment.objects.count(), 2)
+
+    def test_missing_greenhouse(self):
+        with open(self.path.with_suffix(""), "w", newline="") as file:
+            csv.writer(file).writerows([
+                ["date", *Environment.METRICS],
+                ["2023-10-17T12:00:00Z", "20", "60", "100", "400", "500", "40", "1.5", "20", "1000.25", "0.2"],
+            ])
+        with self.assertRaises(CommandError):
+            call_command("import_environment", str(self.path.with_suffix("")))
+        call_command("import_environment", str(self.path.with_suffix("")), "--greenhouse", "Green house",
+                     stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Environment.objects.get().green_house, self.green_house)
+
+    def test_out_of_range_date(self):
+        with open(self.path.with_suffix(""), "w", newline="") as file:
+            csv.writer(file).writerows([
+                ["greenhouse", "date", *Environment.METRICS],
+                ["Other", "2024-13-01T00:00:00", "20", "60", "100", "400", "500", "40", "1.5", "20", "1000.25", "0.2"],
+                ["Other", "2024-12-01T00:00:00", "20", "60", "100", "400", "500", "40", "1.5", "20", "1000.25", "0.2"],
+            ])
+        out, err = StringIO(), StringIO()
+        call_command("import_environment", str(self.path.with_suffix("")), stdout=out, stderr=err)
+        self.assertIn("created 1, duplicates 0, failed 1", out.getvalue())
+        self.assertIn("row 1: date: ", err.getvalue())
+        self.assertEqual(Environment.objects.get().date, datetime(2024, 12, 1, tzinfo=timezone.get_fixed_timezone(0)))
+
+    def test_invalid_utf8(self):
+        row = b"Other,2024-12-01T00:00:00,20,60,100,400,500,40,1.5,20,1000.25,0.2"
+        self.path.with_suffix("").write_bytes(b"\n".join([
+            ",".join(["greenhouse", "date", *Environment.METRICS]).encode(),
+            row.replace(b"20", b"\xff20", 1),
+            row.replace(b"Other", b"Oth\xffer"),
+            row,
+        ]))
+        out, err = StringIO(), StringIO()
+        call_command("import_environment", str(self.path.with_suffix("")), stdout=out, stderr=err)
+        self.assertIn("created 1, duplicates 0, failed 2", out.getvalue())
+        self.assertIn("row 1: Invalid UTF-8", err.getvalue())
+        self.assertIn("row 2: Invalid UTF-8", err.getvalue())
+        self.assertEqual(Environment.objects.get().green_house, self.other)
+
+    def test_greenhouse_resolver(self):
+        resolver = GreenHouseResolver()
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                resolver.resolve([str(self.other.id), f"00{self.other.id}", "Green house", "²", "Unknown"]),
+                [self.other.id, self.other.id, self.green_house.id, None, None],
+            )
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.resolve(["Green house"]), [self.green_house.id])
+
+    def test_checkpoint_out_of_order_chunks(self):
+        checkpoint = Checkpoint(f"{self.path}.checkpoint", self.path)
+        checkpoint.commit(6, 5)
+        checkpoint.commit(11, 4)
+        self.assertEqual(checkpoint.rows, 0)
+        self.assertFalse(Path(checkpoint.path).exists())
+
+        checkpoint.commit(1, 5)
+        self.assertEqual(checkpoint.rows, 14)
+        self.assertEqual(Checkpoint(checkpoint.path, self.path).rows, 14)
+        # A checkpoint of another version of the file is ignored.
+        self.path.write_bytes(b"")
+        self.assertEqual(Checkpoint(checkpoint.path, self.path).rows, 0)
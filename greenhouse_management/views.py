@@ -1,3 +1,191 @@
-from django.shortcuts import render
+import shutil
+import uuid
 
-# Create your views here.
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from graphql_jwt.exceptions import JSONWebTokenError
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from greenhouse_management import jobs, metrics
+from greenhouse_management.archive import archived_rows
+from greenhouse_management.export import export_environments_csv, gzip_chunks, visible_green_houses
+from greenhouse_management.ingest import READING_FORMATS, ingest_stream
+from greenhouse_management.models import Environment, GreenHouse, Job
+from greenhouse_management.series import environment_series, pack_series
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/json")
+CSV_CONTENT_TYPES = ("text/csv",)
+BINARY_CONTENT_TYPES = ("application/x-greenhouse-readings",)
+
+
+@csrf_exempt
+@require_POST
+def environment_ingest(request):
+    """
+    Ingest environment readings from a NDJSON, CSV or binary (codec.encode_readings() blocks) request body.
+
+    The body is read line by line and stored in batches of INGEST_BATCH_SIZE readings,
+    so memory use does not depend on the size of the upload.
+    With 'background=1' the body is only saved and an import job queued, answered with 202 and the job id.
+    Background imports need an authenticated user and bodies of at most INGEST_BACKGROUND_MAX_SIZE bytes.
+    """
+    if request.content_type in NDJSON_CONTENT_TYPES:
+        format = "ndjson"
+    elif request.content_type in CSV_CONTENT_TYPES:
+        format = "csv"
+    elif request.content_type in BINARY_CONTENT_TYPES:
+        format = "binary"
+    else:
+        return JsonResponse({"error": f"Unsupported content type '{request.content_type}'."}, status=415)
+
+    if request.GET.get("background") in ("1", "true"):
+        user = _request_user(request)
+        if user is None:
+            return JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+        # Django reads no more of the body than its Content-Length, none without a valid one.
+        length = request.META.get("CONTENT_LENGTH", "")
+        if length.isascii() and length.isdigit() and int(length) > settings.INGEST_BACKGROUND_MAX_SIZE:
+            return JsonResponse(
+                {"error": f"Request body is larger than {settings.INGEST_BACKGROUND_MAX_SIZE} bytes."}, status=413
+            )
+
+        path = settings.JOBS_ROOT / f"import-{uuid.uuid4().hex}.{format}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as file:
+            shutil.copyfileobj(request, file)
+        job = jobs.enqueue(Job.Kinds.IMPORT, {"path": str(path), "format": format, "delete": True}, user)
+        return JsonResponse({"job": job.pk}, status=202)
+
+    return JsonResponse(ingest_stream(READING_FORMATS[format](request)))
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus scrape endpoint."""
+    return HttpResponse(metrics.exposition(), content_type=CONTENT_TYPE_LATEST)
+
+
+def _request_user(request):
+    """The session user, or the user of the 'Authorization: JWT <token>' header."""
+    if request.user.is_authenticated:
+        return request.user
+    try:
+        return authenticate(request=request)
+    except JSONWebTokenError:
+        return None
+
+
+def _date_range(request):
+    """The optional 'from' and 'to' query parameters as datetimes."""
+    bounds = []
+    for bound in ("from", "to"):
+        value = request.GET.get(bound)
+        try:
+            date = parse_datetime(value) if value else None
+        except ValueError:
+            # Well formed, but not a date, e.g. the 45th of the 13th month.
+            date = None
+        if value and date is None:
+            raise ValueError(f"'{bound}' is not a valid ISO 8601 date.")
+        bounds.append(date)
+    return bounds
+
+
+@require_GET
+def environment_series_view(request):
+    """
+    Readings of a greenhouse as parallel arrays, see environment_series().
+
+    Query parameters: 'greenhouse', optional 'from' and 'to' (ISO 8601), 'metrics' (comma separated, all by default)
+    and 'format', 'json' or 'binary' (little-endian int64 timestamps followed by float32 values per metric).
+    """
+    user = _request_user(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+
+    try:
+        green_house = GreenHouse.objects.get(pk=int(request.GET.get("greenhouse", "")))
+    except (ValueError, GreenHouse.DoesNotExist):
+        return JsonResponse({"error": "Greenhouse with this credentials does not exist."}, status=404)
+    if not (user.is_superuser or user == green_house.owner
+            or green_house.authorized_users.filter(id=user.id).exists()):
+        return JsonResponse({"error": "You do not have the required permissions to perform this action"}, status=403)
+
+    try:
+        start, end = _date_range(request)
+    except ValueError as error:
+        return JsonResponse({"error": str(error)}, status=400)
+
+    metrics = request.GET.get("metrics")
+    metrics = metrics.split(",") if metrics else Environment.METRICS
+    unknown = [metric for metric in metrics if metric not in Environment.METRICS]
+    if unknown:
+        return JsonResponse({"error": f"Unknown metrics: {', '.join(unknown)}."}, status=400)
+
+    series = environment_series(green_house, start, end, metrics)
+    if request.GET.get("format", "json") == "binary":
+        response = HttpResponse(pack_series(series), content_type="application/octet-stream")
+        response["X-Series-Count"] = len(series["timestamps"])
+        response["X-Series-Metrics"] = ",".join(metrics)
+        return response
+    return JsonResponse({"count": len(series["timestamps"]), **series})
+
+
+@require_GET
+def environment_export(request):
+    """
+    Stream environment readings as CSV, gzip compressed with 'gzip=1'.
+
+    Query parameters: optional 'greenhouse' (all greenhouses of the user by default), 'from' and 'to' (ISO 8601).
+    """
+    user = _request_user(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+
+    environments = Environment.objects.visible_to(user)
+    green_house_id = None
+    if request.GET.get("greenhouse"):
+        try:
+            green_house_id = GreenHouse.objects.get(pk=int(request.GET["greenhouse"])).pk
+        except (ValueError, GreenHouse.DoesNotExist):
+            return JsonResponse({"error": "Greenhouse with this credentials does not exist."}, status=404)
+        environments = environments.filter(green_house=green_house_id)
+
+    try:
+        start, end = _date_range(request)
+    except ValueError as error:
+        return JsonResponse({"error": str(error)}, status=400)
+
+    chunks = export_environments_csv(
+        environments.in_range(start=start, end=end),
+        archived_rows(visible_green_houses(user, green_house_id), start, end),
+    )
+    if request.GET.get("gzip") in ("1", "true"):
+        response = StreamingHttpResponse(gzip_chunks(chunks), content_type="application/gzip")
+        response["Content-Disposition"] = 'attachment; filename="environments.csv.gz"'
+    else:
+        response = StreamingHttpResponse(chunks, content_type="text/csv")
+        response["Content-Disposition"] = 'attachment; filename="environments.csv"'
+    return response
+
+
+@require_GET
+def job_file(request, id):
+    """Download the file written by a succeeded export job, for the user who created it."""
+    user = _request_user(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+    try:
+        job = Job.objects.get(pk=id, kind=Job.Kinds.EXPORT, status=Job.Statuses.SUCCEEDED)
+    except Job.DoesNotExist:
+        return JsonResponse({"error": "Job with this credentials does not exist."}, status=404)
+    if not (user.is_superuser or user == job.created_by):
+        return JsonResponse({"error": "You do not have the required permissions to perform this action"}, status=403)
+
+    path = jobs.export_path(job)
+    content_type = "application/gzip" if job.params.get("gzip") else "text/csv"
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=path.name, content_type=content_type)
@@ -3,13 +3,15 @@ from greenhouse_management.graphql.User import *
 from greenhouse_management.graphql.Device import *
 from greenhouse_management.graphql.Enviroment import *
 from greenhouse_management.graphql.GreenHouse import *
+from greenhouse_management.graphql.Stats import *
+from greenhouse_management.graphql.Job import *
 
 
-class Mutation(UserMutation, LocationMutation, DeviceMutation, GreenHouseMutation, EnvironmentMutation, graphene.ObjectType):
+class Mutation(UserMutation, LocationMutation, DeviceMutation, GreenHouseMutation, EnvironmentMutation, JobMutation, graphene.ObjectType):
     pass
 
 
-class Query(UserQuery, LocationQuery, DeviceQuery, EnvironmentQuery, GreenHouseQuery, graphene.ObjectType):
+class Query(UserQuery, LocationQuery, DeviceQuery, EnvironmentQuery, GreenHouseQuery, StatsQuery, JobQuery, graphene.ObjectType):
     pass
 
 